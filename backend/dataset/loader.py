@@ -7,6 +7,7 @@ Inclui funções utilitárias de normalização de texto.
 
 import os
 import re
+import hashlib
 import unicodedata
 import pandas as pd
 from backend.utils.preprocessing import normalize_text
@@ -69,6 +70,23 @@ def load_raw_receipts(path: str = RAW_RECEIPTS) -> pd.DataFrame:
     return df
 
 
+def iter_raw_receipts(path: str = RAW_RECEIPTS, chunksize: int = 500_000, usecols: list[str] = None):
+    """
+    Lê as notas fiscais (raw) em blocos de `chunksize` linhas, sem carregar o arquivo inteiro.
+    `usecols` restringe as colunas lidas (nomes em maiúsculas). Todas as colunas são lidas como texto.
+    """
+    if not os.path.exists(path) or os.stat(path).st_size == 0:
+        return
+    wanted = set(usecols) if usecols else None
+    reader = pd.read_csv(
+        path, dtype=str, chunksize=chunksize,
+        usecols=(lambda c: c.strip().upper() in wanted) if wanted else None,
+    )
+    for chunk in reader:
+        chunk.columns = [c.strip().upper() for c in chunk.columns]
+        yield chunk
+
+
 def save_raw_receipts(df: pd.DataFrame, path: str = RAW_RECEIPTS):
     """
     Salva notas fiscais (raw).
@@ -288,3 +306,16 @@ def save_ratings(df: pd.DataFrame):
 
     df.to_csv(RATINGS, index=False, columns=cols)
 
+
+def ratings_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Calcula uma impressão digital (hash) do conteúdo das avaliações.
+    Usada para versionar modelos, artefatos e caches de avaliação.
+    """
+    keys = df[["CPF_CLIENTE", "ID_PRODUTO"]].astype(str)
+    ratings = pd.to_numeric(df["RATING_DESCRICAO"], errors="coerce")
+
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(keys, index=False).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(ratings, index=False).values.tobytes())
+    return digest.hexdigest()[:16]
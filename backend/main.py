@@ -1,30 +1,164 @@
+import os
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
 from backend.dataset import loader
 from backend.recommender.collaborative import CollaborativeFilteringRecommender
+from backend.recommender.engines import get_engine
+from backend.recommender.hybrid import HybridRecommender
+from backend.recommender.cooccurrence import BoughtTogetherIndex
+from backend.recommender.minhash import MinHashLSHIndex
+from backend.recommender.jobs import EvaluationJobService
+from backend.recommender.report_cache import AccuracyReportCache
+from backend.recommender.registry import ModelRegistry, BackgroundRetrainer
+from backend.utils import monitoring
 import pandas as pd
 
 # --- Carregamento e Preparação do Modelo ---
-recommender_instance = None
+# O modelo ativo fica no registro e é trocado atomicamente a cada re-treino
+registry = ModelRegistry()
+
+# Tamanho da tabela de recomendações pré-calculadas (0 desativa a etapa em lote)
+TOP_N_TABLE_SIZE = int(os.getenv("RECOMMENDER_TOP_N_TABLE", "10"))
+
+# Motor colaborativo usado pela API: "svdpp" (Surprise), "als" (NumPy) ou "bpr" (compras implícitas)
+ENGINE = get_engine(os.getenv("RECOMMENDER_ENGINE", "svdpp"))
+
+# "collaborative" serve o motor puro; "hybrid" re-ranqueia candidatos do motor, do conteúdo e da popularidade
+MODEL_KIND = os.getenv("RECOMMENDER_MODEL", "collaborative")
+if MODEL_KIND not in ("collaborative", "hybrid"):
+    raise ValueError(f"Modelo inválido: {MODEL_KIND}. Use 'collaborative' ou 'hybrid'.")
+# Pesos da mistura híbrida, ex.: "latent=1,content=0.6,popularity=0.3" (ausentes = padrão)
+HYBRID_WEIGHTS = {name: float(value) for name, value in
+                  (pair.split("=") for pair in os.getenv("RECOMMENDER_HYBRID_WEIGHTS", "").split(",") if pair)}
+
+# Intervalo (segundos) entre verificações de mudanças em ratings.csv (0 desativa o re-treino automático)
+RETRAIN_INTERVAL = float(os.getenv("RECOMMENDER_RETRAIN_INTERVAL", "30"))
+
+# Mudanças pequenas são aplicadas incrementalmente; o re-treino completo acontece após este intervalo (segundos)
+# ou quando a fração de avaliações alteradas passa do limite
+FULL_RETRAIN_INTERVAL = float(os.getenv("RECOMMENDER_FULL_RETRAIN_INTERVAL", "3600"))
+MAX_INCREMENTAL_FRACTION = float(os.getenv("RECOMMENDER_MAX_INCREMENTAL_FRACTION", "0.1"))
+
+# Relatórios concluídos ficam num cache persistente (LRU) por cliente e versão do modelo (0 desativa)
+ACCURACY_CACHE_SIZE = int(os.getenv("RECOMMENDER_ACCURACY_CACHE_SIZE", "1000"))
+
+# Pool limitado de workers para as avaliações de acurácia (fora do caminho da recomendação)
+evaluation_service = EvaluationJobService(
+    max_workers=int(os.getenv("RECOMMENDER_EVAL_WORKERS", "2")),
+    cache=AccuracyReportCache(max_entries=ACCURACY_CACHE_SIZE) if ACCURACY_CACHE_SIZE > 0 else None,
+)
+
+# Índice "comprados juntos" das notas fiscais: parceiros guardados por produto (0 desativa)
+BOUGHT_TOGETHER_TOP_K = int(os.getenv("RECOMMENDER_BOUGHT_TOGETHER_K", "20"))
+bought_together = None # carregado (ou construído) na inicialização
+
+# Clientes parecidos (MinHash + LSH sobre os itens avaliados), sincronizado com o índice do modelo ativo
+client_similarity = MinHashLSHIndex()
+
+# Método padrão de avaliação: "retrain" (exato) ou "fold_in" (re-estima só o usuário)
+DEFAULT_EVAL_METHOD = os.getenv("RECOMMENDER_EVAL_METHOD", "retrain")
+EVAL_METHODS = (HybridRecommender if MODEL_KIND == "hybrid" else ENGINE).EVALUATION_METHODS
+if DEFAULT_EVAL_METHOD not in EVAL_METHODS:
+    raise ValueError(f"O modelo configurado só é avaliado por {EVAL_METHODS}: "
+                     f"ajuste RECOMMENDER_EVAL_METHOD (atual: {DEFAULT_EVAL_METHOD}).")
+
+# --- Métricas do serviço (expostas em /metrics) ---
+REQUEST_COUNT = monitoring.REGISTRY.counter("recommender_http_requests", "Total de requisições HTTP.", ["method", "path", "status"])
+ERROR_COUNT = monitoring.REGISTRY.counter("recommender_http_errors", "Total de requisições com erro (status >= 500).", ["method", "path"])
+REQUEST_LATENCY = monitoring.REGISTRY.histogram("recommender_http_request_duration_seconds", "Latência das requisições HTTP.", ["method", "path"])
+MODEL_INFO = monitoring.REGISTRY.gauge("recommender_model_info", "Versão e engine do modelo ativo (valor sempre 1).", ["version", "engine"])
+MODEL_USERS = monitoring.REGISTRY.gauge("recommender_model_users", "Número de usuários (CPFs) conhecidos pelo modelo ativo.")
+MODEL_ITEMS = monitoring.REGISTRY.gauge("recommender_model_items", "Número de itens conhecidos pelo modelo ativo.")
+MODEL_RATINGS = monitoring.REGISTRY.gauge("recommender_model_ratings", "Número de avaliações usadas no treino do modelo ativo.")
+RATINGS_FILE_AGE = monitoring.REGISTRY.gauge("recommender_ratings_file_age_seconds", "Tempo desde a última modificação de ratings.csv.")
+
+def _refresh_model_gauges():
+    """Atualiza os gauges do modelo ativo no momento da coleta."""
+    status = registry.status()
+    MODEL_INFO.clear()
+    if status.get("model_version"):
+        MODEL_INFO.set(1, version=status["model_version"], engine=status.get("engine", ""))
+    MODEL_USERS.set(status.get("n_users", 0))
+    MODEL_ITEMS.set(status.get("n_items", 0))
+    MODEL_RATINGS.set(status.get("n_ratings", 0))
+    if os.path.exists(loader.RATINGS):
+        RATINGS_FILE_AGE.set(time.time() - os.path.getmtime(loader.RATINGS))
+
+def _check_eval_method(method: str, recommender):
+    methods = recommender.EVALUATION_METHODS # o híbrido e o BPR só aceitam "retrain"
+    if method not in methods:
+        raise HTTPException(status_code=400, detail=f"Método de avaliação inválido: {method}. Use um de {list(methods)}.")
+
+def build_recommender(ratings_df: pd.DataFrame) -> CollaborativeFilteringRecommender:
+    """Cria um recomendador configurado (ainda não treinado) para os dados informados."""
+    if MODEL_KIND == "hybrid":
+        recommender = HybridRecommender(ratings_df, engine=ENGINE, weights=HYBRID_WEIGHTS)
+    else:
+        recommender = ENGINE(ratings_df)
+    recommender.top_n_size = TOP_N_TABLE_SIZE # Etapa em lote após o treino
+    return recommender
+
+retrainer = BackgroundRetrainer(registry, build_recommender, interval=RETRAIN_INTERVAL,
+                                full_retrain_interval=FULL_RETRAIN_INTERVAL,
+                                max_incremental_fraction=MAX_INCREMENTAL_FRACTION)
+
+def get_recommender():
+    """Retorna o modelo ativo (referência estável durante a requisição) ou 503 se indisponível."""
+    recommender = registry.current
+    if recommender is None:
+        raise HTTPException(status_code=503, detail="Serviço de recomendação indisponível (sem dados).")
+    return recommender
+
+def get_bought_together() -> BoughtTogetherIndex:
+    """Retorna o índice "comprados juntos" ou 503 se ele não foi carregado."""
+    if bought_together is None:
+        raise HTTPException(status_code=503, detail="Índice 'comprados juntos' indisponível.")
+    return bought_together
+
+def load_bought_together():
+    """
+    Carrega o índice salvo ou o constrói a partir das notas fiscais quando o catálogo ou as
+    notas mudaram. Também roda a cada verificação do re-treino em segundo plano; se a impressão
+    digital não mudou, o índice ativo é mantido.
+    """
+    global bought_together
+    index = BoughtTogetherIndex(params={'top_k': BOUGHT_TOGETHER_TOP_K})
+    if bought_together is not None and index.fingerprint == bought_together.fingerprint:
+        return
+    index.load_or_build()
+    bought_together = index
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Carrega os dados e inicializa o recomendador na inicialização da API."""
-    global recommender_instance
     print("🚀 Iniciando o serviço de recomendação...")
     try:
-        ratings_df = loader.load_ratings()
-        if not ratings_df.empty:
-            recommender_instance = CollaborativeFilteringRecommender(ratings_df)
-            recommender_instance.train() # Chama o treinamento explicitamente
-            print("✅ Serviço de recomendação iniciado e modelo treinado.")
+        # Usa o artefato salvo ou treina se os dados mudaram
+        if retrainer.refresh(force=True):
+            client_similarity.sync(registry.current.index, registry.current.data_version)
+            print("✅ Serviço de recomendação iniciado e modelo pronto.")
         else:
             print("⚠️ Aviso: Nenhum dado de avaliação encontrado. O serviço de recomendação está inativo.")
     except Exception as e:
         print(f"❌ Erro ao iniciar o serviço de recomendação: {e}")
-    
+
+    if BOUGHT_TOGETHER_TOP_K > 0:
+        try:
+            load_bought_together()
+        except Exception as e:
+            print(f"❌ Erro ao carregar o índice 'comprados juntos': {e}")
+        retrainer.pollers.append(load_bought_together)
+
+    # Re-treino em segundo plano quando ratings.csv mudar
+    retrainer.start()
+
     yield
     # Código para limpeza ao desligar a API (se necessário)
+    retrainer.stop()
+    evaluation_service.shutdown()
     print("🛑 Serviço de recomendação finalizado.")
 
 app = FastAPI(
@@ -34,25 +168,146 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Conta requisições/erros e mede a latência por rota (o template, não o CPF)."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        REQUEST_COUNT.inc(method=request.method, path=path, status=status)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method, path=path)
+        if status >= 500:
+            ERROR_COUNT.inc(method=request.method, path=path)
+
+class BatchRecommendationRequest(BaseModel):
+    cpfs: list[str]
+    n_items: int = 5
+
+@app.post("/recommend/batch", tags=["Recommendations"])
+def get_batch_recommendations(request: BatchRecommendationRequest):
+    """
+    Gera recomendações para vários clientes em uma única chamada (sem relatório de acurácia).
+    """
+    recommender = get_recommender()
+
+    try:
+        results = recommender.recommend_batch(request.cpfs, request.n_items)
+        return {
+            "n_items": request.n_items,
+            "results": [
+                {"cpf_cliente": cpf, "recommendations": recommendations}
+                for cpf, recommendations in results.items()
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro interno ao processar as recomendações em lote: {str(e)}")
+
 @app.get("/recommend/{cpf_cliente}", tags=["Recommendations"])
-def get_recommendations(cpf_cliente: str, n_items: int = 5):
+def get_recommendations(cpf_cliente: str, n_items: int = 5, include_accuracy: bool = False, method: str = DEFAULT_EVAL_METHOD):
     """
-    Gera recomendações de produtos para um cliente específico e avalia a acurácia.
+    Gera recomendações de produtos para um cliente específico.
+    Com `include_accuracy=true`, a avaliação de acurácia é enfileirada sem bloquear a resposta:
+    `accuracy` traz o estado do job (com o relatório, se já estiver pronto ou em cache); acompanhe por `GET /evaluate`.
     """
-    if recommender_instance is None:
-        raise HTTPException(status_code=503, detail="Serviço de recomendação indisponível (sem dados).")
+    recommender = get_recommender()
+    _check_eval_method(method, recommender)
 
     try:
         # Gera recomendações
-        recommended_ids = recommender_instance.recommend_items(cpf_cliente, n_items)
-        
-        # Avalia a acurácia
-        accuracy_report = recommender_instance.evaluate_accuracy(cpf_cliente)
+        recommended_ids = recommender.recommend_items(cpf_cliente, n_items)
 
-        return {
+        response = {
             "cpf_cliente": cpf_cliente,
             "recommendations": recommended_ids,
-            "accuracy_report": accuracy_report
         }
+
+        # Enfileira a avaliação sem esperar por ela (relatório reaproveitado do cache, se já existir)
+        if include_accuracy:
+            response["accuracy"] = evaluation_service.submit(recommender, cpf_cliente, method)
+
+        return response
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro interno ao processar a recomendação: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro interno ao processar a recomendação: {str(e)}")
+
+@app.get("/items/{item_id}/bought-together", tags=["Items"])
+def get_bought_together_items(item_id: str, n_items: int = 10):
+    """
+    Produtos mais comprados junto com o produto informado (mesma nota fiscal), pelo índice pré-calculado.
+    """
+    partners = get_bought_together().partners(item_id, n_items)
+    if partners is None:
+        raise HTTPException(status_code=404, detail=f"Produto não encontrado no catálogo: {item_id}.")
+    return {"item_id": item_id, "bought_together": partners}
+
+class BasketCompletionRequest(BaseModel):
+    items: list[str]
+    n_items: int = 5
+
+@app.post("/baskets/complete", tags=["Items"])
+def complete_basket(request: BasketCompletionRequest):
+    """
+    Sugere produtos para completar uma cesta parcial, somando as associações dos parceiros de cada item.
+    """
+    return {
+        "items": request.items,
+        "suggestions": get_bought_together().complete_basket(request.items, request.n_items),
+    }
+
+@app.get("/clients/{cpf_cliente}/similar", tags=["Clients"])
+def get_similar_clients(cpf_cliente: str, n_clients: int = 10):
+    """
+    Clientes com gostos mais parecidos (similaridade de Jaccard estimada entre os produtos avaliados),
+    buscados nos baldes LSH sem comparar com a base inteira.
+    """
+    recommender = get_recommender()
+    # Após um re-treino só os clientes alterados são recalculados
+    client_similarity.sync(recommender.index, recommender.data_version)
+
+    similar = client_similarity.similar(cpf_cliente, n_clients)
+    if similar is None:
+        raise HTTPException(status_code=404, detail=f"Cliente sem avaliações: {cpf_cliente}.")
+    return {"cpf_cliente": cpf_cliente, "similar_clients": similar}
+
+@app.post("/evaluate/{cpf_cliente}", status_code=202, tags=["Evaluation"])
+def queue_evaluation(cpf_cliente: str, method: str = DEFAULT_EVAL_METHOD):
+    """
+    Enfileira a avaliação de acurácia de um cliente. O resultado é consultado em `GET /evaluate/{cpf}`.
+    """
+    recommender = get_recommender()
+    _check_eval_method(method, recommender)
+
+    return evaluation_service.submit(recommender, cpf_cliente, method)
+
+@app.get("/evaluate/{cpf_cliente}", tags=["Evaluation"])
+def get_evaluation(cpf_cliente: str, method: str = DEFAULT_EVAL_METHOD):
+    """
+    Consulta o estado (queued, running, done, failed) e o resultado da avaliação de um cliente.
+    """
+    recommender = get_recommender()
+    _check_eval_method(method, recommender)
+
+    job = evaluation_service.status(recommender, cpf_cliente, method)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Nenhuma avaliação enfileirada para este cliente.")
+    return job
+
+@app.get("/model/status", tags=["Model"])
+def get_model_status():
+    """
+    Informa a versão do modelo ativo, a duração do último treino e o tamanho dos dados.
+    """
+    return registry.status()
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Model"])
+def get_metrics():
+    """
+    Métricas no formato de texto do Prometheus: requisições, erros, latência por etapa e estado do modelo.
+    """
+    _refresh_model_gauges()
+    return PlainTextResponse(monitoring.REGISTRY.render(), media_type="text/plain; version=0.0.4")
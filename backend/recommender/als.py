@@ -0,0 +1,163 @@
+"""
+als.py
+------
+Motor colaborativo alternativo ao SVD++ do Surprise: fatoração de matrizes com
+vieses treinada por mínimos quadrados alternados (ALS) sobre o CSR codificado do
+`RatingsIndex`. As soluções por usuário e por item são feitas em lote (sistemas
+lineares empilhados resolvidos pelo LAPACK/BLAS), com blocos distribuídos entre threads.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from backend.recommender.collaborative import CollaborativeFilteringRecommender
+from backend.recommender.scoring import LatentFactorScorer
+from backend.recommender import training
+
+# Limite de memória (bytes) das matrizes de Gram montadas por bloco
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def _block_bounds(indptr: np.ndarray, n_features: int, block_bytes: int = None) -> list:
+    """Divide as linhas do CSR em blocos cujo nº de avaliações cabe no limite de memória."""
+    block_bytes = block_bytes or BLOCK_BYTES
+    budget = max(1, block_bytes // (8 * n_features * n_features))
+    n_rows = len(indptr) - 1
+    bounds, start = [], 0
+    while start < n_rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + budget, side='right')) - 1
+        stop = min(max(stop, start + 1), n_rows)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def solve_ridge_rows(indptr, cols, targets, fixed, reg: float, n_jobs: int = None) -> tuple:
+    """
+    Resolve, para cada linha do CSR (indptr, cols, targets), a regressão ridge
+        min Σ_c (t_c - b - fixed_c · x)² + reg · n · (b² + |x|²)
+    com n = nº de avaliações da linha. Retorna (vieses b, fatores x).
+    """
+    n_rows = len(indptr) - 1
+    n_factors = fixed.shape[1]
+    design = np.hstack([np.ones((fixed.shape[0], 1)), fixed])
+    n_features = n_factors + 1
+    counts = np.diff(indptr)
+    solution = np.zeros((n_rows, n_features))
+    eye = np.eye(n_features)
+
+    def solve(bounds):
+        start, stop = bounds
+        lo, hi = indptr[start], indptr[stop]
+        d = design[cols[lo:hi]]
+        block_counts = counts[start:stop]
+        nonempty = block_counts > 0
+        if not nonempty.any():
+            return
+        # Gram e lado direito de todas as linhas do bloco de uma vez (somas por segmento)
+        starts = (indptr[start:stop] - lo)[nonempty]
+        gram = np.add.reduceat(d[:, :, None] * d[:, None, :], starts, axis=0)
+        rhs = np.add.reduceat(d * targets[lo:hi, None], starts, axis=0)
+        gram += reg * block_counts[nonempty, None, None] * eye
+        rows = np.arange(start, stop)[nonempty]
+        solution[rows] = np.linalg.solve(gram, rhs[..., None])[..., 0]
+
+    bounds = _block_bounds(indptr, n_features)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs > 1 and len(bounds) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(solve, bounds))
+    else:
+        for b in bounds:
+            solve(b)
+    return solution[:, 0], solution[:, 1:]
+
+
+class ALSRecommender(CollaborativeFilteringRecommender):
+    """
+    Fatoração de matrizes com vieses, r̂_ui = μ + b_u + b_i + p_u · q_i, treinada por ALS.
+    Mesma interface do `CollaborativeFilteringRecommender` (train / recommend_items /
+    evaluate_accuracy); o modelo é exportado como um `LatentFactorScorer` sem termo implícito.
+    """
+
+    ARTIFACT_NAME = "als"
+    SUPPORTS_INCREMENTAL = False # O `update()` herdado é o SGD do SVD++, que não vale para a solução do ALS
+    DEFAULT_PARAMS = {'n_factors': 50, 'n_epochs': 15, 'reg_all': 0.1}
+
+    def __init__(self, ratings_df, n_jobs: int = None, validation_fraction: float = 0.05, patience: int = 3):
+        super().__init__(ratings_df)
+        self.n_jobs = n_jobs
+        self.validation_fraction = validation_fraction # 0 desativa a parada antecipada
+        self.patience = patience
+
+    def train(self):
+        """
+        Treina o modelo por ALS com os parâmetros definidos (ou os padrões do motor).
+        `n_epochs` é o máximo de épocas: uma fatia de validação interrompe o treino quando
+        o RMSE estabiliza, e cada época é salva em checkpoint para retomar treinos interrompidos.
+        """
+        self.prepare_ratings()
+        if not self.best_params:
+            self.best_params = dict(self.DEFAULT_PARAMS)
+        params = {**self.DEFAULT_PARAMS, **self.best_params}
+        n_factors, n_epochs, reg = int(params['n_factors']), int(params['n_epochs']), float(params['reg_all'])
+
+        print(f"Treinando o modelo ALS com os parâmetros {params}...")
+        index = self.index
+        mu = float(index.ratings.mean())
+        owners = np.repeat(np.arange(index.n_users), np.diff(index.indptr))
+
+        # Fatia de validação (por avaliação) e CSR de treino nas duas orientações
+        mask = training.validation_mask(index.indptr, self.validation_fraction)
+        indptr, indices, ratings = training.subset_csr(index.indptr, mask, index.indices, index.ratings)
+        val_users, val_items, val_ratings = owners[~mask], index.indices[~mask], index.ratings[~mask]
+
+        train_owners = owners[mask]
+        order = np.argsort(indices, kind="stable")
+        item_indptr = np.concatenate(([0], np.cumsum(np.bincount(indices, minlength=index.n_items))))
+        item_users, item_ratings = train_owners[order], ratings[order]
+
+        rng = np.random.default_rng(42)
+        qi = rng.normal(0, 0.1, (index.n_items, n_factors))
+        bi = np.zeros(index.n_items)
+        stopper = training.EarlyStopping(patience=self.patience)
+        checkpoint = training.EpochCheckpoint(self.ARTIFACT_NAME, self.data_version, params)
+        best = {}
+        first_epoch = 0
+
+        resumed = checkpoint.load()
+        if resumed is not None:
+            first_epoch, current, best, stopper_state = resumed
+            qi, bi = current["qi"], current["bi"]
+            stopper.load_state(stopper_state)
+            print(f"Retomando o treino ALS do checkpoint (época {first_epoch}).")
+
+        for epoch in range(first_epoch, n_epochs):
+            if stopper.should_stop:
+                break
+            bu, pu = solve_ridge_rows(indptr, indices, ratings - mu - bi[indices], qi, reg, self.n_jobs)
+            bi, qi = solve_ridge_rows(item_indptr, item_users, item_ratings - mu - bu[item_users], pu, reg, self.n_jobs)
+
+            if len(val_ratings):
+                predictions = mu + bu[val_users] + bi[val_items] + np.einsum('ij,ij->i', pu[val_users], qi[val_items])
+                rmse = float(np.sqrt(np.mean((val_ratings - np.clip(predictions, 1, 5)) ** 2)))
+            else:
+                rmse = float(-epoch)  # sem validação: a última época é sempre a melhor
+            if stopper.update(epoch, rmse):
+                best = {"bi": bi, "qi": qi}
+            checkpoint.save(epoch + 1, {"bi": bi, "qi": qi}, best, stopper)
+
+        bi, qi = best["bi"], best["qi"]
+        checkpoint.clear()
+        if len(val_ratings):
+            print(f"ALS: melhor época {stopper.best_epoch + 1} de {len(stopper.history)} (RMSE de validação {stopper.best:.4f}).")
+
+        # Vetores finais dos usuários com todas as avaliações (inclusive as de validação)
+        bu, pu = solve_ridge_rows(index.indptr, index.indices, index.ratings - mu - bi[index.indices], qi, reg, self.n_jobs)
+
+        self._set_scorer(LatentFactorScorer(
+            global_mean=mu, bu=bu, bi=bi, pu=pu, qi=qi, yj=np.zeros_like(qi),
+            user_ids=index.user_ids, item_ids=index.item_ids,
+            user_indptr=index.indptr, user_indices=index.indices,
+            rating_scale=(1, 5),
+        ))
@@ -0,0 +1,109 @@
+"""
+artifacts.py
+------------
+Persistência versionada dos modelos treinados. Os parâmetros do modelo e as
+codificações de CPF/ID_PRODUTO são salvos em um arquivo binário `.npz`,
+acompanhado de um manifesto JSON com a impressão digital dos dados de treino.
+"""
+
+import os
+import json
+from datetime import datetime
+import numpy as np
+from backend.recommender.scoring import LatentFactorScorer
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models'))
+
+# Versão do formato do artefato (incrementar se o layout dos arrays mudar)
+ARTIFACT_FORMAT_VERSION = 1
+
+
+def _manifest_path(name: str, models_dir: str) -> str:
+    return os.path.join(models_dir, f"{name}_manifest.json")
+
+
+def read_manifest(name: str = "svdpp", models_dir: str = MODELS_DIR):
+    """Lê o manifesto do último artefato salvo. Retorna None se não existir ou estiver corrompido."""
+    path = _manifest_path(name, models_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_model_artifact(scorer: LatentFactorScorer, fingerprint: str, params: dict,
+                        name: str = "svdpp", models_dir: str = MODELS_DIR) -> dict:
+    """
+    Salva os parâmetros do modelo e as codificações em `<name>_<fingerprint>.npz`
+    e atualiza o manifesto. O artefato anterior é removido após a troca.
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    previous = read_manifest(name, models_dir)
+
+    file_name = f"{name}_{fingerprint}.npz"
+    tmp_path = os.path.join(models_dir, f".{file_name}.tmp.npz")
+    np.savez(
+        tmp_path,
+        global_mean=np.float64(scorer.global_mean),
+        bu=scorer.bu, bi=scorer.bi, pu=scorer.pu, qi=scorer.qi, yj=scorer.yj,
+        user_ids=np.asarray(scorer.user_ids, dtype=str),
+        item_ids=np.asarray(scorer.item_ids, dtype=str),
+        user_indptr=scorer.user_indptr, user_indices=scorer.user_indices,
+        rating_scale=np.asarray(scorer.rating_scale if scorer.rating_scale is not None else [], dtype=np.float64),
+    )
+    os.replace(tmp_path, os.path.join(models_dir, file_name))
+
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "name": name,
+        "file": file_name,
+        "fingerprint": fingerprint,
+        "params": params,
+        "n_users": scorer.n_users,
+        "n_items": scorer.n_items,
+        "n_ratings": int(scorer.user_indptr[-1]),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    # Escrita atômica do manifesto: leitores nunca veem um arquivo pela metade
+    manifest_path = _manifest_path(name, models_dir)
+    with open(manifest_path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    if previous and previous.get("file") != file_name:
+        old_path = os.path.join(models_dir, previous["file"])
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    return manifest
+
+
+def load_model_artifact(fingerprint: str, name: str = "svdpp", models_dir: str = MODELS_DIR):
+    """
+    Carrega o artefato salvo se ele corresponder à impressão digital dos dados atuais.
+    Retorna (LatentFactorScorer, manifesto) ou None quando é preciso treinar novamente.
+    """
+    manifest = read_manifest(name, models_dir)
+    if manifest is None:
+        return None
+    if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION or manifest.get("fingerprint") != fingerprint:
+        return None
+
+    path = os.path.join(models_dir, manifest["file"])
+    if not os.path.exists(path):
+        return None
+
+    with np.load(path) as data:
+        rating_scale = tuple(data["rating_scale"].tolist()) or None
+        scorer = LatentFactorScorer(
+            global_mean=float(data["global_mean"]),
+            bu=data["bu"], bi=data["bi"], pu=data["pu"], qi=data["qi"], yj=data["yj"],
+            user_ids=data["user_ids"].tolist(), item_ids=data["item_ids"].tolist(),
+            user_indptr=data["user_indptr"], user_indices=data["user_indices"],
+            rating_scale=rating_scale,
+        )
+    return scorer, manifest
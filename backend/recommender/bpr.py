@@ -0,0 +1,305 @@
+"""
+bpr.py
+------
+Treino por ranking pareado (BPR) a partir de feedback implícito: compras das
+notas fiscais (cada nota é tratada como um pseudo-usuário) e os pares avaliados
+pelos CPFs. O SGD roda em vários processos sem travas (Hogwild) sobre matrizes de
+fatores em memória compartilhada, em mini-lotes vetorizados com amostragem negativa.
+"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from backend.dataset import loader
+from backend.utils.preprocessing import normalize_text
+from backend.recommender.collaborative import CollaborativeFilteringRecommender
+from backend.recommender.scoring import LatentFactorScorer
+from backend.recommender import training
+
+# Arrays do processo worker (preenchidos pelo inicializador do pool)
+_WORKER_ARRAYS = {}
+_WORKER_BLOCKS = []
+
+
+def load_purchase_events(products_df: pd.DataFrame = None, path: str = loader.RAW_RECEIPTS,
+                         chunksize: int = 500_000) -> pd.DataFrame:
+    """
+    Lê as notas fiscais em blocos e retorna os pares únicos (CESTA, ID_PRODUTO).
+    A cesta é identificada por CNPJ + SERIE + NUMERO_NFCE e o produto é encontrado
+    pela descrição normalizada no catálogo derivado (linhas sem produto são ignoradas).
+    """
+    products = products_df if products_df is not None else loader.load_derived_products()
+    catalog = {normalize_text(desc): str(pid) for pid, desc in zip(products['ID'], products['DESCRICAO'])}
+    resolved = {}  # descrição bruta -> ID (descrições se repetem muito entre blocos)
+
+    parts = []
+    for chunk in loader.iter_raw_receipts(path, chunksize, usecols=['DESCRICAO', 'CNPJ', 'NUMERO_NFCE', 'SERIE']):
+        for desc in pd.unique(chunk['DESCRICAO'].dropna()):
+            if desc not in resolved:
+                resolved[desc] = catalog.get(normalize_text(desc))
+        basket = ('NF:' + chunk['CNPJ'].fillna('') + ':' + chunk['SERIE'].fillna('')
+                  + ':' + chunk['NUMERO_NFCE'].fillna(''))
+        part = pd.DataFrame({'CESTA': basket, 'ID_PRODUTO': chunk['DESCRICAO'].map(resolved)})
+        parts.append(part.dropna().drop_duplicates())
+
+    if not parts:
+        return pd.DataFrame(columns=['CESTA', 'ID_PRODUTO'])
+    return pd.concat(parts, ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+class SharedArrays:
+    """Conjunto de arrays NumPy em blocos de memória compartilhada, acessíveis pelos workers pelo nome."""
+
+    def __init__(self):
+        self.arrays = {}
+        self.specs = {}
+        self._blocks = []
+
+    def add(self, name: str, array: np.ndarray) -> np.ndarray:
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        self._blocks.append(block)
+        self.arrays[name] = view
+        self.specs[name] = (block.name, array.shape, array.dtype.str)
+        return view
+
+    def close(self):
+        self.arrays = {}
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def _init_worker(specs: dict):
+    """Anexa o worker aos blocos de memória compartilhada criados pelo processo principal."""
+    for name, (block_name, shape, dtype) in specs.items():
+        block = SharedMemory(name=block_name)
+        _WORKER_BLOCKS.append(block)
+        _WORKER_ARRAYS[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _sgd_steps(arrays: dict, seed: int, n_samples: int, lr: float, reg: float, batch_size: int) -> tuple:
+    """
+    Executa `n_samples` passos de SGD do BPR em mini-lotes: para cada evento (u, i)
+    sorteado, um item negativo j que u não comprou; maximiza ln σ(x_ui - x_uj).
+    As escritas nas matrizes compartilhadas não usam trava (Hogwild).
+    Retorna (soma da perda -ln σ, nº de triplas usadas).
+    """
+    P, Q, B = arrays["P"], arrays["Q"], arrays["B"]
+    owners, items, keys = arrays["owners"], arrays["items"], arrays["keys"]
+    n_events, n_items = len(items), len(Q)
+    rng = np.random.default_rng(seed)
+    loss, count = 0.0, 0
+
+    for start in range(0, n_samples, batch_size):
+        m = min(batch_size, n_samples - start)
+        events = rng.integers(0, n_events, m)
+        u, i = owners[events], items[events]
+        j = rng.integers(0, n_items, m)
+
+        # Descarta negativos já comprados (busca binária nas chaves u · n_itens + item ordenadas)
+        candidates = u.astype(np.int64) * n_items + j
+        pos = np.minimum(np.searchsorted(keys, candidates), len(keys) - 1)
+        valid = keys[pos] != candidates
+        u, i, j = u[valid], i[valid], j[valid]
+
+        pu, qi, qj = P[u], Q[i], Q[j]
+        x = np.einsum('ij,ij->i', pu, qi - qj) + B[i] - B[j]
+        g = 1.0 / (1.0 + np.exp(np.clip(x, -30, 30)))  # σ(-x): gradiente de ln σ(x)
+        loss += float(np.logaddexp(0, -x).sum())
+        count += len(x)
+
+        np.add.at(P, u, lr * (g[:, None] * (qi - qj) - reg * pu))
+        np.add.at(Q, i, lr * (g[:, None] * pu - reg * qi))
+        np.add.at(Q, j, lr * (-g[:, None] * pu - reg * qj))
+        np.add.at(B, i, lr * (g - reg * B[i]))
+        np.add.at(B, j, lr * (-g - reg * B[j]))
+    return loss, count
+
+
+def _worker_epoch(seed: int, n_samples: int, lr: float, reg: float, batch_size: int) -> tuple:
+    return _sgd_steps(_WORKER_ARRAYS, seed, n_samples, lr, reg, batch_size)
+
+
+def _validation_loss(arrays: dict, users: np.ndarray, positives: np.ndarray, negatives: np.ndarray) -> float:
+    """Perda BPR média (-ln σ(x_ui - x_uj)) nos eventos de validação, com negativos fixos."""
+    P, Q, B = arrays["P"], arrays["Q"], arrays["B"]
+    x = np.einsum('ij,ij->i', P[users], Q[positives] - Q[negatives]) + B[positives] - B[negatives]
+    return float(np.logaddexp(0, -x).mean())
+
+
+def train_bpr(user_codes, item_codes, n_users: int, n_items: int, n_factors: int = 32,
+              n_epochs: int = 30, lr: float = 0.05, reg: float = 0.01, batch_size: int = 1024,
+              samples_per_epoch: int = None, n_workers: int = None, random_state: int = 42,
+              validation_fraction: float = 0.05, patience: int = 3, checkpoint=None) -> dict:
+    """
+    Treina fatores BPR a partir dos pares (usuário, item) observados.
+
+    Cada época sorteia `samples_per_epoch` triplas (padrão: nº de eventos de treino), divididas
+    entre `n_workers` processos que atualizam as mesmas matrizes em memória compartilhada.
+    `n_epochs` é o máximo: uma fatia de validação interrompe o treino quando a perda estabiliza
+    e, com um `training.EpochCheckpoint`, cada época é salva para retomar treinos interrompidos.
+
+    Returns:
+        Dicionário com P (usuários × fatores), Q (itens × fatores), B (viés dos itens) da
+        melhor época e o histórico de perdas (treino e validação).
+    """
+    keys = np.unique(np.asarray(user_codes, dtype=np.int64) * n_items + np.asarray(item_codes, dtype=np.int64))
+    if len(keys) == 0:
+        raise ValueError("Não há eventos de compra/avaliação para treinar o BPR.")
+
+    owners, items = (keys // n_items).astype(np.int32), (keys % n_items).astype(np.int32)
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(owners, minlength=n_users))))
+    mask = training.validation_mask(indptr, validation_fraction, random_state)
+
+    # Negativos fixos da validação (itens que o usuário não comprou)
+    rng = np.random.default_rng(random_state)
+    val_users, val_items = owners[~mask], items[~mask]
+    val_negatives = rng.integers(0, n_items, len(val_users))
+    clean = np.searchsorted(keys, val_users.astype(np.int64) * n_items + val_negatives)
+    clean = keys[np.minimum(clean, len(keys) - 1)] != val_users.astype(np.int64) * n_items + val_negatives
+    val_users, val_items, val_negatives = val_users[clean], val_items[clean], val_negatives[clean]
+
+    initial = {
+        "P": rng.normal(0, 0.1, (n_users, n_factors)).astype(np.float32),
+        "Q": rng.normal(0, 0.1, (n_items, n_factors)).astype(np.float32),
+        "B": np.zeros(n_items, dtype=np.float32),
+        "owners": owners[mask],
+        "items": items[mask],
+        "keys": keys,  # todos os positivos (inclusive validação) ficam fora da amostragem negativa
+    }
+    samples_per_epoch = samples_per_epoch or int(mask.sum())
+    n_workers = max(1, n_workers or os.cpu_count() or 1)
+    lr, reg = np.float32(lr), np.float32(reg)
+    stopper = training.EarlyStopping(patience=patience)
+    train_losses, best, first_epoch = [], {}, 0
+
+    if checkpoint is not None:
+        resumed = checkpoint.load()
+        if resumed is not None:
+            first_epoch, current, best, stopper_state = resumed
+            for name in ("P", "Q", "B"):
+                initial[name][...] = current[name]
+            stopper.load_state(stopper_state)
+            print(f"Retomando o treino BPR do checkpoint (época {first_epoch}).")
+
+    with ExitStack() as stack:
+        if n_workers == 1:
+            arrays = initial
+
+            def run_epoch(epoch):
+                return [_sgd_steps(arrays, random_state + epoch, samples_per_epoch, lr, reg, batch_size)]
+        else:
+            shared = SharedArrays()
+            stack.callback(shared.close)
+            for name, array in initial.items():
+                shared.add(name, array)
+            arrays = shared.arrays
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                                           initargs=(shared.specs,)))
+            per_worker = -(-samples_per_epoch // n_workers)
+
+            def run_epoch(epoch):
+                seeds = [random_state + epoch * n_workers + w for w in range(n_workers)]
+                return list(pool.map(_worker_epoch, seeds, [per_worker] * n_workers, [lr] * n_workers,
+                                     [reg] * n_workers, [batch_size] * n_workers))
+
+        for epoch in range(first_epoch, n_epochs):
+            if stopper.should_stop:
+                break
+            results = run_epoch(epoch)
+            train_losses.append(sum(r[0] for r in results) / max(sum(r[1] for r in results), 1))
+
+            # Sem validação, a última época é sempre a melhor
+            val_loss = _validation_loss(arrays, val_users, val_items, val_negatives) if len(val_users) else -epoch
+            current = {name: arrays[name].copy() for name in ("P", "Q", "B")}
+            if stopper.update(epoch, val_loss):
+                best = current
+            if checkpoint is not None:
+                checkpoint.save(epoch + 1, current, best, stopper)
+
+        if not best:
+            best = {name: arrays[name].copy() for name in ("P", "Q", "B")}
+
+    if checkpoint is not None:
+        checkpoint.clear()
+    return {**best, "losses": train_losses, "validation_losses": stopper.history, "best_epoch": stopper.best_epoch}
+
+
+class BPRRecommender(CollaborativeFilteringRecommender):
+    """
+    Motor de ranking treinado por BPR sobre as compras das notas fiscais e os pares
+    bem avaliados pelos CPFs (nota >= `MIN_POSITIVE_RATING`). Apenas os CPFs e os produtos do índice de avaliações são
+    exportados para o `LatentFactorScorer` (os scores são de ranking, sem escala de nota).
+    """
+
+    ARTIFACT_NAME = "bpr"
+    SUPPORTS_INCREMENTAL = False
+    EVALUATION_METHODS = ("retrain",) # Scores de ranking não estão na escala das notas: o fold-in não se aplica
+    MIN_POSITIVE_RATING = 3 # Avaliações abaixo da nota neutra não viram eventos positivos
+    DEFAULT_PARAMS = {'n_factors': 32, 'n_epochs': 30, 'lr_all': 0.05, 'reg_all': 0.01}
+
+    def __init__(self, ratings_df, n_workers: int = None, receipts_path: str = loader.RAW_RECEIPTS,
+                 validation_fraction: float = 0.05, patience: int = 3):
+        super().__init__(ratings_df)
+        self.n_workers = n_workers
+        self.receipts_path = receipts_path
+        self.validation_fraction = validation_fraction # 0 desativa a parada antecipada
+        self.patience = patience
+
+    def prepare_ratings(self):
+        """Além das avaliações, a versão dos dados considera o estado do arquivo de notas fiscais."""
+        if self.index is not None:
+            return
+        super().prepare_ratings()
+        try:
+            stat = os.stat(self.receipts_path)
+            receipts = f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            receipts = ""
+        self.data_version = hashlib.sha1(f"{self.data_version}:{receipts}".encode()).hexdigest()[:16]
+
+    def train(self):
+        """Monta os eventos implícitos (avaliações + cestas) e treina o BPR."""
+        self.prepare_ratings()
+        if not self.best_params:
+            self.best_params = dict(self.DEFAULT_PARAMS)
+        params = {**self.DEFAULT_PARAMS, **self.best_params}
+        index = self.index
+
+        # Códigos: CPFs e produtos do índice primeiro (mesma codificação), cestas e produtos extras depois
+        events = load_purchase_events(path=self.receipts_path)
+        basket_codes, baskets = pd.factorize(events['CESTA'])
+        extra_items = [iid for iid in pd.unique(events['ID_PRODUTO']) if iid not in index.item_index]
+        item_index = {**index.item_index, **{iid: index.n_items + k for k, iid in enumerate(extra_items)}}
+
+        # Avaliações ruins não indicam preferência: só pares com nota >= neutra entram como positivos
+        positive = index.ratings >= self.MIN_POSITIVE_RATING
+        owners = np.repeat(np.arange(index.n_users), np.diff(index.indptr))
+        user_codes = np.concatenate([owners[positive], index.n_users + basket_codes])
+        item_codes = np.concatenate([index.indices[positive], events['ID_PRODUTO'].map(item_index).to_numpy(dtype=np.int64)])
+        n_users, n_items = index.n_users + len(baskets), index.n_items + len(extra_items)
+
+        print(f"Treinando BPR com {len(item_codes)} eventos ({len(baskets)} notas fiscais, parâmetros {params})...")
+        result = train_bpr(user_codes, item_codes, n_users, n_items,
+                           n_factors=int(params['n_factors']), n_epochs=int(params['n_epochs']),
+                           lr=float(params['lr_all']), reg=float(params['reg_all']), n_workers=self.n_workers,
+                           validation_fraction=self.validation_fraction, patience=self.patience,
+                           checkpoint=training.EpochCheckpoint(self.ARTIFACT_NAME, self.data_version, params))
+        history = result["validation_losses"]
+        print(f"BPR treinado: melhor época {result['best_epoch'] + 1} de {len(history)} "
+              f"(perda de validação {min(history) if history else float('nan'):.4f}).")
+
+        P, Q, B = result["P"][:index.n_users], result["Q"][:index.n_items], result["B"][:index.n_items]
+        self._set_scorer(LatentFactorScorer(
+            global_mean=0.0, bu=np.zeros(index.n_users), bi=B, pu=P, qi=Q, yj=np.zeros_like(Q),
+            user_ids=index.user_ids, item_ids=index.item_ids,
+            user_indptr=index.indptr, user_indices=index.indices,
+            rating_scale=None,
+        ))
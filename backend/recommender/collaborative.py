@@ -1,67 +1,101 @@
 import pandas as pd
 import numpy as np
-import os
-import json
 from sklearn.model_selection import train_test_split
 from surprise import Dataset, Reader, SVDpp
-from surprise.model_selection import GridSearchCV
-from backend.recommender.metrics import evaluate_precision_at_k
+from backend.dataset import loader
+from backend.recommender.metrics import evaluate_precision_at_k, precision_report
+from backend.recommender.index import RatingsIndex
+from backend.recommender.popularity import PopularityIndex
+from backend.recommender.scoring import LatentFactorScorer
+from backend.recommender.topn import TopNTable
+from backend.recommender import artifacts, online, tuning
+from backend.utils.monitoring import stage_timer
 
-PARAMS_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models', 'best_svd_params.json')
+# Métodos de avaliação: re-treino exato do modelo ou fold-in do usuário avaliado
+EVALUATION_METHODS = ("retrain", "fold_in")
 
 class CollaborativeFilteringRecommender:
     """
     Implementa um sistema de recomendação com SVD++, uma evolução do SVD
     que considera feedback implícito para maior acurácia.
     """
+    ARTIFACT_NAME = "svdpp" # Prefixo dos artefatos salvos por este motor
+    SUPPORTS_INCREMENTAL = True # Aceita `update()` com novas avaliações
+    EVALUATION_METHODS = EVALUATION_METHODS # Métodos aceitos por `evaluate_accuracy()`
+
     def __init__(self, ratings_df: pd.DataFrame):
         if ratings_df.empty:
             raise ValueError("O DataFrame de avaliações não pode estar vazio.")
         
         self.ratings_df = ratings_df.copy() # Armazena os dados brutos
         self.svd_model = None
+        self.index = None # Codificação inteira de CPFs/produtos e CSR usuário → itens
+        self.popularity = None # Ranking de popularidade (fallback de cold-start)
+        self.scorer = None # Parâmetros extraídos para pontuação vetorizada
         self.best_params = {}
+        self.data_version = None # Impressão digital dos dados usados no treino
+        self.top_n_size = 0 # Tamanho da tabela top-N pré-calculada (0 = desativada)
+        self.topn_table = None
+
+    def prepare_ratings(self):
+        """
+        Garante os tipos corretos das avaliações, calcula a versão (impressão digital)
+        dos dados e constrói o índice de usuários/itens. Executa apenas uma vez.
+        """
+        if self.index is not None:
+            return
+        self.ratings_df['RATING_DESCRICAO'] = pd.to_numeric(self.ratings_df['RATING_DESCRICAO'], errors='coerce')
+        self.ratings_df.dropna(subset=['CPF_CLIENTE', 'ID_PRODUTO', 'RATING_DESCRICAO'], inplace=True)
+        self.data_version = loader.ratings_fingerprint(self.ratings_df)
+        self.index = RatingsIndex.from_ratings(self.ratings_df)
+        self.popularity = PopularityIndex.from_index(self.index)
+
+    def load_or_train(self):
+        """
+        Carrega o artefato salvo em `data/models` se ele corresponder aos dados atuais
+        (mesma impressão digital de `ratings.csv`); caso contrário treina e salva um novo artefato.
+        Retorna a origem do modelo: "artifact" ou "trained".
+        """
+        self.prepare_ratings()
+
+        loaded = artifacts.load_model_artifact(self.data_version, name=self.ARTIFACT_NAME)
+        if loaded is not None and self._matches_index(loaded[0]):
+            scorer, manifest = loaded
+            self.best_params = manifest["params"]
+            print(f"Modelo carregado do artefato '{manifest['file']}' (dados inalterados, treino dispensado).")
+            self._set_scorer(scorer)
+            return "artifact"
+
+        self.train()
+        manifest = artifacts.save_model_artifact(self.scorer, self.data_version, self.best_params, name=self.ARTIFACT_NAME)
+        print(f"Artefato do modelo salvo em '{manifest['file']}'.")
+        return "trained"
+
+    def _matches_index(self, scorer: LatentFactorScorer) -> bool:
+        """Confere se as codificações do artefato são as mesmas do índice atual."""
+        return (np.array_equal(scorer.user_ids, self.index.user_ids)
+                and np.array_equal(scorer.item_ids, self.index.item_ids))
 
     def train(self):
         """
         Otimiza hiperparâmetros (se necessário) e treina o modelo SVD++ com os dados fornecidos.
         """
         # Garante que os tipos de dados estão corretos
-        self.ratings_df['RATING_DESCRICAO'] = pd.to_numeric(self.ratings_df['RATING_DESCRICAO'], errors='coerce')
-        self.ratings_df.dropna(subset=['CPF_CLIENTE', 'ID_PRODUTO', 'RATING_DESCRICAO'], inplace=True)
+        self.prepare_ratings()
 
         # Prepara os dados para o formato da biblioteca Surprise
         reader = Reader(rating_scale=(1, 5))
         data = Dataset.load_from_df(self.ratings_df[['CPF_CLIENTE', 'ID_PRODUTO', 'RATING_DESCRICAO']], reader)
         
-        # 1. Otimiza os hiperparâmetros apenas se não estiverem em memória
-        if not self.best_params and not os.path.exists(PARAMS_FILE):
-            print("Otimizando hiperparâmetros do modelo SVD++ (pode demorar)...")
-            param_grid = {
-                'n_factors': [50, 80, 100],      # Testar mais fatores latentes
-                'n_epochs': [20, 30],           # Mais iterações para convergência
-                'lr_all': [0.005, 0.01],      # Taxas de aprendizado variadas
-                'reg_all': [0.02, 0.05, 0.1]  # Termos de regularização para evitar overfitting
+        # 1. Escolhe os hiperparâmetros pelo histórico de buscas (reutiliza, busca na vizinhança ou busca completa)
+        if not self.best_params:
+            self.best_params, source = tuning.select_params(self.ratings_df, self.data_version)
+            messages = {
+                "history": "Hiperparâmetros reutilizados do histórico (dados pouco alterados):",
+                "warm_start": "Hiperparâmetros ajustados na vizinhança do melhor resultado anterior:",
+                "full_search": "Melhores hiperparâmetros encontrados na busca completa:",
             }
-            gs = GridSearchCV(SVDpp, param_grid, measures=['rmse', 'mae'], cv=3, joblib_verbose=2)
-            gs.fit(data)
-
-            self.best_params = gs.best_params['rmse']
-            
-            # Salva os melhores parâmetros em um arquivo JSON
-            models_dir = os.path.dirname(PARAMS_FILE)
-            if not os.path.exists(models_dir):
-                os.makedirs(models_dir)
-            with open(PARAMS_FILE, 'w') as f:
-                json.dump(self.best_params, f)
-
-            print(f"Melhores parâmetros encontrados e salvos (RMSE: {gs.best_score['rmse']:.4f}):", self.best_params)
-        
-        elif not self.best_params:
-            print("Carregando hiperparâmetros otimizados de arquivo...")
-            with open(PARAMS_FILE, 'r') as f:
-                self.best_params = json.load(f)
-            print("Parâmetros carregados:", self.best_params)
+            print(messages[source], self.best_params)
 
         # 2. Treina o modelo final com os melhores parâmetros
         print("Treinando o modelo com os melhores parâmetros...")
@@ -71,68 +105,213 @@ class CollaborativeFilteringRecommender:
         full_trainset = data.build_full_trainset()
         self.svd_model.fit(full_trainset)
 
-    def _get_popular_items(self, n: int = 10):
-        """Retorna os N itens mais populares com base na média de avaliação."""
-        item_popularity = self.ratings_df.groupby('ID_PRODUTO')['RATING_DESCRICAO'].mean()
-        # Ordena pela nota média e pega os N melhores
-        popular_items = item_popularity.sort_values(ascending=False).head(n).index.tolist()
-        return popular_items
+        # 3. Extrai os parâmetros para arrays NumPy (pontuação de todo o catálogo de uma vez)
+        self._set_scorer(LatentFactorScorer.from_svdpp(self.svd_model, self.index))
+
+    def _set_scorer(self, scorer: LatentFactorScorer):
+        """Ativa um novo conjunto de parâmetros e reconstrói a tabela top-N, se ativada."""
+        self.scorer = scorer
+        self.topn_table = None
+        if self.top_n_size > 0:
+            self.precompute_top_n(self.top_n_size)
+
+    def update(self, new_ratings: pd.DataFrame, n_passes: int = 10) -> dict:
+        """
+        Incorpora novas avaliações (ou reavaliações) ao modelo já treinado sem re-treino completo:
+        o índice, a popularidade e os parâmetros crescem para CPFs/produtos novos e algumas
+        passadas de SGD ajustam apenas os usuários e itens afetados.
+
+        Os atributos são substituídos por objetos novos (os atuais não são alterados); para o
+        modelo ativo da API, aplique em uma cópia (`copy.copy`) e publique pelo registro.
+        """
+        if not self.SUPPORTS_INCREMENTAL:
+            raise ValueError(f"O motor {type(self).__name__} não aceita atualização incremental.")
+        if self.scorer is None:
+            raise ValueError("O modelo precisa ser treinado antes de receber avaliações incrementais.")
+
+        new = new_ratings.copy()
+        new['RATING_DESCRICAO'] = pd.to_numeric(new['RATING_DESCRICAO'], errors='coerce')
+        new = new.dropna(subset=['CPF_CLIENTE', 'ID_PRODUTO', 'RATING_DESCRICAO'])
+        new = new.drop_duplicates(subset=['CPF_CLIENTE', 'ID_PRODUTO'], keep='last').reset_index(drop=True)
+        if new.empty:
+            return {"added": 0, "updated": 0, "new_users": 0, "new_items": 0}
+
+        with stage_timer("incremental_update"):
+            index = self.index
+            n_users, n_items = index.n_users, index.n_items
+            ratings_df = self.ratings_df.copy()
+            popularity = self.popularity.copy()
+            rating_col = ratings_df.columns.get_loc('RATING_DESCRICAO')
+
+            # Reavaliações atualizam a linha existente; avaliações novas vão para o fim do DataFrame
+            rows = np.empty(len(new), dtype=np.int64)
+            appended = []
+            for k, (cpf, item_id, rating) in enumerate(new[['CPF_CLIENTE', 'ID_PRODUTO', 'RATING_DESCRICAO']].itertuples(index=False)):
+                position = index.find(index.user_code(cpf), index.item_index.get(item_id, -1))
+                if position >= 0:
+                    rows[k] = index.rows[position]
+                    popularity.add(item_id, rating, previous_rating=index.ratings[position])
+                    ratings_df.iat[rows[k], rating_col] = rating
+                else:
+                    rows[k] = len(ratings_df) + len(appended)
+                    popularity.add(item_id, rating)
+                    appended.append(k)
+
+            if appended:
+                additions = new.iloc[appended].reindex(columns=ratings_df.columns)
+                ratings_df = pd.concat([ratings_df, additions], ignore_index=True)
+
+            index, user_codes, item_codes = index.with_ratings(
+                new['CPF_CLIENTE'], new['ID_PRODUTO'], new['RATING_DESCRICAO'], rows
+            )
+            scorer, touched = online.sgd_update(
+                self.scorer, index, user_codes, item_codes,
+                lr=self.best_params.get('lr_all', 0.007), reg=self.best_params.get('reg_all', 0.02),
+                n_passes=n_passes,
+            )
+
+            # Publica primeiro o scorer (que já conhece usuários/itens novos) e depois o índice
+            self.scorer = scorer
+            if self.topn_table is not None:
+                # Usuários com vetor novo saem da tabela; itens ajustados ou novos são re-pontuados na consulta
+                self.topn_table = self.topn_table.invalidate(touched, item_codes, scorer)
+            self.index = index
+            self.popularity = popularity
+            self.ratings_df = ratings_df
+            self.data_version = loader.ratings_fingerprint(ratings_df)
+
+        return {
+            "added": len(appended),
+            "updated": len(new) - len(appended),
+            "new_users": index.n_users - n_users,
+            "new_items": index.n_items - n_items,
+        }
+
+    def precompute_top_n(self, n: int):
+        """
+        Etapa em lote: calcula o top-N de todos os CPFs conhecidos e mantém a tabela em memória.
+        A tabela é reconstruída automaticamente a cada novo `train()` (ou carga de artefato).
+        """
+        self.top_n_size = n
+        if self.scorer is None or n <= 0:
+            return
+        self.topn_table = TopNTable.build(self.scorer, n)
+
+    def _get_popular_items(self, n: int = 10, exclude=None):
+        """Retorna os N itens mais populares pela média bayesiana (amortecida) de avaliação."""
+        if self.popularity is None:
+            return []
+        return self.popularity.top(n, exclude=exclude)
 
     def recommend_items(self, user_cpf: str, n_recommendations: int = 5):
         """
         Gera recomendações para um usuário específico.
         """
-        if self.svd_model is None:
+        if self.scorer is None:
             return []
 
-        # Pega todos os IDs de produtos
-        all_item_ids = self.ratings_df['ID_PRODUTO'].unique()
+        # Resposta imediata a partir da tabela pré-calculada (usuários conhecidos)
+        if self.topn_table is not None:
+            with stage_timer("topn_lookup"):
+                cached = self.topn_table.lookup(user_cpf, n_recommendations)
+            if cached is not None:
+                return cached
 
-        # Itens que o usuário já viu (para não recomendar de novo)
-        seen_items = self.ratings_df[self.ratings_df['CPF_CLIENTE'] == user_cpf]['ID_PRODUTO'].unique()
+        # Itens que o usuário já viu (para não recomendar de novo): busca O(histórico) no índice
+        with stage_timer("seen_filter"):
+            u = self.index.user_code(user_cpf)
+            seen_codes = self.index.user_items(u) if u >= 0 else np.empty(0, dtype=np.int32)
+            seen_items = self.index.item_ids[seen_codes]
 
-        # Itens a serem previstos (todos menos os que o usuário já viu)
-        items_to_predict = np.setdiff1d(all_item_ids, seen_items)
+        # Pontua todo o catálogo com um único produto matriz-vetor e seleciona o top-N
+        with stage_timer("scoring"):
+            scores = self.scorer.score(user_cpf)
+            top_codes, top_scores = self.scorer.top_n(scores, n_recommendations, exclude=seen_codes)
 
-        # Prevê a nota para cada item não visto
-        predictions = [self.svd_model.predict(user_cpf, item_id) for item_id in items_to_predict]
+            recommended_items = [
+                {'id': self.index.item_ids[code], 'score': float(score)}
+                for code, score in zip(top_codes, top_scores)
+            ]
 
-        # Ordena as recomendações pela pontuação ponderada
-        predictions.sort(key=lambda x: x.est, reverse=True)
-        
-        recommended_items = [{'id': pred.iid, 'score': pred.est} for pred in predictions]
+        if len(recommended_items) < n_recommendations:
+            with stage_timer("fallback"):
+                self._fill_fallbacks(recommended_items, n_recommendations, u, seen_codes, seen_items)
 
+        return recommended_items[:n_recommendations]
+
+    def _fill_fallbacks(self, recommended_items: list, n_recommendations: int, u: int, seen_codes, seen_items):
+        """Completa a lista de recomendações com itens populares e, por fim, com os favoritos do usuário."""
         # --- MELHORIA: Fallback para itens populares ---
         # Se não geramos recomendações suficientes, completamos com os mais populares
         if len(recommended_items) < n_recommendations:
             # Itens que o usuário já viu ou que já foram recomendados
             exclude_items = set(seen_items) | {item['id'] for item in recommended_items}
-            
-            popular_items = self._get_popular_items(n=n_recommendations * 2) # Pega mais para ter margem
-            fallback_items = [item for item in popular_items if item not in exclude_items]
-            
+
             needed = n_recommendations - len(recommended_items)
-            recommended_items.extend([{'id': item_id, 'score': 0} for item_id in fallback_items[:needed]]) # Score 0 para fallback
+            fallback_items = self._get_popular_items(n=needed, exclude=exclude_items)
+            recommended_items.extend([{'id': item_id, 'score': 0} for item_id in fallback_items]) # Score 0 para fallback
         
         # --- MELHORIA 2: Fallback para os itens favoritos do próprio usuário (Recompra) ---
         # Se, mesmo após os fallbacks, não houver recomendações suficientes (cenário de saturação),
         # preenchemos com os itens mais bem avaliados pelo próprio usuário.
-        if len(recommended_items) < n_recommendations:
-            user_ratings = self.ratings_df[self.ratings_df['CPF_CLIENTE'] == user_cpf]
-            user_top_rated = user_ratings.sort_values(by="RATING_DESCRICAO", ascending=False)
-            
+        if len(recommended_items) < n_recommendations and u >= 0:
+            order = np.argsort(-self.index.user_ratings(u), kind="stable")
+            user_top_rated = self.index.item_ids[seen_codes[order]]
+
             current_rec_ids = {item['id'] for item in recommended_items}
-            fallback_favorites = [item for item in user_top_rated['ID_PRODUTO'].tolist() if item not in current_rec_ids]
+            fallback_favorites = [item for item in user_top_rated if item not in current_rec_ids]
             needed = n_recommendations - len(recommended_items)
             recommended_items.extend([{'id': item_id, 'score': 0} for item_id in fallback_favorites[:needed]])
-        
-        return recommended_items[:n_recommendations]
 
-    def evaluate_accuracy(self, user_cpf: str):
+    def recommend_batch(self, user_cpfs: list, n_recommendations: int = 5, block_size: int = 1024) -> dict:
+        """
+        Gera recomendações para vários usuários de uma vez: um produto de matrizes
+        (usuários × itens) por bloco, com os itens já vistos mascarados.
+        Usuários sem itens suficientes recorrem ao `recommend_items` (fallbacks).
+        """
+        results = {}
+        if self.scorer is None:
+            return {cpf: [] for cpf in user_cpfs}
+
+        unique_cpfs = list(dict.fromkeys(user_cpfs))
+        for start in range(0, len(unique_cpfs), block_size):
+            cpfs = unique_cpfs[start:start + block_size]
+            user_codes = np.array([self.index.user_code(cpf) for cpf in cpfs], dtype=np.int64)
+
+            scores = self.scorer.mask_seen(self.scorer.score_users(user_codes), user_codes)
+            top_codes, top_scores = self.scorer.top_n_rows(scores, n_recommendations)
+
+            for row, cpf in enumerate(cpfs):
+                valid = np.isfinite(top_scores[row])
+                if valid.sum() < n_recommendations:
+                    results[cpf] = self.recommend_items(cpf, n_recommendations)
+                    continue
+                results[cpf] = [
+                    {'id': self.scorer.item_ids[code], 'score': float(score)}
+                    for code, score in zip(top_codes[row], top_scores[row])
+                ]
+        return results
+
+    def user_history(self, user_cpf: str) -> pd.DataFrame:
+        """Avaliações do usuário (linhas de `ratings_df`); vazio se ele não possui avaliações."""
+        self.prepare_ratings()
+        u = self.index.user_code(user_cpf)
+        return self.ratings_df.iloc[self.index.user_rows(u)] if u >= 0 else self.ratings_df.iloc[:0]
+
+    def evaluate_accuracy(self, user_cpf: str, method: str = "retrain", model_factory=None):
         """
         Avalia a acurácia das recomendações para um usuário, conforme a metodologia solicitada.
+
+        - method="retrain": treina um modelo temporário sem a metade oculta do usuário (exato, lento)
+        - method="fold_in": re-estima apenas o vetor do usuário com os itens congelados (aproximado, rápido)
+
+        `model_factory(ratings_df)` cria e treina o modelo temporário do re-treino
+        (padrão: mesmo motor com os mesmos parâmetros).
         """
-        user_ratings = self.ratings_df[self.ratings_df['CPF_CLIENTE'] == user_cpf]
+        if method not in self.EVALUATION_METHODS:
+            raise ValueError(f"Método de avaliação inválido: {method}. Use um de {self.EVALUATION_METHODS}.")
+
+        user_ratings = self.user_history(user_cpf)
 
         # Requer um número mínimo de avaliações para uma avaliação significativa
         if len(user_ratings) < 4:
@@ -147,11 +326,17 @@ class CollaborativeFilteringRecommender:
         # Extrai os IDs dos itens usados no conjunto de treino da simulação
         training_item_ids = train_data['ID_PRODUTO'].tolist()
 
+        if method == "fold_in":
+            return self._evaluate_fold_in(train_data, test_data, training_item_ids, n_evaluation_recs=10)
+
         # Cria e treina um modelo temporário isolado, usando os melhores parâmetros já encontrados.
-        temp_ratings_df = pd.concat([self.ratings_df[self.ratings_df['CPF_CLIENTE'] != user_cpf], train_data])
-        temp_recommender = CollaborativeFilteringRecommender(temp_ratings_df)
-        temp_recommender.best_params = self.best_params # Garante que use os mesmos parâmetros
-        temp_recommender.train() # Treina o modelo temporário
+        temp_ratings_df = pd.concat([self.ratings_df.drop(index=user_ratings.index), train_data])
+        if model_factory is not None:
+            temp_recommender = model_factory(temp_ratings_df)
+        else:
+            temp_recommender = type(self)(temp_ratings_df) # Mesmo motor do modelo avaliado
+            temp_recommender.best_params = self.best_params # Garante que use os mesmos parâmetros
+            temp_recommender.train() # Treina o modelo temporário
 
         # 2. Chama a função de avaliação modularizada
         return evaluate_precision_at_k(
@@ -161,3 +346,26 @@ class CollaborativeFilteringRecommender:
             training_item_ids=training_item_ids,
             n_evaluation_recs=10
         )
+
+    def _evaluate_fold_in(self, train_data: pd.DataFrame, test_data: pd.DataFrame, training_item_ids: list, n_evaluation_recs: int = 10):
+        """
+        Avaliação por fold-in: mantém vieses e fatores dos itens do modelo atual e
+        re-estima só o usuário (b_u, p_u e termo implícito) a partir da metade de treino.
+        """
+        if self.scorer is None:
+            return {
+                "precision_at_k": 0, "hits": 0, "total_recommended": n_evaluation_recs,
+                "message": "Avaliação de acurácia não disponível (modelo não treinado)."
+            }
+
+        known = train_data[train_data['ID_PRODUTO'].isin(self.index.item_index)]
+        item_codes = [self.index.item_index[item_id] for item_id in known['ID_PRODUTO']]
+        bu, user_vec = self.scorer.fold_in(item_codes, known['RATING_DESCRICAO'].to_numpy(dtype=float),
+                                           reg=self.best_params.get('reg_all', 0.02))
+
+        # Pontua o catálogo com o usuário re-estimado, ignorando os itens de treino
+        scores = self.scorer.score_vector(bu, user_vec)
+        top_codes, _ = self.scorer.top_n(scores, n_evaluation_recs, exclude=item_codes)
+        recommended_item_ids = [self.scorer.item_ids[code] for code in top_codes]
+
+        return precision_report(recommended_item_ids, test_data, training_item_ids)
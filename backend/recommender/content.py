@@ -1 +1,277 @@
- # Content-based filtering using product attributes
\ No newline at end of file
+"""
+content.py
+----------
+Filtragem baseada em conteúdo a partir dos atributos dos produtos (`products.csv`).
+Cada produto vira um vetor esparso TF-IDF (n-gramas de caracteres e de palavras da
+DESCRICAO) concatenado ao one-hot de CATEGORIA e MARCA. Os K vizinhos mais parecidos
+(cosseno, pelo kernel em blocos de `backend.utils.similarity`) de cada produto são
+pré-calculados uma vez, guardados como arrays CSR em `data/models` e recarregados
+enquanto o catálogo não muda. Um usuário é pontuado
+somando as linhas de vizinhos dos itens que avaliou, o que dispensa re-treino para
+produtos novos e para clientes com poucas avaliações.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from backend.dataset import loader
+from backend.utils.preprocessing import normalize_text
+from backend.utils.similarity import top_k_cosine
+from backend.recommender.index import RatingsIndex
+from backend.recommender.popularity import PopularityIndex
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models'))
+
+# Versão do formato da tabela de vizinhos (incrementar se o layout dos arrays mudar)
+NEIGHBORS_FORMAT_VERSION = 1
+
+DEFAULT_PARAMS = {
+    'n_neighbors': 50, # vizinhos guardados por produto
+    'char_weight': 1.0, # n-gramas de caracteres (3 a 5) da descrição: tolera abreviações e grafias
+    'word_weight': 1.0, # palavras e bigramas da descrição
+    'category_weight': 0.5,
+    'brand_weight': 0.5,
+}
+
+# Nota neutra: avaliações acima aproximam o usuário dos vizinhos do item, abaixo afastam
+NEUTRAL_RATING = 2.5
+
+
+def catalog_fingerprint(products_df: pd.DataFrame, params: dict) -> str:
+    """Impressão digital do catálogo e dos parâmetros de features (versiona a tabela de vizinhos)."""
+    columns = products_df[['ID', 'CATEGORIA', 'MARCA', 'DESCRICAO']].astype(str)
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(columns, index=False).values.tobytes())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+def build_item_features(products_df: pd.DataFrame, params: dict = None) -> sp.csr_matrix:
+    """
+    Matriz esparsa (produtos × features) com linhas de norma 1, para que o produto
+    interno entre duas linhas seja a similaridade de cosseno.
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    descriptions = products_df['DESCRICAO'].map(normalize_text)
+    blocks = []
+
+    if params['char_weight'] > 0:
+        char = TfidfVectorizer(analyzer='char_wb', ngram_range=(3, 5), sublinear_tf=True, dtype=np.float32)
+        blocks.append(params['char_weight'] * normalize(char.fit_transform(descriptions)))
+    if params['word_weight'] > 0:
+        word = TfidfVectorizer(analyzer='word', ngram_range=(1, 2), sublinear_tf=True, dtype=np.float32)
+        blocks.append(params['word_weight'] * normalize(word.fit_transform(descriptions)))
+    for column, weight in (('CATEGORIA', params['category_weight']), ('MARCA', params['brand_weight'])):
+        if weight > 0:
+            codes, _ = pd.factorize(products_df[column].map(normalize_text))
+            valid = codes >= 0
+            one_hot = sp.csr_matrix(
+                (np.full(valid.sum(), weight, dtype=np.float32), (np.flatnonzero(valid), codes[valid])),
+                shape=(len(products_df), max(codes.max() + 1, 1)),
+            )
+            blocks.append(one_hot)
+
+    features = sp.hstack(blocks, format='csr', dtype=np.float32)
+    return normalize(features).astype(np.float32)
+
+
+class ContentRecommender:
+    """
+    Recomendador por conteúdo com tabela de vizinhos pré-calculada.
+
+    - item_ids: IDs dos produtos (códigos = posição no catálogo)
+    - neighbor_indptr / neighbor_indices / neighbor_scores: top-K vizinhos de cada produto (CSR)
+    - index / popularity: histórico dos usuários e ranking de popularidade (fallback de cold-start)
+    """
+
+    ARTIFACT_NAME = "content"
+
+    def __init__(self, products_df: pd.DataFrame = None, ratings_df: pd.DataFrame = None, params: dict = None,
+                 n_jobs: int = 1):
+        products = products_df if products_df is not None else loader.load_derived_products()
+        products = products.dropna(subset=['ID']).copy()
+        products['ID'] = products['ID'].astype(str)
+        self.products_df = products.drop_duplicates(subset=['ID']).reset_index(drop=True)
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        self.item_ids = self.products_df['ID'].to_numpy(dtype=object)
+        self.item_index = {iid: i for i, iid in enumerate(self.item_ids)}
+        self.fingerprint = catalog_fingerprint(self.products_df, self.params)
+        self.n_jobs = n_jobs # threads do cálculo de vizinhos (cada uma com seu bloco; None = nº de CPUs)
+        self.neighbor_indptr = None
+        self.neighbor_indices = None
+        self.neighbor_scores = None
+        self.index = None
+        self.popularity = None
+        self._catalog_codes = None # código do catálogo de cada item do índice de avaliações
+        if ratings_df is not None:
+            self.set_ratings(ratings_df)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_ids)
+
+    # --- Tabela de vizinhos ---
+
+    def build(self):
+        """Calcula as features e a tabela de vizinhos do catálogo atual."""
+        print(f"Calculando os {self.params['n_neighbors']} vizinhos de conteúdo de {self.n_items} produtos...")
+        features = build_item_features(self.products_df, self.params)
+        # Vizinhos com similaridade zero não carregam informação: ficam fora da tabela
+        self.neighbor_indptr, self.neighbor_indices, self.neighbor_scores = top_k_cosine(
+            features, int(self.params['n_neighbors']), n_jobs=self.n_jobs, min_score=0.0, normalized=True)
+
+    def _artifact_path(self, models_dir: str) -> str:
+        return os.path.join(models_dir, f"{self.ARTIFACT_NAME}_{self.fingerprint}.npz")
+
+    def save(self, models_dir: str = MODELS_DIR) -> str:
+        """Grava a tabela em `content_<impressão digital>.npz` (escrita atômica) e remove as versões antigas."""
+        os.makedirs(models_dir, exist_ok=True)
+        path = self._artifact_path(models_dir)
+        meta = json.dumps({"format_version": NEIGHBORS_FORMAT_VERSION, "params": self.params,
+                           "created_at": datetime.now().isoformat(timespec="seconds")})
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(meta), item_ids=np.asarray(self.item_ids, dtype=str),
+                 indptr=self.neighbor_indptr, indices=self.neighbor_indices, scores=self.neighbor_scores)
+        os.replace(tmp_path, path)
+
+        prefix = f"{self.ARTIFACT_NAME}_"
+        for name in os.listdir(models_dir):
+            old = os.path.join(models_dir, name)
+            if name.startswith(prefix) and name.endswith(".npz") and old != path:
+                os.remove(old)
+        return path
+
+    def load(self, models_dir: str = MODELS_DIR) -> bool:
+        """Carrega a tabela salva para o catálogo atual. Retorna False se ela não existe ou é de outra versão."""
+        path = self._artifact_path(models_dir)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("format_version") != NEIGHBORS_FORMAT_VERSION:
+                    return False
+                if not np.array_equal(data["item_ids"], np.asarray(self.item_ids, dtype=str)):
+                    return False
+                self.neighbor_indptr = data["indptr"]
+                self.neighbor_indices = data["indices"]
+                self.neighbor_scores = data["scores"]
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def load_or_build(self, models_dir: str = MODELS_DIR) -> str:
+        """Reaproveita a tabela salva se o catálogo não mudou; senão calcula e salva. Retorna a origem."""
+        if self.load(models_dir):
+            print(f"Vizinhos de conteúdo carregados do disco ({self.n_items} produtos).")
+            return "artifact"
+        self.build()
+        self.save(models_dir)
+        return "built"
+
+    # --- Histórico dos usuários ---
+
+    def set_ratings(self, ratings_df: pd.DataFrame):
+        """Atualiza o histórico dos usuários (não exige recalcular a tabela de vizinhos)."""
+        ratings_df = ratings_df.copy()
+        ratings_df['ID_PRODUTO'] = ratings_df['ID_PRODUTO'].astype(str)
+        ratings_df['RATING_DESCRICAO'] = pd.to_numeric(ratings_df['RATING_DESCRICAO'], errors='coerce')
+        ratings_df = ratings_df.dropna(subset=['CPF_CLIENTE', 'ID_PRODUTO', 'RATING_DESCRICAO'])
+        index = RatingsIndex.from_ratings(ratings_df)
+        self.use_index(index, PopularityIndex.from_index(index))
+
+    def use_index(self, index: RatingsIndex, popularity: PopularityIndex):
+        """Reaproveita um índice de avaliações já construído (ex.: o do modelo colaborativo)."""
+        self.index = index
+        self.popularity = popularity
+        self._catalog_codes = np.array([self.item_index.get(str(iid), -1) for iid in index.item_ids], dtype=np.int64)
+
+    def catalog_codes(self, index_codes) -> np.ndarray:
+        """Converte códigos de itens do índice de avaliações em códigos do catálogo (-1 = fora do catálogo)."""
+        return self._catalog_codes[np.asarray(index_codes, dtype=np.int64)]
+
+    def user_profile(self, user_cpf: str) -> tuple:
+        """(códigos no catálogo, notas) dos itens avaliados pelo usuário que existem no catálogo."""
+        if self.index is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        u = self.index.user_code(user_cpf)
+        if u < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        codes = self._catalog_codes[self.index.user_items(u)]
+        ratings = self.index.user_ratings(u)
+        known = codes >= 0
+        return codes[known], ratings[known]
+
+    # --- Pontuação ---
+
+    def score_neighbors(self, item_codes, ratings=None) -> tuple:
+        """
+        Soma das linhas de vizinhos dos itens avaliados, ponderadas por (nota - NEUTRAL_RATING);
+        sem notas, cada item pesa 1. Retorna apenas os itens alcançados: (códigos, scores).
+        Custo O(itens avaliados × K), independente do tamanho do catálogo.
+        """
+        item_codes = np.asarray(item_codes, dtype=np.int64)
+        weights = np.ones(len(item_codes)) if ratings is None else np.asarray(ratings, dtype=np.float64) - NEUTRAL_RATING
+        starts, stops = self.neighbor_indptr[item_codes], self.neighbor_indptr[item_codes + 1]
+        lengths = stops - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        codes, inverse = np.unique(self.neighbor_indices[positions], return_inverse=True)
+        scores = np.bincount(inverse, weights=self.neighbor_scores[positions] * np.repeat(weights, lengths),
+                             minlength=len(codes))
+        return codes.astype(np.int64), scores
+
+    def score_items(self, item_codes, ratings=None) -> np.ndarray:
+        """Pontuação de todo o catálogo (zero para os itens não alcançados) a partir de itens avaliados."""
+        codes, values = self.score_neighbors(item_codes, ratings)
+        scores = np.zeros(self.n_items)
+        scores[codes] = values
+        return scores
+
+    def _top(self, scores: np.ndarray, n: int, exclude) -> list:
+        scores = scores.copy()
+        if len(exclude):
+            scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-scores[candidates], n - 1)[:n]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [{'id': self.item_ids[code], 'score': float(scores[code])} for code in candidates]
+
+    def recommend_from_history(self, item_ids: list, ratings: list = None, n_recommendations: int = 5) -> list:
+        """Recomenda a partir de uma lista de produtos (e notas) avulsa, ex.: cliente ainda fora do modelo."""
+        pairs = [(self.item_index[iid], r) for iid, r in zip(item_ids, ratings or [None] * len(item_ids))
+                 if iid in self.item_index]
+        codes = np.array([c for c, _ in pairs], dtype=np.int64)
+        weights = None if ratings is None else np.array([r for _, r in pairs], dtype=np.float64)
+        return self._top(self.score_items(codes, weights), n_recommendations, exclude=codes)
+
+    def recommend_items(self, user_cpf: str, n_recommendations: int = 5) -> list:
+        """
+        Recomenda produtos parecidos com os que o usuário avaliou bem. Completa a lista
+        com os mais populares quando o histórico não gera vizinhos suficientes.
+        """
+        if self.neighbor_indptr is None:
+            return []
+        codes, ratings = self.user_profile(user_cpf)
+        recommended = self._top(self.score_items(codes, ratings), n_recommendations, exclude=codes)
+
+        if len(recommended) < n_recommendations and self.popularity is not None:
+            exclude = {self.item_ids[c] for c in codes} | {item['id'] for item in recommended}
+            needed = n_recommendations - len(recommended)
+            recommended.extend({'id': iid, 'score': 0} for iid in self.popularity.top(needed, exclude=exclude))
+        return recommended[:n_recommendations]
+
+    def similar_items(self, item_id, n: int = 10) -> list:
+        """Vizinhos de conteúdo de um produto, em ordem decrescente de similaridade."""
+        code = self.item_index.get(str(item_id))
+        if code is None or self.neighbor_indptr is None:
+            return []
+        start, stop = self.neighbor_indptr[code], min(self.neighbor_indptr[code + 1], self.neighbor_indptr[code] + n)
+        return [{'id': self.item_ids[c], 'score': float(s)}
+                for c, s in zip(self.neighbor_indices[start:stop], self.neighbor_scores[start:stop])]
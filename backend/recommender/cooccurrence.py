@@ -0,0 +1,252 @@
+"""
+cooccurrence.py
+---------------
+Índice "comprados juntos" a partir das cestas reais das notas fiscais
+(`receipts_nf.csv`, uma cesta = CNPJ + SERIE + NUMERO_NFCE). As notas são lidas em
+blocos, as linhas viram IDs de produto pela descrição normalizada (como no BPR) e
+os pares (cesta, produto) de todos os blocos formam uma matriz esparsa cesta × produto,
+da qual sai a co-ocorrência item × item. A associação de
+cada par é normalizada por lift ou PMI e só os K melhores parceiros de cada produto
+ficam guardados (arrays CSR em `data/models`), servidos em O(K) pela API.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from backend.dataset import loader
+from backend.utils.preprocessing import normalize_text
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models'))
+
+# Versão do formato do índice (incrementar se o layout dos arrays mudar)
+COOCCURRENCE_FORMAT_VERSION = 2
+
+MEASURES = ("lift", "pmi")
+
+DEFAULT_PARAMS = {
+    'top_k': 20, # parceiros guardados por produto
+    'measure': 'pmi', # "lift" = P(i, j) / (P(i) P(j)); "pmi" = log(lift)
+    'min_support': 2, # cestas em comum mínimas (pares raros têm lift instável)
+}
+
+
+def iter_baskets(products_df: pd.DataFrame = None, path: str = loader.RAW_RECEIPTS, chunksize: int = 500_000):
+    """
+    Lê as notas fiscais em blocos e produz, para cada bloco, os pares únicos
+    (código da cesta, código do produto no catálogo). O código da cesta é global:
+    linhas de uma mesma nota recebem o mesmo código mesmo fora de sequência ou em
+    blocos diferentes, então o resultado não depende do `chunksize`. Linhas sem
+    produto no catálogo são ignoradas (cestas sem nenhum produto não recebem código).
+    """
+    products = products_df if products_df is not None else loader.load_derived_products()
+    catalog = {normalize_text(desc): code for code, desc in enumerate(products['DESCRICAO'])}
+    n_items = max(len(products), 1)
+    resolved = {}  # descrição bruta -> código (descrições se repetem muito entre blocos)
+    basket_codes = {}  # hash da chave CNPJ:SERIE:NUMERO_NFCE -> código global da cesta
+
+    for chunk in loader.iter_raw_receipts(path, chunksize, usecols=['DESCRICAO', 'CNPJ', 'NUMERO_NFCE', 'SERIE']):
+        for desc in pd.unique(chunk['DESCRICAO'].dropna()):
+            if desc not in resolved:
+                resolved[desc] = catalog.get(normalize_text(desc))
+        items = chunk['DESCRICAO'].map(resolved).to_numpy(dtype=float)
+        known = ~np.isnan(items)
+        if not known.any():
+            continue
+
+        basket = (chunk['CNPJ'].fillna('') + ':' + chunk['SERIE'].fillna('') + ':' + chunk['NUMERO_NFCE'].fillna(''))
+        hashes = pd.util.hash_array(basket.to_numpy(dtype=object)[known])
+        local, uniques = pd.factorize(hashes)
+        codes = np.fromiter((basket_codes.setdefault(h, len(basket_codes)) for h in uniques), dtype=np.int64, count=len(uniques))
+
+        pairs = np.unique(codes[local] * n_items + items[known].astype(np.int64))
+        yield pairs // n_items, pairs % n_items
+
+
+def receipts_signature(path: str = loader.RAW_RECEIPTS) -> str:
+    """Tamanho e data de modificação das notas (evita reler o arquivo só para saber se mudou)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+class BoughtTogetherIndex:
+    """
+    Parceiros de compra de cada produto, em formato CSR.
+
+    - item_ids: IDs dos produtos (códigos = posição no catálogo)
+    - indptr / indices / scores / support: top-K parceiros de cada produto, em ordem
+      decrescente de associação, com o nº de cestas em comum
+    - item_counts / n_baskets: cestas com cada produto e total de cestas lidas
+    """
+
+    ARTIFACT_NAME = "bought_together"
+
+    def __init__(self, products_df: pd.DataFrame = None, params: dict = None, receipts_path: str = loader.RAW_RECEIPTS):
+        products = products_df if products_df is not None else loader.load_derived_products()
+        products = products.dropna(subset=['ID']).copy()
+        products['ID'] = products['ID'].astype(str)
+        self.products_df = products.drop_duplicates(subset=['ID']).reset_index(drop=True)
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        if self.params['measure'] not in MEASURES:
+            raise ValueError(f"Medida de associação inválida: {self.params['measure']}. Use uma de {MEASURES}.")
+        self.receipts_path = receipts_path
+        self.item_ids = self.products_df['ID'].to_numpy(dtype=object)
+        self.item_index = {iid: i for i, iid in enumerate(self.item_ids)}
+        self.indptr = None
+        self.indices = None
+        self.scores = None
+        self.support = None
+        self.item_counts = None
+        self.n_baskets = 0
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_ids)
+
+    @property
+    def fingerprint(self) -> str:
+        """Impressão digital do catálogo, das notas e dos parâmetros (versiona o índice salvo)."""
+        columns = self.products_df[['ID', 'DESCRICAO']].astype(str)
+        digest = hashlib.sha1()
+        digest.update(pd.util.hash_pandas_object(columns, index=False).values.tobytes())
+        digest.update(receipts_signature(self.receipts_path).encode())
+        digest.update(json.dumps(self.params, sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+
+    # --- Construção ---
+
+    def build(self, chunksize: int = 500_000):
+        """Lê as cestas em blocos, conta a co-ocorrência e guarda só os K melhores parceiros de cada produto."""
+        n = self.n_items
+        chunks = list(iter_baskets(self.products_df, self.receipts_path, chunksize))
+        if chunks:
+            # Uma nota pode aparecer em mais de um bloco: junta os pares antes de contar
+            pairs = np.unique(np.concatenate([baskets * n + items for baskets, items in chunks]))
+            baskets, items = pairs // n, pairs % n
+        else:
+            baskets = items = np.empty(0, dtype=np.int64)
+        n_baskets = int(baskets.max()) + 1 if len(baskets) else 0
+
+        # Cesta × produto binária; (B^T B)_ij = cestas com i e j (a diagonal conta as cestas de cada produto)
+        basket_items = sp.csr_matrix((np.ones(len(items)), (baskets, items)), shape=(n_baskets, n))
+        counts = (basket_items.T @ basket_items).tocsr()
+
+        self.item_counts = counts.diagonal().astype(np.int64)
+        self.n_baskets = n_baskets
+        self._select_partners(counts.tocoo())
+        print(f"Índice 'comprados juntos': {n_baskets} cestas, {len(self.indices)} pares guardados.")
+
+    def _select_partners(self, counts: sp.coo_matrix):
+        """Normaliza os pares por lift/PMI e mantém, por produto, os K de maior associação positiva."""
+        rows, cols, support = counts.row, counts.col, counts.data
+        keep = (rows != cols) & (support >= self.params['min_support'])
+        rows, cols, support = rows[keep], cols[keep], support[keep]
+
+        lift = support * self.n_baskets / (self.item_counts[rows] * self.item_counts[cols])
+        positive = lift > 1.0 # só pares que aparecem juntos mais do que o acaso
+        rows, cols, support, lift = rows[positive], cols[positive], support[positive], lift[positive]
+        scores = lift if self.params['measure'] == 'lift' else np.log(lift)
+
+        # Ordena por produto e, dentro dele, por associação (desempate pelo suporte) e corta no top-K
+        order = np.lexsort((-support, -scores, rows))
+        rows, cols, support, scores = rows[order], cols[order], support[order], scores[order]
+        starts = np.searchsorted(rows, np.arange(self.n_items))
+        rank = np.arange(len(rows)) - starts[rows]
+        top = rank < self.params['top_k']
+
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[top], minlength=self.n_items)))).astype(np.int64)
+        self.indices = cols[top].astype(np.int32)
+        self.scores = scores[top].astype(np.float32)
+        self.support = support[top].astype(np.int32)
+
+    def _artifact_path(self, models_dir: str) -> str:
+        return os.path.join(models_dir, f"{self.ARTIFACT_NAME}_{self.fingerprint}.npz")
+
+    def save(self, models_dir: str = MODELS_DIR) -> str:
+        """Grava o índice em `bought_together_<impressão digital>.npz` (escrita atômica) e remove versões antigas."""
+        os.makedirs(models_dir, exist_ok=True)
+        path = self._artifact_path(models_dir)
+        meta = json.dumps({"format_version": COOCCURRENCE_FORMAT_VERSION, "params": self.params,
+                           "n_baskets": self.n_baskets, "created_at": datetime.now().isoformat(timespec="seconds")})
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(meta), item_ids=np.asarray(self.item_ids, dtype=str),
+                 indptr=self.indptr, indices=self.indices, scores=self.scores, support=self.support,
+                 item_counts=self.item_counts)
+        os.replace(tmp_path, path)
+
+        prefix = f"{self.ARTIFACT_NAME}_"
+        for name in os.listdir(models_dir):
+            old = os.path.join(models_dir, name)
+            if name.startswith(prefix) and name.endswith(".npz") and old != path:
+                os.remove(old)
+        return path
+
+    def load(self, models_dir: str = MODELS_DIR) -> bool:
+        """Carrega o índice salvo para o catálogo e as notas atuais. Retorna False se não existe ou é de outra versão."""
+        path = self._artifact_path(models_dir)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("format_version") != COOCCURRENCE_FORMAT_VERSION:
+                    return False
+                if not np.array_equal(data["item_ids"], np.asarray(self.item_ids, dtype=str)):
+                    return False
+                self.indptr = data["indptr"]
+                self.indices = data["indices"]
+                self.scores = data["scores"]
+                self.support = data["support"]
+                self.item_counts = data["item_counts"]
+                self.n_baskets = meta["n_baskets"]
+        except (OSError, ValueError, KeyError):
+            return False
+        return True
+
+    def load_or_build(self, models_dir: str = MODELS_DIR) -> str:
+        """Reaproveita o índice salvo se catálogo e notas não mudaram; senão constrói e salva. Retorna a origem."""
+        if self.load(models_dir):
+            print(f"Índice 'comprados juntos' carregado do disco ({self.n_items} produtos).")
+            return "artifact"
+        self.build()
+        self.save(models_dir)
+        return "built"
+
+    # --- Consultas ---
+
+    def partners(self, item_id, n: int = 10):
+        """Produtos mais comprados junto com `item_id`, ou None se o produto não está no catálogo."""
+        code = self.item_index.get(str(item_id))
+        if code is None:
+            return None
+        start = self.indptr[code]
+        stop = min(self.indptr[code + 1], start + n)
+        return [{'id': self.item_ids[c], 'score': float(s), 'support': int(k)}
+                for c, s, k in zip(self.indices[start:stop], self.scores[start:stop], self.support[start:stop])]
+
+    def complete_basket(self, item_ids: list, n: int = 5) -> list:
+        """
+        Sugestões para completar uma cesta parcial: soma das associações dos parceiros
+        de cada item da cesta (itens fora do catálogo são ignorados), sem repetir itens da cesta.
+        """
+        codes = np.unique([self.item_index[str(iid)] for iid in item_ids if str(iid) in self.item_index]).astype(np.int64)
+        if len(codes) == 0 or n <= 0:
+            return []
+        starts, stops = self.indptr[codes], self.indptr[codes + 1]
+        lengths = stops - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        candidates, inverse = np.unique(self.indices[positions], return_inverse=True)
+        scores = np.bincount(inverse, weights=self.scores[positions], minlength=len(candidates))
+        support = np.bincount(inverse, weights=self.support[positions], minlength=len(candidates))
+
+        outside = ~np.isin(candidates, codes)
+        candidates, scores, support = candidates[outside], scores[outside], support[outside]
+        order = np.lexsort((-support, -scores))[:n]
+        return [{'id': self.item_ids[candidates[i]], 'score': float(scores[i]), 'support': int(support[i])}
+                for i in order]
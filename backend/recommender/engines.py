@@ -0,0 +1,24 @@
+"""
+engines.py
+----------
+Registro dos motores de recomendação colaborativa disponíveis. A API escolhe
+o motor pelo nome (variável de ambiente RECOMMENDER_ENGINE).
+"""
+
+from backend.recommender.collaborative import CollaborativeFilteringRecommender
+from backend.recommender.als import ALSRecommender
+from backend.recommender.bpr import BPRRecommender
+
+ENGINES = {
+    "svdpp": CollaborativeFilteringRecommender,
+    "als": ALSRecommender,
+    "bpr": BPRRecommender,
+}
+
+
+def get_engine(name: str):
+    """Retorna a classe do motor pelo nome (ex.: "svdpp", "als")."""
+    engine = ENGINES.get(name)
+    if engine is None:
+        raise ValueError(f"Motor de recomendação inválido: {name}. Use um de {tuple(ENGINES)}.")
+    return engine
@@ -0,0 +1,203 @@
+"""
+evaluation.py
+-------------
+Avaliação offline de toda a população: uma única divisão treino/teste global
+(hold-out por usuário ou k-fold), um treino por fold e a pontuação vetorizada de
+todos os usuários de teste de uma vez. Os folds rodam em paralelo num pool de
+processos e o resultado é um relatório JSON com médias por métrica e tempos.
+"""
+
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from backend.recommender import metrics, tuning
+from backend.recommender.engines import get_engine
+
+REPORTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'reports'))
+
+SCHEMES = ("holdout", "kfold")
+LIKE_THRESHOLD = 3 # Nota mínima para o item contar como relevante no gabarito (mesmo critério de `precision_report`)
+SCORE_BLOCK_SIZE = 1024 # Usuários pontuados por vez (limita a matriz usuários × itens em memória)
+
+
+def split_ratings(ratings_df: pd.DataFrame, scheme: str = "holdout", test_fraction: float = 0.2,
+                  n_folds: int = 5, random_state: int = 42) -> list:
+    """
+    Divide as avaliações uma única vez para toda a população.
+    - holdout: separa `test_fraction` das avaliações de cada usuário (ao menos uma) para teste;
+    - kfold: distribui as avaliações de cada usuário em `n_folds` partes e cada parte é o teste de um fold.
+    Usuários com uma única avaliação ficam sempre no treino.
+
+    Returns:
+        Lista de máscaras booleanas de teste (uma por fold), alinhadas às linhas de `ratings_df`.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Esquema de divisão inválido: {scheme}. Use um de {SCHEMES}.")
+    if scheme == "kfold" and n_folds < 2:
+        raise ValueError("O k-fold exige ao menos 2 folds.")
+    if scheme == "holdout" and not 0 < test_fraction < 1:
+        raise ValueError("A fração de teste deve estar entre 0 e 1.")
+
+    rng = np.random.default_rng(random_state)
+    user_codes = pd.factorize(ratings_df['CPF_CLIENTE'])[0]
+    counts = np.bincount(user_codes)
+
+    # Posição (aleatória) de cada avaliação dentro do histórico do seu usuário
+    order = np.lexsort((rng.random(len(user_codes)), user_codes))
+    starts = np.concatenate(([0], np.cumsum(counts)))[:-1]
+    position = np.empty(len(user_codes), dtype=np.int64)
+    position[order] = np.arange(len(user_codes)) - starts[user_codes[order]]
+    eligible = counts[user_codes] >= 2
+
+    if scheme == "holdout":
+        n_test = np.maximum(1, np.floor(counts * test_fraction)).astype(np.int64)
+        return [eligible & (position < n_test[user_codes])]
+
+    # A parte de cada avaliação é deslocada por usuário para não concentrar os usuários pequenos no fold 0
+    offset = rng.integers(0, n_folds, len(counts))
+    fold = (position + offset[user_codes]) % n_folds
+    return [eligible & (fold == k) for k in range(n_folds)]
+
+
+def default_params(engine: str) -> dict:
+    """Parâmetros usados quando nenhum é informado: o último ajuste do SVD++ ou os padrões do motor."""
+    engine_cls = get_engine(engine)
+    if hasattr(engine_cls, "DEFAULT_PARAMS"):
+        return dict(engine_cls.DEFAULT_PARAMS)
+    history = tuning.load_history()
+    if history:
+        return dict(history[-1]["params"])
+    if os.path.exists(tuning.PARAMS_FILE):
+        with open(tuning.PARAMS_FILE, 'r') as f:
+            return json.load(f)
+    return dict(tuning.FALLBACK_PARAMS)
+
+
+def evaluate_fold(engine: str, train_df: pd.DataFrame, test_df: pd.DataFrame, params: dict,
+                  k: int = 10, like_threshold: float = LIKE_THRESHOLD) -> dict:
+    """
+    Treina o motor uma vez com `train_df` e avalia todos os usuários de `test_df`.
+    Ranking (precision, recall, NDCG, MAP, hit rate e cobertura): top-K de cada usuário
+    (itens do treino excluídos) contra os itens de teste com nota ≥ `like_threshold`;
+    notas: RMSE/MAE dos pares de teste com usuário e item conhecidos.
+    """
+    timings = {}
+    started = time.perf_counter()
+    model = get_engine(engine)(train_df)
+    model.best_params = dict(params)
+    model.train()
+    timings["train_seconds"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scorer = model.scorer
+    test_df = test_df.copy()
+    test_df['RATING_DESCRICAO'] = pd.to_numeric(test_df['RATING_DESCRICAO'], errors='coerce')
+    test_df = test_df.dropna(subset=['RATING_DESCRICAO'])
+    user_codes = test_df['CPF_CLIENTE'].map(scorer.user_index).fillna(-1).to_numpy(dtype=np.int64)
+    item_codes = test_df['ID_PRODUTO'].map(scorer.item_index).fillna(-1).to_numpy(dtype=np.int64)
+    ratings = test_df['RATING_DESCRICAO'].to_numpy(dtype=np.float64)
+    known = (user_codes >= 0) & (item_codes >= 0)
+
+    # Gabarito: itens relevantes de cada usuário de teste (linhas = usuários avaliados, na ordem de `eval_users`)
+    relevant = known & (ratings >= like_threshold)
+    eval_users, rows = np.unique(user_codes[relevant], return_inverse=True)
+    truth_indptr, truth_indices = metrics.ground_truth_csr(rows, item_codes[relevant], len(eval_users))
+
+    recommended = np.full((len(eval_users), k), -1, dtype=np.int64)
+    for start in range(0, len(eval_users), SCORE_BLOCK_SIZE):
+        block = eval_users[start:start + SCORE_BLOCK_SIZE]
+        scores = scorer.mask_seen(scorer.score_users(block), block)
+        codes, top_scores = scorer.top_n_rows(scores, k)
+        recommended[start:start + len(block), :codes.shape[1]] = np.where(np.isfinite(top_scores), codes, -1)
+    summary = metrics.ranking_summary(recommended, (truth_indptr, truth_indices), k, n_items=scorer.n_items)
+
+    result = {
+        "n_train": int(len(train_df)),
+        "n_test": int(len(test_df)),
+        "n_users_evaluated": summary.pop("n_users_evaluated"),
+        **summary,
+    }
+
+    # Notas previstas só fazem sentido para motores de notas explícitas (o BPR só ordena)
+    if scorer.rating_scale is not None and known.any():
+        predicted = scorer.predict_pairs(user_codes[known], item_codes[known])
+        result["rmse"] = metrics.rmse(predicted, ratings[known])
+        result["mae"] = metrics.mae(predicted, ratings[known])
+    timings["score_seconds"] = time.perf_counter() - started
+
+    result["timings"] = timings
+    return result
+
+
+def _summarize(folds: list) -> dict:
+    """Média, desvio-padrão, mínimo e máximo de cada métrica entre os folds."""
+    summary = {}
+    names = list(dict.fromkeys(name for f in folds for name, value in f.items() if isinstance(value, float)))
+    for name in names:
+        values = np.array([f[name] for f in folds if f.get(name) is not None], dtype=np.float64)
+        if len(values):
+            summary[name] = {"mean": float(values.mean()), "std": float(values.std()),
+                             "min": float(values.min()), "max": float(values.max())}
+    return summary
+
+
+def run_evaluation(ratings_df: pd.DataFrame, engine: str = "svdpp", scheme: str = "holdout", k: int = 10,
+                   test_fraction: float = 0.2, n_folds: int = 5, params: dict = None,
+                   n_workers: int = None, random_state: int = 42) -> dict:
+    """
+    Executa a avaliação completa e retorna o relatório (configuração, métricas agregadas,
+    resultados por fold e tempos). Os folds são distribuídos entre `n_workers` processos.
+    """
+    get_engine(engine) # valida o nome antes de dividir os dados
+    params = dict(params) if params else default_params(engine)
+    started = time.perf_counter()
+
+    ratings_df = ratings_df.reset_index(drop=True)
+    test_masks = split_ratings(ratings_df, scheme, test_fraction, n_folds, random_state)
+    split_seconds = time.perf_counter() - started
+
+    jobs = [(engine, ratings_df[~mask], ratings_df[mask], params, k) for mask in test_masks]
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(jobs)))
+    print(f"Avaliando o motor {engine} ({scheme}, {len(jobs)} fold(s), K={k}) com {n_workers} processo(s)...")
+
+    if n_workers == 1:
+        folds = [evaluate_fold(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            folds = list(pool.map(evaluate_fold, *zip(*jobs)))
+
+    return {
+        "engine": engine,
+        "scheme": scheme,
+        "k": k,
+        "test_fraction": test_fraction if scheme == "holdout" else None,
+        "n_folds": len(jobs),
+        "params": params,
+        "like_threshold": LIKE_THRESHOLD,
+        "n_ratings": int(len(ratings_df)),
+        "n_users": int(ratings_df['CPF_CLIENTE'].nunique()),
+        "n_items": int(ratings_df['ID_PRODUTO'].nunique()),
+        "metrics": _summarize(folds),
+        "folds": folds,
+        "timings": {
+            "split_seconds": split_seconds,
+            "total_seconds": time.perf_counter() - started,
+            "n_workers": n_workers,
+        },
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def save_report(report: dict, path: str = None) -> str:
+    """Grava o relatório em JSON (padrão: data/reports/evaluation_<motor>_<data>.json)."""
+    if path is None:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(REPORTS_DIR, f"evaluation_{report['engine']}_{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return path
@@ -1 +1,298 @@
-# Hybrid recommendation (collaborative + content)
\ No newline at end of file
+"""
+hybrid.py
+---------
+Recomendador híbrido em dois estágios sobre um motor colaborativo e o motor de
+conteúdo. No primeiro estágio, algumas centenas de candidatos saem de fontes baratas:
+a linha do usuário na tabela top-N do modelo latente, os vizinhos de conteúdo dos
+itens que ele avaliou e o ranking de popularidade. No segundo, apenas esses candidatos
+são re-ranqueados por uma mistura vetorizada dos três sinais (normalizados para
+[0, 1]). O peso do sinal colaborativo cresce com o tamanho do histórico do usuário;
+clientes com poucas avaliações dependem mais de conteúdo e popularidade.
+"""
+
+import copy
+import numpy as np
+import pandas as pd
+from backend.recommender.collaborative import CollaborativeFilteringRecommender
+from backend.recommender.content import ContentRecommender
+from backend.recommender.tuning import params_key
+from backend.utils.monitoring import stage_timer
+
+# Peso de cada sinal na mistura do segundo estágio
+DEFAULT_WEIGHTS = {'latent': 1.0, 'content': 0.6, 'popularity': 0.3}
+
+# Candidatos trazidos por cada fonte no primeiro estágio
+DEFAULT_CANDIDATES = {'latent': 100, 'content': 100, 'popularity': 50}
+
+# Histórico (nº de avaliações) em que os sinais colaborativo e de conteúdo/popularidade pesam igual
+HISTORY_PIVOT = 10
+
+
+def _rescale(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Min-max dos valores válidos para [0, 1]; inválidos (e sinais constantes) ficam em 0."""
+    result = np.zeros(len(values))
+    if not valid.any():
+        return result
+    low, high = values[valid].min(), values[valid].max()
+    if high > low:
+        result[valid] = (values[valid] - low) / (high - low)
+    return result
+
+
+class HybridRecommender:
+    """
+    Combina um motor colaborativo (`engine`, padrão SVD++) e o `ContentRecommender`.
+    Expõe a mesma interface dos motores colaborativos (treino, `update`, recomendação
+    e avaliação), então a API e o `BackgroundRetrainer` o usam no lugar do modelo puro.
+
+    - weights: pesos dos sinais 'latent', 'content' e 'popularity'
+    - candidates: candidatos de cada fonte no primeiro estágio
+    - history_pivot: confiança no sinal colaborativo = h / (h + history_pivot), h = avaliações do usuário
+    """
+
+    # O fold-in re-estima só o vetor latente do usuário: avaliaria o motor colaborativo, não a mistura servida
+    EVALUATION_METHODS = ("retrain",)
+
+    def __init__(self, ratings_df: pd.DataFrame, engine=CollaborativeFilteringRecommender,
+                 products_df: pd.DataFrame = None, weights: dict = None, candidates: dict = None,
+                 history_pivot: float = HISTORY_PIVOT, content: ContentRecommender = None):
+        self.collaborative = engine(ratings_df)
+        self.content = content if content is not None else ContentRecommender(products_df)
+        unknown = set(weights or {}) | set(candidates or {})
+        unknown -= set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Fontes inválidas: {sorted(unknown)}. Use {list(DEFAULT_WEIGHTS)}.")
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.candidates = {**DEFAULT_CANDIDATES, **(candidates or {})}
+        if history_pivot <= 0:
+            raise ValueError("history_pivot deve ser maior que zero.")
+        self.history_pivot = history_pivot
+        self._catalog_to_index = None # código no índice de avaliações de cada item do catálogo (-1 = sem avaliações)
+
+    # --- Atributos lidos pela API, pelo registro e pelo cache de acurácia ---
+
+    @property
+    def SUPPORTS_INCREMENTAL(self) -> bool:
+        # Só aceita `update()` se o motor colaborativo aceita (o BPR, por exemplo, não)
+        return self.collaborative.SUPPORTS_INCREMENTAL
+
+    @property
+    def ARTIFACT_NAME(self) -> str:
+        # Inclui a configuração da mistura: relatórios de acurácia em cache dependem dela
+        blend = {'weights': self.weights, 'candidates': self.candidates, 'history_pivot': self.history_pivot}
+        return f"hybrid_{self.collaborative.ARTIFACT_NAME}_{params_key(blend)}"
+
+    @property
+    def ratings_df(self) -> pd.DataFrame:
+        return self.collaborative.ratings_df
+
+    @property
+    def index(self):
+        return self.collaborative.index
+
+    @property
+    def scorer(self):
+        return self.collaborative.scorer
+
+    @property
+    def popularity(self):
+        return self.collaborative.popularity
+
+    @property
+    def data_version(self):
+        return self.collaborative.data_version
+
+    @data_version.setter
+    def data_version(self, value):
+        self.collaborative.data_version = value
+
+    @property
+    def best_params(self) -> dict:
+        return self.collaborative.best_params
+
+    @best_params.setter
+    def best_params(self, value: dict):
+        self.collaborative.best_params = value
+
+    @property
+    def top_n_size(self) -> int:
+        return self.collaborative.top_n_size
+
+    @top_n_size.setter
+    def top_n_size(self, value: int):
+        # A tabela top-N do motor colaborativo é a fonte latente de candidatos: precisa ter ao menos esse tamanho
+        self.collaborative.top_n_size = max(value, self.candidates['latent']) if value > 0 else 0
+
+    # --- Ciclo de vida ---
+
+    def prepare_ratings(self):
+        self.collaborative.prepare_ratings()
+
+    def load_or_train(self) -> str:
+        """Carrega ou treina o motor colaborativo e a tabela de vizinhos de conteúdo. Retorna a origem do colaborativo."""
+        source = self.collaborative.load_or_train()
+        self._attach_content()
+        return source
+
+    def train(self):
+        self.collaborative.train()
+        self._attach_content()
+
+    def _attach_content(self):
+        """Garante a tabela de vizinhos e aponta o motor de conteúdo para o índice do colaborativo."""
+        if self.content.neighbor_indptr is None:
+            self.content.load_or_build()
+        self.content.use_index(self.collaborative.index, self.collaborative.popularity)
+        catalog = self.content.catalog_codes(np.arange(self.collaborative.index.n_items))
+        in_catalog = np.flatnonzero(catalog >= 0)
+        self._catalog_to_index = np.full(self.content.n_items, -1, dtype=np.int64)
+        self._catalog_to_index[catalog[in_catalog]] = in_catalog
+
+    def update(self, new_ratings: pd.DataFrame, n_passes: int = 10) -> dict:
+        """
+        Atualização incremental: o motor colaborativo é copiado antes de `update()` (o registro
+        copia só o híbrido, de forma rasa) e o motor de conteúdo passa a usar o índice novo.
+        """
+        if not self.SUPPORTS_INCREMENTAL:
+            raise ValueError(f"O motor {type(self.collaborative).__name__} não aceita atualização incremental.")
+        self.collaborative = copy.copy(self.collaborative)
+        info = self.collaborative.update(new_ratings, n_passes=n_passes)
+        self.content = copy.copy(self.content)
+        self._attach_content()
+        return info
+
+    def user_history(self, user_cpf: str) -> pd.DataFrame:
+        return self.collaborative.user_history(user_cpf)
+
+    def evaluate_accuracy(self, user_cpf: str, method: str = "retrain"):
+        """
+        Mesma metodologia do motor colaborativo, apenas por re-treino: o modelo temporário
+        é um híbrido completo (reaproveita a tabela de vizinhos).
+        """
+        if method not in self.EVALUATION_METHODS:
+            raise ValueError(f"Método de avaliação inválido para o modelo híbrido: {method}. "
+                             f"Use um de {self.EVALUATION_METHODS}.")
+        return self.collaborative.evaluate_accuracy(user_cpf, method, model_factory=self._evaluation_model)
+
+    def _evaluation_model(self, ratings_df: pd.DataFrame):
+        temp = HybridRecommender(ratings_df, engine=type(self.collaborative), weights=self.weights,
+                                 candidates=self.candidates, history_pivot=self.history_pivot,
+                                 content=copy.copy(self.content))
+        temp.best_params = self.best_params
+        temp.train()
+        return temp
+
+    # --- Estágio 1: candidatos ---
+
+    def _latent_candidates(self, u: int, seen_codes: np.ndarray) -> np.ndarray:
+        """Linha do usuário na tabela top-N; sem linha válida (ex.: após `update`), pontua o catálogo."""
+        n = self.candidates['latent']
+        if u < 0 or n <= 0:
+            return np.empty(0, dtype=np.int64)
+        table = self.collaborative.topn_table
+        found = table.row(u, n) if table is not None else None
+        if found is not None and len(found[0]):
+            return found[0].astype(np.int64)
+        top_codes, _ = self.scorer.top_n(self.scorer.score(self.index.user_ids[u]), n, exclude=seen_codes)
+        return np.asarray(top_codes, dtype=np.int64)
+
+    def _content_candidates(self, seen_codes: np.ndarray, seen_ratings: np.ndarray) -> tuple:
+        """Vizinhos de conteúdo do histórico: (códigos do catálogo, scores), só os de score positivo."""
+        n = self.candidates['content']
+        catalog = self.content.catalog_codes(seen_codes)
+        known = catalog >= 0
+        if n <= 0 or not known.any():
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        codes, scores = self.content.score_neighbors(catalog[known], seen_ratings[known])
+        keep = scores > 0
+        codes, scores = codes[keep], scores[keep]
+        if len(codes) > n:
+            top = np.argpartition(-scores, n - 1)[:n]
+            codes, scores = codes[top], scores[top]
+        return codes, scores
+
+    def _popular_candidates(self, seen_items) -> np.ndarray:
+        n = self.candidates['popularity']
+        if n <= 0 or self.popularity is None:
+            return np.empty(0, dtype=np.int64)
+        ids = self.popularity.top(n, exclude=set(seen_items))
+        return np.array([self.index.item_index[iid] for iid in ids if iid in self.index.item_index], dtype=np.int64)
+
+    def _gather(self, user_cpf: str) -> tuple:
+        """
+        Une as três fontes num único array de candidatos. Cada candidato é identificado pelo
+        código no índice de avaliações ou, para produtos só do catálogo, por n_itens + código do catálogo.
+        Retorna (u, seen_codes, chaves, score de conteúdo por candidato).
+        """
+        index = self.index
+        u = index.user_code(user_cpf)
+        seen_codes = index.user_items(u).astype(np.int64) if u >= 0 else np.empty(0, dtype=np.int64)
+        seen_ratings = index.user_ratings(u) if u >= 0 else np.empty(0)
+
+        latent = self._latent_candidates(u, seen_codes)
+        content_codes, content_scores = self._content_candidates(seen_codes, seen_ratings)
+        popular = self._popular_candidates(index.item_ids[seen_codes])
+
+        mapped = self._catalog_to_index[content_codes]
+        content_keys = np.where(mapped >= 0, mapped, index.n_items + content_codes)
+        keys = np.unique(np.concatenate([latent, content_keys, popular]))
+        keys = keys[~np.isin(keys, seen_codes)]
+
+        content = np.zeros(len(keys))
+        kept = np.isin(content_keys, keys)
+        content[np.searchsorted(keys, content_keys[kept])] = content_scores[kept]
+        return u, seen_codes, keys, content
+
+    # --- Estágio 2: re-ranqueamento ---
+
+    def history_weight(self, n_ratings: int) -> float:
+        """Confiança no sinal colaborativo para um histórico de `n_ratings` avaliações."""
+        return n_ratings / (n_ratings + self.history_pivot)
+
+    def _rank(self, u: int, n_history: int, keys: np.ndarray, content: np.ndarray) -> np.ndarray:
+        """Score misturado de cada candidato (todos os sinais calculados só sobre os candidatos)."""
+        in_index = keys < self.index.n_items
+        codes = keys[in_index]
+
+        latent = np.zeros(len(keys))
+        if u >= 0 and len(codes):
+            latent[in_index] = self.scorer.predict_pairs(np.full(len(codes), u), codes)
+        popularity = np.zeros(len(keys))
+        if len(codes):
+            popularity[in_index] = self.popularity.scores(
+                [self.popularity.item_index[iid] for iid in self.index.item_ids[codes]])
+
+        alpha = self.history_weight(n_history)
+        w = self.weights
+        return (alpha * w['latent'] * _rescale(latent, in_index & (u >= 0))
+                + (1 - alpha) * w['content'] * _rescale(np.maximum(content, 0), content > 0)
+                + (1 - alpha) * w['popularity'] * _rescale(popularity, in_index))
+
+    def _item_id(self, key: int):
+        n_items = self.index.n_items
+        return self.index.item_ids[key] if key < n_items else self.content.item_ids[key - n_items]
+
+    def recommend_items(self, user_cpf: str, n_recommendations: int = 5) -> list:
+        """
+        Gera recomendações para um usuário: candidatos das três fontes e re-ranqueamento
+        pela mistura ponderada. Completa com os fallbacks do motor colaborativo se faltar item.
+        """
+        if self.scorer is None:
+            return []
+
+        with stage_timer("hybrid_candidates"):
+            u, seen_codes, keys, content = self._gather(user_cpf)
+        with stage_timer("hybrid_rerank"):
+            blended = self._rank(u, len(seen_codes), keys, content)
+            order = np.argsort(-blended, kind="stable")[:n_recommendations]
+            recommended = [{'id': self._item_id(keys[i]), 'score': float(blended[i])} for i in order]
+
+        if len(recommended) < n_recommendations:
+            with stage_timer("fallback"):
+                self.collaborative._fill_fallbacks(recommended, n_recommendations, u, seen_codes,
+                                                   self.index.item_ids[seen_codes])
+        return recommended[:n_recommendations]
+
+    def recommend_batch(self, user_cpfs: list, n_recommendations: int = 5) -> dict:
+        """Recomendações para vários usuários (o re-ranqueamento já é barato por usuário)."""
+        return {cpf: self.recommend_items(cpf, n_recommendations) for cpf in dict.fromkeys(user_cpfs)}
@@ -0,0 +1,142 @@
+"""
+index.py
+--------
+Índice das avaliações por usuário. Codifica CPFs e IDs de produtos como
+inteiros densos (int32) e guarda, em formato CSR, os itens e notas de cada
+usuário, para que buscas por histórico custem O(histórico do usuário).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class RatingsIndex:
+    """
+    Estrutura CSR usuário → itens/notas construída uma única vez por treino.
+
+    - user_ids / item_ids: valores originais (CPF_CLIENTE / ID_PRODUTO) por código
+    - indptr: início/fim do bloco de cada usuário
+    - indices: códigos dos itens avaliados (int32)
+    - ratings: notas correspondentes
+    - rows: posição de cada avaliação no DataFrame original
+    """
+
+    def __init__(self, user_ids, item_ids, indptr, indices, ratings, rows):
+        self.user_ids = np.asarray(user_ids, dtype=object)
+        self.item_ids = np.asarray(item_ids, dtype=object)
+        self.user_index = {uid: u for u, uid in enumerate(self.user_ids)}
+        self.item_index = {iid: i for i, iid in enumerate(self.item_ids)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.ratings = np.asarray(ratings, dtype=np.float64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+
+    @classmethod
+    def from_ratings(cls, ratings_df: pd.DataFrame):
+        """
+        Constrói o índice a partir do DataFrame de avaliações. Os códigos seguem a
+        ordem de primeira aparição (a mesma usada pelo Surprise) e, dentro de cada
+        usuário, as avaliações mantêm a ordem original do DataFrame.
+        """
+        user_codes, user_ids = pd.factorize(ratings_df['CPF_CLIENTE'])
+        item_codes, item_ids = pd.factorize(ratings_df['ID_PRODUTO'])
+
+        order = np.argsort(user_codes, kind="stable")
+        counts = np.bincount(user_codes, minlength=len(user_ids))
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+
+        return cls(
+            user_ids=user_ids.tolist(),
+            item_ids=item_ids.tolist(),
+            indptr=indptr,
+            indices=item_codes[order].astype(np.int32),
+            ratings=ratings_df['RATING_DESCRICAO'].to_numpy(dtype=np.float64)[order],
+            rows=order,
+        )
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_ids)
+
+    @property
+    def n_ratings(self) -> int:
+        return len(self.indices)
+
+    def user_code(self, user_id) -> int:
+        """Código do usuário, ou -1 se ele não possui avaliações."""
+        return self.user_index.get(user_id, -1)
+
+    def user_items(self, u: int) -> np.ndarray:
+        """Códigos dos itens avaliados pelo usuário `u`."""
+        return self.indices[self.indptr[u]:self.indptr[u + 1]]
+
+    def user_ratings(self, u: int) -> np.ndarray:
+        """Notas dadas pelo usuário `u`, alinhadas com `user_items`."""
+        return self.ratings[self.indptr[u]:self.indptr[u + 1]]
+
+    def user_rows(self, u: int) -> np.ndarray:
+        """Posições das avaliações do usuário `u` no DataFrame original."""
+        return self.rows[self.indptr[u]:self.indptr[u + 1]]
+
+    def find(self, u: int, i: int) -> int:
+        """Posição (no CSR) da avaliação do usuário `u` para o item `i`, ou -1."""
+        if u < 0 or u >= self.n_users:
+            return -1
+        hit = np.flatnonzero(self.user_items(u) == i)
+        return int(self.indptr[u] + hit[0]) if len(hit) else -1
+
+    def with_ratings(self, user_ids, item_ids, ratings, rows):
+        """
+        Retorna um novo índice com as avaliações acrescentadas, sem reconstruí-lo do zero
+        (o índice atual não é alterado). Pares já existentes têm a nota substituída; os
+        demais entram no fim do bloco do usuário. CPFs e produtos novos recebem os próximos
+        códigos, na mesma ordem que `from_ratings` atribuiria. `rows` são as posições das
+        avaliações no DataFrame.
+
+        Retorna (índice, códigos dos usuários, códigos dos itens).
+        """
+        all_users, all_items = list(self.user_ids), list(self.item_ids)
+        user_index, item_index = dict(self.user_index), dict(self.item_index)
+
+        def encode(value, ids, mapping):
+            code = mapping.get(value)
+            if code is None:
+                code = mapping[value] = len(ids)
+                ids.append(value)
+            return code
+
+        user_codes = np.array([encode(uid, all_users, user_index) for uid in user_ids], dtype=np.int64)
+        item_codes = np.array([encode(iid, all_items, item_index) for iid in item_ids], dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        rows = np.asarray(rows, dtype=np.int64)
+
+        # Reavaliações: substitui a nota na posição existente
+        new_ratings = self.ratings.copy()
+        positions = np.array([self.find(u, i) for u, i in zip(user_codes, item_codes)], dtype=np.int64)
+        existing = positions >= 0
+        new_ratings[positions[existing]] = ratings[existing]
+
+        # Pares novos: inseridos no fim do bloco de cada usuário (usuários novos vão para o fim)
+        added = np.flatnonzero(~existing)
+        added = added[np.argsort(user_codes[added], kind="stable")]
+        added_users = user_codes[added]
+        insert_at = np.where(added_users < self.n_users,
+                             self.indptr[np.minimum(added_users + 1, self.n_users)], len(self.indices))
+
+        counts = np.zeros(len(all_users), dtype=np.int64)
+        counts[:self.n_users] = np.diff(self.indptr)
+        counts += np.bincount(added_users, minlength=len(all_users))
+
+        index = RatingsIndex(
+            user_ids=all_users,
+            item_ids=all_items,
+            indptr=np.concatenate(([0], np.cumsum(counts))),
+            indices=np.insert(self.indices, insert_at, item_codes[added]),
+            ratings=np.insert(new_ratings, insert_at, ratings[added]),
+            rows=np.insert(self.rows, insert_at, rows[added]),
+        )
+        return index, user_codes, item_codes
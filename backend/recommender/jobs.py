@@ -0,0 +1,108 @@
+"""
+jobs.py
+-------
+Serviço de avaliação assíncrona. Executa `evaluate_accuracy` fora do caminho
+da requisição de recomendação, em um pool limitado de workers, e guarda os
+resultados por versão dos dados de avaliação. Os relatórios concluídos também vão
+para um cache persistente (LRU) que sobrevive a re-treinos e reinícios da API.
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from backend.recommender.report_cache import AccuracyReportCache, report_key
+from backend.utils.monitoring import stage_timer
+
+
+def _run_evaluation(recommender, user_cpf: str, method: str) -> dict:
+    with stage_timer("evaluation"):
+        return recommender.evaluate_accuracy(user_cpf, method)
+
+
+class EvaluationJobService:
+    """
+    Fila de jobs de avaliação de acurácia por CPF.
+
+    - `submit` enfileira um job (ou reaproveita um existente para a mesma versão dos dados)
+    - `status` consulta o andamento/resultado sem bloquear
+    - `result` aguarda o resultado (usado quando o relatório é pedido junto da recomendação)
+
+    Os jobs ficam pela chave (CPF, versão dos dados, método); quando o modelo é treinado
+    com novos dados, os jobs de versões antigas são descartados. Antes de enfileirar, o
+    `AccuracyReportCache` é consultado: o relatório só é recalculado se o histórico do
+    cliente ou a versão do modelo (motor + hiperparâmetros) mudaram.
+    """
+
+    def __init__(self, max_workers: int = 2, cache: AccuracyReportCache = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="evaluation")
+        self._lock = threading.Lock()
+        self._jobs = {}  # (cpf, data_version, method) -> Future
+        self.cache = cache
+
+    def _from_cache(self, recommender, user_cpf: str, method: str):
+        """Future já concluído com o relatório em cache, ou None (retorna também a chave do cache)."""
+        if self.cache is None:
+            return None, None
+        cache_key = report_key(recommender, user_cpf, method)
+        report = self.cache.get(cache_key)
+        if report is None:
+            return None, cache_key
+        future = Future()
+        future.set_result(report)
+        return future, cache_key
+
+    def _store(self, cache_key: str, future):
+        if future.exception() is None:
+            self.cache.put(cache_key, future.result())
+
+    def _lookup(self, recommender, user_cpf: str, method: str, submit: bool):
+        key = (user_cpf, recommender.data_version, method)
+        with self._lock:
+            future = self._jobs.get(key)
+        if future is not None:
+            return future
+
+        cached, cache_key = self._from_cache(recommender, user_cpf, method)
+        if cached is None and not submit:
+            return None
+        with self._lock:
+            future = self._jobs.get(key)
+            if future is None:
+                # Remove resultados de versões anteriores dos dados
+                self._jobs = {k: f for k, f in self._jobs.items() if k[1] == recommender.data_version}
+                future = cached or self._executor.submit(_run_evaluation, recommender, user_cpf, method)
+                if cached is None and cache_key is not None:
+                    future.add_done_callback(lambda f: self._store(cache_key, f))
+                self._jobs[key] = future
+        return future
+
+    def _get_or_submit(self, recommender, user_cpf: str, method: str):
+        return self._lookup(recommender, user_cpf, method, submit=True)
+
+    def submit(self, recommender, user_cpf: str, method: str = "retrain") -> dict:
+        """Enfileira a avaliação do usuário e retorna o estado atual do job."""
+        self._get_or_submit(recommender, user_cpf, method)
+        return self.status(recommender, user_cpf, method)
+
+    def status(self, recommender, user_cpf: str, method: str = "retrain"):
+        """Retorna o estado do job do usuário, ou None se nenhum job foi enfileirado."""
+        future = self._lookup(recommender, user_cpf, method, submit=False)
+        if future is None:
+            return None
+
+        job = {"cpf_cliente": user_cpf, "data_version": recommender.data_version, "method": method}
+        if not future.done():
+            job["status"] = "running" if future.running() else "queued"
+        elif future.exception() is not None:
+            job["status"] = "failed"
+            job["error"] = str(future.exception())
+        else:
+            job["status"] = "done"
+            job["accuracy_report"] = future.result()
+        return job
+
+    def result(self, recommender, user_cpf: str, method: str = "retrain", timeout: float = None) -> dict:
+        """Aguarda (com timeout opcional) e retorna o relatório de acurácia do usuário."""
+        return self._get_or_submit(recommender, user_cpf, method).result(timeout=timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
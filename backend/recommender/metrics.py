@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 def evaluate_precision_at_k(recommender, user_cpf: str, test_data: pd.DataFrame, training_item_ids: list, n_evaluation_recs: int = 10):
@@ -18,16 +19,31 @@ def evaluate_precision_at_k(recommender, user_cpf: str, test_data: pd.DataFrame,
     recommended_items_with_scores = recommender.recommend_items(user_cpf, n_recommendations=n_evaluation_recs)
     recommended_item_ids = [item['id'] for item in recommended_items_with_scores]
 
-    # 2. Identifica os itens que o usuário gostou no gabarito
+    return precision_report(recommended_item_ids, test_data, training_item_ids)
+
+
+def precision_report(recommended_item_ids: list, test_data: pd.DataFrame, training_item_ids: list):
+    """
+    Monta o relatório de Precisão@K a partir de uma lista de recomendações já gerada.
+
+    Args:
+        recommended_item_ids: IDs recomendados na simulação (K itens).
+        test_data: O DataFrame contendo os dados de teste (gabarito).
+        training_item_ids: Lista de IDs de itens usados no treino.
+
+    Returns:
+        Um dicionário contendo o relatório completo de acurácia.
+    """
+    # 1. Identifica os itens que o usuário gostou no gabarito
     liked_items_in_test = test_data[test_data['RATING_DESCRICAO'] >= 3]['ID_PRODUTO'].tolist()
 
-    # 3. Calcula os acertos e a precisão
+    # 2. Calcula os acertos e a precisão
     hit_items = set(recommended_item_ids) & set(liked_items_in_test)
     hits = len(hit_items)
     total_recommended = len(recommended_item_ids)
     precision_at_k = (hits / total_recommended) if total_recommended > 0 else 0
 
-    # 4. Monta o relatório final
+    # 3. Monta o relatório final
     return {
         "precision_at_k": precision_at_k,
         "hits": hits,
@@ -37,4 +53,142 @@ def evaluate_precision_at_k(recommender, user_cpf: str, test_data: pd.DataFrame,
         "training_items": training_item_ids,
         "simulated_recommendations": recommended_item_ids,
         "hit_items": list(hit_items)
-    }
\ No newline at end of file
+    }
+
+# Métricas vetorizadas (vários usuários de uma vez)
+#
+# As recomendações chegam como uma matriz (usuários × K) de códigos de itens, em ordem
+# de ranking, com -1 nas posições vazias. O gabarito é um CSR com uma linha por linha
+# da matriz: uma tupla (indptr, indices) ou qualquer objeto com esses atributos
+# (scipy.sparse.csr_matrix, RatingsIndex).
+
+def ground_truth_csr(user_codes, item_codes, n_users: int) -> tuple:
+    """
+    Monta o gabarito em formato CSR (usuário → itens relevantes) a partir de pares de códigos.
+    Retorna (indptr, indices), com os itens de cada usuário ordenados e sem repetição.
+    """
+    user_codes = np.asarray(user_codes, dtype=np.int64)
+    item_codes = np.asarray(item_codes, dtype=np.int64)
+    n_items = int(item_codes.max()) + 1 if len(item_codes) else 1
+    keys = np.unique(user_codes * n_items + item_codes)
+    counts = np.bincount(keys // n_items, minlength=n_users)
+    return np.concatenate(([0], np.cumsum(counts))), (keys % n_items).astype(np.int64)
+
+
+def _csr_arrays(ground_truth) -> tuple:
+    if hasattr(ground_truth, "indptr"):
+        return np.asarray(ground_truth.indptr, dtype=np.int64), np.asarray(ground_truth.indices, dtype=np.int64)
+    indptr, indices = ground_truth
+    return np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64)
+
+
+def hit_matrix(recommended: np.ndarray, ground_truth) -> np.ndarray:
+    """
+    Matriz booleana (usuários × K): True onde o item recomendado está no gabarito do usuário.
+    Cada posição é procurada por busca binária nas chaves (linha, item) ordenadas do gabarito.
+    """
+    recommended = np.asarray(recommended, dtype=np.int64)
+    indptr, indices = _csr_arrays(ground_truth)
+    n_users, k = recommended.shape
+    if len(indptr) - 1 != n_users:
+        raise ValueError("O gabarito deve ter uma linha por usuário recomendado.")
+    if len(indices) == 0 or k == 0:
+        return np.zeros((n_users, k), dtype=bool)
+
+    n_items = int(max(recommended.max(), indices.max())) + 1
+    truth_keys = np.repeat(np.arange(n_users, dtype=np.int64), np.diff(indptr)) * n_items + indices
+    if np.any(np.diff(truth_keys) < 0):
+        truth_keys = np.sort(truth_keys)  # itens fora de ordem dentro das linhas
+    rec_keys = (np.arange(n_users, dtype=np.int64)[:, None] * n_items + recommended).ravel()
+    pos = np.minimum(np.searchsorted(truth_keys, rec_keys), len(truth_keys) - 1)
+    hits = (truth_keys[pos] == rec_keys).reshape(n_users, k)
+    return hits & (recommended >= 0)
+
+
+def ranking_metrics(recommended: np.ndarray, ground_truth, k: int = None) -> dict:
+    """
+    Precision@K, Recall@K, NDCG@K, AP@K (para o MAP) e acerto (hit rate) de todos os
+    usuários em uma única passada sobre a matriz de acertos.
+
+    Args:
+        recommended: matriz (usuários × K) com os códigos recomendados em ordem; -1 marca posição vazia.
+        ground_truth: gabarito CSR com uma linha por linha de `recommended`.
+        k: corte (padrão: nº de colunas de `recommended`).
+
+    Returns:
+        Dicionário com um array por métrica (um valor por usuário) e o nº de acertos.
+    """
+    recommended = np.asarray(recommended, dtype=np.int64)
+    k = recommended.shape[1] if k is None else min(k, recommended.shape[1])
+    recommended = recommended[:, :k]
+    hits = hit_matrix(recommended, ground_truth)
+    indptr, _ = _csr_arrays(ground_truth)
+    n_relevant = np.diff(indptr)
+    n_users = recommended.shape[0]
+    if k == 0:
+        zeros = np.zeros(n_users)
+        return {"precision": zeros, "recall": zeros, "ndcg": zeros, "ap": zeros, "hit": zeros, "hits": zeros.astype(np.int64)}
+
+    n_hits = hits.sum(axis=1)
+    cum_hits = np.cumsum(hits, axis=1)
+    ranks = np.arange(1, k + 1)
+    discounts = 1.0 / np.log2(ranks + 1)
+    ideal = np.concatenate(([0.0], np.cumsum(discounts)))[np.minimum(n_relevant, k)]
+    best_possible = np.minimum(n_relevant, k)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = np.where(n_relevant > 0, n_hits / n_relevant, 0.0)
+        ndcg = np.where(ideal > 0, (hits * discounts).sum(axis=1) / ideal, 0.0)
+        ap = np.where(best_possible > 0, (hits * cum_hits / ranks).sum(axis=1) / best_possible, 0.0)
+
+    return {
+        "precision": n_hits / k,
+        "recall": recall,
+        "ndcg": ndcg,
+        "ap": ap,
+        "hit": (n_hits > 0).astype(np.float64),
+        "hits": n_hits,
+    }
+
+
+def catalog_coverage(recommended: np.ndarray, n_items: int) -> float:
+    """Fração do catálogo (n_items) que aparece em ao menos uma lista recomendada."""
+    recommended = np.asarray(recommended, dtype=np.int64)
+    if n_items <= 0:
+        return 0.0
+    return float(len(np.unique(recommended[recommended >= 0])) / n_items)
+
+
+def ranking_summary(recommended: np.ndarray, ground_truth, k: int = None, n_items: int = None) -> dict:
+    """
+    Médias sobre os usuários: precision@K, recall@K, ndcg@K, map@K e hit_rate@K,
+    além da cobertura do catálogo quando `n_items` é informado.
+    Usuários sem nenhum item relevante no gabarito não entram nas médias.
+    """
+    recommended = np.asarray(recommended, dtype=np.int64)
+    k = recommended.shape[1] if k is None else min(k, recommended.shape[1])
+    per_user = ranking_metrics(recommended, ground_truth, k)
+    indptr, _ = _csr_arrays(ground_truth)
+    evaluated = np.diff(indptr) > 0
+
+    names = {"precision": "precision", "recall": "recall", "ndcg": "ndcg", "ap": "map", "hit": "hit_rate"}
+    summary = {
+        f"{label}@{k}": (float(per_user[name][evaluated].mean()) if evaluated.any() else None)
+        for name, label in names.items()
+    }
+    summary["n_users_evaluated"] = int(evaluated.sum())
+    if n_items is not None:
+        summary["coverage"] = catalog_coverage(recommended[:, :k], n_items)
+    return summary
+
+
+def rmse(predicted, actual) -> float:
+    """Raiz do erro quadrático médio."""
+    diff = np.asarray(predicted, dtype=np.float64) - np.asarray(actual, dtype=np.float64)
+    return float(np.sqrt(np.mean(diff ** 2))) if len(diff) else float("nan")
+
+
+def mae(predicted, actual) -> float:
+    """Erro absoluto médio."""
+    diff = np.asarray(predicted, dtype=np.float64) - np.asarray(actual, dtype=np.float64)
+    return float(np.mean(np.abs(diff))) if len(diff) else float("nan")
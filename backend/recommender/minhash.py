@@ -0,0 +1,268 @@
+"""
+minhash.py
+----------
+Índice de "clientes parecidos" por MinHash + LSH. Cada cliente é o conjunto de
+produtos que avaliou; sua assinatura guarda, para cada uma de H funções de hash,
+o menor hash entre os itens do conjunto (a fração de posições iguais entre duas
+assinaturas estima a similaridade de Jaccard). As assinaturas são cortadas em
+bandas e clientes com alguma banda idêntica viram candidatos: uma consulta só
+compara o cliente com os candidatos dos seus baldes, nunca com a base inteira.
+
+Os baldes de cada banda são arrays ordenados (busca binária) mais um dicionário
+com as inserções recentes, incorporado aos arrays quando cresce. Como a assinatura
+de um conjunto que só ganha itens é o mínimo entre a antiga e a dos itens novos,
+novas avaliações de um cliente são inseridas sem recalcular os demais.
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+
+# Primo de Mersenne 2^31 - 1: (a·x + b) mod P cabe em int64 sem estouro para a, x < P
+PRIME = (1 << 31) - 1
+
+DEFAULT_PARAMS = {
+    'n_hashes': 96, # tamanho da assinatura
+    'n_bands': 32, # bandas de 3 hashes: pares com Jaccard 0,4 colidem em alguma banda ~88% das vezes, 0,1 só ~3%
+    'max_candidates': 2000, # candidatos comparados por consulta (os que colidem em mais bandas primeiro)
+    'seed': 42,
+}
+
+
+def item_hashes(item_ids) -> np.ndarray:
+    """Hash estável (independente da ordem de chegada e do processo) de cada ID de produto."""
+    return pd.util.hash_array(np.asarray(item_ids, dtype=object).astype(str))
+
+
+class MinHashLSHIndex:
+    """
+    Assinaturas MinHash dos clientes e baldes LSH por banda.
+
+    - user_ids / user_index: CPFs indexados (linha = ordem de inserção)
+    - signatures: (clientes × n_hashes) uint32 com o menor hash de cada função
+    - band_keys: (clientes × n_bands) chave do balde de cada banda
+    """
+
+    def __init__(self, params: dict = None):
+        self.params = {**DEFAULT_PARAMS, **(params or {})}
+        n_hashes, n_bands = self.params['n_hashes'], self.params['n_bands']
+        if n_bands <= 0 or n_hashes % n_bands != 0:
+            raise ValueError("n_hashes deve ser um múltiplo positivo de n_bands.")
+        rng = np.random.default_rng(self.params['seed'])
+        self._a = rng.integers(1, PRIME, size=n_hashes, dtype=np.int64)
+        self._b = rng.integers(0, PRIME, size=n_hashes, dtype=np.int64)
+
+        self.user_ids = []
+        self.user_index = {}
+        # Arrays com folga no fim (capacidade dobra ao crescer): inserir um cliente não copia a base inteira
+        self._signature_buffer = np.empty((0, n_hashes), dtype=np.uint32)
+        self._key_buffer = np.empty((0, n_bands), dtype=np.uint64)
+        self._fingerprint_buffer = np.empty(0, dtype=np.uint64) # soma dos hashes dos itens (detecta conjuntos alterados)
+        self._sorted_keys = np.empty((n_bands, 0), dtype=np.uint64)
+        self._sorted_rows = np.empty((n_bands, 0), dtype=np.int32)
+        self._recent = [{} for _ in range(n_bands)] # chave -> linhas inseridas desde a última consolidação
+        self._n_recent = 0
+        self.data_version = None
+        self._lock = threading.RLock()
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def signatures(self) -> np.ndarray:
+        return self._signature_buffer[:self.n_users]
+
+    @property
+    def band_keys(self) -> np.ndarray:
+        return self._key_buffer[:self.n_users]
+
+    @property
+    def _fingerprints(self) -> np.ndarray:
+        return self._fingerprint_buffer[:self.n_users]
+
+    # --- Assinaturas ---
+
+    def _signatures(self, indptr: np.ndarray, hashes: np.ndarray, block_size: int = 4096) -> np.ndarray:
+        """Assinaturas de vários conjuntos em CSR (`hashes[indptr[r]:indptr[r + 1]]`), em blocos de linhas."""
+        n_rows = len(indptr) - 1
+        values = (hashes % np.uint64(PRIME)).astype(np.int64)
+        signatures = np.full((n_rows, len(self._a)), PRIME, dtype=np.uint32) # conjunto vazio: nunca colide
+        for start in range(0, n_rows, block_size):
+            stop = min(start + block_size, n_rows)
+            rows = np.arange(start, stop)
+            rows = rows[indptr[rows + 1] > indptr[rows]]
+            if len(rows) == 0:
+                continue
+            x = values[indptr[rows[0]]:indptr[rows[-1] + 1]]
+            permuted = (x[:, None] * self._a + self._b) % PRIME
+            signatures[rows] = np.minimum.reduceat(permuted, indptr[rows] - indptr[rows[0]], axis=0)
+        return signatures
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """Chave de 64 bits de cada banda (mistura FNV das linhas da banda)."""
+        n_bands = self.params['n_bands']
+        bands = signatures.astype(np.uint64).reshape(len(signatures), n_bands, -1)
+        keys = np.full(bands.shape[:2], 0xCBF29CE484222325, dtype=np.uint64)
+        for column in range(bands.shape[2]):
+            keys = (keys ^ bands[:, :, column]) * np.uint64(0x100000001B3)
+        return keys
+
+    # --- Construção e inserção ---
+
+    def build(self, user_ids, indptr: np.ndarray, hashes: np.ndarray):
+        """Indexa todos os clientes de uma vez: `hashes[indptr[r]:indptr[r + 1]]` são os itens do cliente r."""
+        with self._lock:
+            indptr = np.asarray(indptr, dtype=np.int64)
+            hashes = np.asarray(hashes, dtype=np.uint64)
+            self.user_ids = list(user_ids)
+            self.user_index = {uid: r for r, uid in enumerate(self.user_ids)}
+            self._signature_buffer = self._signatures(indptr, hashes)
+            self._key_buffer = self._band_keys(self._signature_buffer)
+            self._fingerprint_buffer = self._row_fingerprints(indptr, hashes)
+            self._consolidate()
+
+    @classmethod
+    def from_index(cls, index, params: dict = None):
+        """Constrói o índice a partir do `RatingsIndex` (itens avaliados por CPF)."""
+        lsh = cls(params)
+        lsh.build(index.user_ids, index.indptr, item_hashes(index.item_ids)[index.indices])
+        return lsh
+
+    @staticmethod
+    def _row_fingerprints(indptr: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+        sums = np.add.reduceat(np.append(hashes, np.uint64(0)), indptr[:-1]) if len(indptr) > 1 else np.empty(0, np.uint64)
+        sums[indptr[1:] == indptr[:-1]] = 0
+        return sums.astype(np.uint64)
+
+    def _consolidate(self):
+        """Reordena os baldes de todas as bandas (arrays ordenados) e esvazia as inserções recentes."""
+        order = np.argsort(self.band_keys, axis=0, kind="stable").T
+        self._sorted_rows = order.astype(np.int32)
+        self._sorted_keys = np.take_along_axis(self.band_keys.T, order, axis=1)
+        self._recent = [{} for _ in range(self.params['n_bands'])]
+        self._n_recent = 0
+
+    def _reserve(self, n_rows: int):
+        """Garante espaço para `n_rows` clientes; linhas novas começam como conjunto vazio."""
+        capacity = len(self._signature_buffer)
+        if n_rows <= capacity:
+            return
+        capacity = max(n_rows, 2 * capacity, 1024)
+        n = self.n_users
+        signatures = np.full((capacity, len(self._a)), PRIME, dtype=np.uint32)
+        signatures[:n] = self._signature_buffer[:n]
+        keys = np.empty((capacity, self.params['n_bands']), dtype=np.uint64)
+        keys[:n] = self._key_buffer[:n]
+        keys[n:] = self._band_keys(signatures[n:n + 1])
+        fingerprints = np.zeros(capacity, dtype=np.uint64)
+        fingerprints[:n] = self._fingerprint_buffer[:n]
+        self._signature_buffer, self._key_buffer, self._fingerprint_buffer = signatures, keys, fingerprints
+
+    def _set_rows(self, rows: np.ndarray, signatures: np.ndarray):
+        """Atualiza assinaturas e registra nos baldes recentes apenas as bandas cuja chave mudou."""
+        keys = self._band_keys(signatures)
+        changed = keys != self.band_keys[rows]
+        self.signatures[rows] = signatures
+        self.band_keys[rows] = keys
+        for r, band in zip(*np.nonzero(changed)):
+            self._recent[band].setdefault(int(keys[r, band]), []).append(int(rows[r]))
+        self._n_recent += len(rows)
+        if self._n_recent > max(1000, self.n_users // 10):
+            self._consolidate()
+
+    def _add_users(self, user_ids: list) -> np.ndarray:
+        """Linhas dos CPFs informados, criando as que ainda não existem."""
+        new = [uid for uid in dict.fromkeys(user_ids) if uid not in self.user_index]
+        if new:
+            self._reserve(self.n_users + len(new))
+            for uid in new:
+                self.user_index[uid] = len(self.user_ids)
+                self.user_ids.append(uid)
+        return np.array([self.user_index[uid] for uid in user_ids], dtype=np.int64)
+
+    def insert(self, user_id, item_ids):
+        """
+        Acrescenta itens ao conjunto de um cliente (novo ou existente). A nova assinatura
+        é o mínimo entre a atual e a dos itens novos; só o próprio cliente é recalculado.
+        """
+        hashes = item_hashes(list(item_ids))
+        if len(hashes) == 0:
+            return
+        with self._lock:
+            row = self._add_users([user_id])
+            signature = np.minimum(self.signatures[row], self._signatures(np.array([0, len(hashes)]), hashes))
+            self._fingerprints[row] += hashes.sum(dtype=np.uint64)
+            self._set_rows(row, signature)
+
+    def sync(self, index, data_version=None, max_changed_fraction: float = 0.2) -> str:
+        """
+        Acompanha o `RatingsIndex` do modelo ativo: recalcula apenas os clientes novos ou
+        cujo conjunto de itens mudou; reconstrói tudo se a mudança passar de `max_changed_fraction`.
+        Retorna "current", "incremental" ou "rebuilt".
+        """
+        with self._lock:
+            if data_version is not None and data_version == self.data_version:
+                return "current"
+            hashes = item_hashes(index.item_ids)[index.indices]
+            fingerprints = self._row_fingerprints(index.indptr, hashes)
+            rows = np.array([self.user_index.get(uid, -1) for uid in index.user_ids], dtype=np.int64)
+            known = rows >= 0
+            changed = ~known
+            changed[known] = fingerprints[known] != self._fingerprints[rows[known]]
+            changed_codes = np.flatnonzero(changed)
+
+            removed = self.n_users - int(known.sum())
+            if self.n_users == 0 or removed > 0 or len(changed_codes) > max_changed_fraction * max(self.n_users, 1):
+                self.build(index.user_ids, index.indptr, hashes)
+                status = "rebuilt"
+            else:
+                status = "incremental" if len(changed_codes) else "current"
+                if len(changed_codes):
+                    starts, lengths = index.indptr[changed_codes], np.diff(index.indptr)[changed_codes]
+                    sub_indptr = np.concatenate(([0], np.cumsum(lengths)))
+                    positions = np.repeat(starts - sub_indptr[:-1], lengths) + np.arange(sub_indptr[-1])
+                    target = self._add_users([index.user_ids[u] for u in changed_codes])
+                    self._fingerprints[target] = fingerprints[changed_codes]
+                    self._set_rows(target, self._signatures(sub_indptr, hashes[positions]))
+            self.data_version = data_version
+            return status
+
+    # --- Consultas ---
+
+    def _candidates(self, row: int) -> np.ndarray:
+        """Clientes que dividem ao menos um balde com `row`, os que colidem em mais bandas primeiro."""
+        keys = self.band_keys[row]
+        found = []
+        for band, key in enumerate(keys):
+            sorted_keys = self._sorted_keys[band]
+            lo, hi = np.searchsorted(sorted_keys, key, side="left"), np.searchsorted(sorted_keys, key, side="right")
+            rows = np.concatenate([self._sorted_rows[band, lo:hi].astype(np.int64),
+                                   np.asarray(self._recent[band].get(int(key), []), dtype=np.int64)])
+            # Entradas antigas de clientes cuja assinatura mudou ficam nos baldes: confere a chave atual
+            found.append(np.unique(rows[self.band_keys[rows, band] == key]))
+        rows, collisions = np.unique(np.concatenate(found), return_counts=True)
+        keep = rows != row
+        rows, collisions = rows[keep], collisions[keep]
+        limit = self.params['max_candidates']
+        if len(rows) > limit:
+            rows = rows[np.argsort(-collisions, kind="stable")[:limit]]
+        return rows
+
+    def similar(self, user_id, n: int = 10):
+        """
+        CPFs mais parecidos com o cliente (Jaccard estimado pelas assinaturas), ou None
+        se o cliente não está no índice.
+        """
+        with self._lock:
+            row = self.user_index.get(user_id)
+            if row is None:
+                return None
+            if self.signatures[row, 0] == PRIME: # sem itens: não há com quem comparar
+                return []
+            candidates = self._candidates(row)
+            if len(candidates) == 0 or n <= 0:
+                return []
+            similarity = (self.signatures[candidates] == self.signatures[row]).mean(axis=1)
+            order = np.argsort(-similarity, kind="stable")[:n]
+            return [{'cpf': self.user_ids[candidates[i]], 'similarity': float(similarity[i])} for i in order]
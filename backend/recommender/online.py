@@ -0,0 +1,100 @@
+"""
+online.py
+---------
+Atualização incremental de um modelo SVD++ já treinado: algumas passadas de SGD
+restritas aos usuários e itens afetados pelas novas avaliações, sem re-treinar
+o restante do modelo. Também calcula a diferença entre duas versões das avaliações.
+"""
+
+import numpy as np
+import pandas as pd
+from backend.recommender.scoring import LatentFactorScorer
+
+
+def ratings_diff(current_df: pd.DataFrame, new_df: pd.DataFrame) -> tuple:
+    """
+    Compara duas versões das avaliações (com notas já numéricas).
+    Retorna (linhas de `new_df` novas ou com nota alterada, nº de pares removidos).
+    Pares repetidos valem pela última ocorrência, como no índice de avaliações.
+    """
+    keys = ['CPF_CLIENTE', 'ID_PRODUTO']
+    new = new_df.drop_duplicates(subset=keys, keep='last')
+    current = (
+        current_df.drop_duplicates(subset=keys, keep='last')[keys + ['RATING_DESCRICAO']]
+        .rename(columns={'RATING_DESCRICAO': '_NOTA_ATUAL'})
+    )
+    merged = new.merge(current, on=keys, how='outer', indicator=True)
+
+    present = (merged['_merge'] != 'right_only').to_numpy()
+    changed = (merged['_merge'] == 'left_only') | (merged['RATING_DESCRICAO'] != merged['_NOTA_ATUAL'])
+    n_removed = int((merged['_merge'] == 'right_only').sum())
+    return merged.loc[present & changed.to_numpy(), new_df.columns].reset_index(drop=True), n_removed
+
+
+def sgd_update(scorer: LatentFactorScorer, index, user_codes, item_codes,
+               lr: float = 0.007, reg: float = 0.02, n_passes: int = 10,
+               init_std: float = 0.1, random_state: int = 42) -> tuple:
+    """
+    Ajusta o modelo às avaliações novas de `index` (já atualizado) com SGD do SVD++
+    percorrendo apenas o histórico dos usuários afetados. Somente os parâmetros desses
+    usuários (b_u, p_u) e dos itens afetados (b_i, q_i, y_j) mudam; μ fica congelada.
+    Usuários e itens novos são inicializados como no Surprise (N(0, init_std)).
+
+    Retorna (novo LatentFactorScorer, códigos dos usuários cujo vetor efetivo mudou).
+    O scorer original não é alterado.
+    """
+    n_users, n_items = index.n_users, index.n_items
+    n_factors = scorer.qi.shape[1]
+    rng = np.random.default_rng(random_state)
+
+    def grow(array, size, std):
+        extra = size - len(array)
+        if extra <= 0:
+            return array.copy()
+        if array.ndim == 1:
+            return np.concatenate([array, np.zeros(extra)])
+        return np.vstack([array, rng.normal(0, std, (extra, n_factors))])
+
+    bu, pu = grow(scorer.bu, n_users, init_std), grow(scorer.pu, n_users, init_std)
+    bi, qi, yj = grow(scorer.bi, n_items, init_std), grow(scorer.qi, n_items, init_std), grow(scorer.yj, n_items, init_std)
+    mu = scorer.global_mean
+
+    affected_users = np.unique(np.asarray(user_codes, dtype=np.int64))
+    affected_items = np.zeros(n_items, dtype=bool)
+    affected_items[np.asarray(item_codes, dtype=np.int64)] = True
+
+    for _ in range(n_passes):
+        for u in affected_users:
+            items = index.user_items(u).astype(np.int64)
+            ratings = index.user_ratings(u)
+            sqrt_inv = 1.0 / np.sqrt(len(items))
+            movable = items[affected_items[items]]  # y_j que podem ser atualizados
+            implicit = yj[items].sum(axis=0) * sqrt_inv
+
+            for i, r in zip(items, ratings):
+                err = r - (mu + bu[u] + bi[i] + qi[i] @ (pu[u] + implicit))
+
+                bu[u] += lr * (err - reg * bu[u])
+                pu_old, qi_old = pu[u].copy(), qi[i].copy()
+                pu[u] += lr * (err * qi_old - reg * pu_old)
+                if affected_items[i]:
+                    bi[i] += lr * (err - reg * bi[i])
+                    qi[i] += lr * (err * (pu_old + implicit) - reg * qi_old)
+                if len(movable):
+                    delta = lr * (err * sqrt_inv * qi_old - reg * yj[movable])
+                    yj[movable] += delta
+                    implicit += delta.sum(axis=0) * sqrt_inv
+
+    updated = LatentFactorScorer(
+        global_mean=mu, bu=bu, bi=bi, pu=pu, qi=qi, yj=yj,
+        user_ids=index.user_ids, item_ids=index.item_ids,
+        user_indptr=index.indptr, user_indices=index.indices,
+        rating_scale=scorer.rating_scale,
+        user_vecs=grow(scorer.user_vecs, n_users, 0.0),
+    )
+
+    # Vetores efetivos a recalcular: usuários afetados e quem avaliou um item com y_j alterado
+    owners = np.repeat(np.arange(n_users), np.diff(index.indptr))
+    touched = np.union1d(affected_users, owners[affected_items[index.indices]])
+    updated.refresh_user_vectors(touched)
+    return updated, touched
@@ -0,0 +1,91 @@
+"""
+popularity.py
+-------------
+Ranking de popularidade usado no fallback de cold-start. Mantém contagens e
+somas de notas por item, atualizadas incrementalmente, e ordena os itens pela
+média bayesiana (amortecida) para que um item com uma única nota 5 não lidere.
+"""
+
+import numpy as np
+
+
+class PopularityIndex:
+    """
+    Popularidade por item com média amortecida:
+        score_i = (soma_i + m · C) / (contagem_i + m)
+    onde C é a média global das notas e m o peso do amortecimento (em nº de avaliações).
+    O ranking é recalculado de forma preguiçosa apenas após atualizações.
+    """
+
+    def __init__(self, item_ids, counts, sums, damping: float = 5.0):
+        self.item_ids = list(item_ids)
+        self.item_index = {iid: i for i, iid in enumerate(self.item_ids)}
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.sums = np.asarray(sums, dtype=np.float64)
+        self.damping = damping
+        self._ranking = None
+
+    @classmethod
+    def from_index(cls, index, damping: float = 5.0):
+        """Constrói as contagens e somas a partir do `RatingsIndex` (sem tocar no DataFrame)."""
+        counts = np.bincount(index.indices, minlength=index.n_items)
+        sums = np.bincount(index.indices, weights=index.ratings, minlength=index.n_items)
+        return cls(index.item_ids, counts, sums, damping=damping)
+
+    def copy(self):
+        """Cópia independente (para atualizar sem afetar quem ainda usa o índice atual)."""
+        return PopularityIndex(self.item_ids, self.counts.copy(), self.sums.copy(), damping=self.damping)
+
+    @property
+    def global_mean(self) -> float:
+        total = self.counts.sum()
+        return float(self.sums.sum() / total) if total > 0 else 0.0
+
+    def scores(self, codes=None) -> np.ndarray:
+        """Média bayesiana de cada item (ou só dos códigos informados)."""
+        m = self.damping
+        if codes is None:
+            return (self.sums + m * self.global_mean) / (self.counts + m)
+        codes = np.asarray(codes, dtype=np.int64)
+        return (self.sums[codes] + m * self.global_mean) / (self.counts[codes] + m)
+
+    def _ranked_codes(self) -> np.ndarray:
+        if self._ranking is None:
+            self._ranking = np.argsort(-self.scores(), kind="stable")
+        return self._ranking
+
+    def add(self, item_id, rating: float, previous_rating: float = None):
+        """
+        Registra uma avaliação. Se `previous_rating` for informado, trata-se de uma
+        reavaliação: a nota antiga é substituída sem alterar a contagem.
+        Itens novos são incluídos no índice.
+        """
+        code = self.item_index.get(item_id)
+        if code is None:
+            code = len(self.item_ids)
+            self.item_ids.append(item_id)
+            self.item_index[item_id] = code
+            self.counts = np.append(self.counts, 0.0)
+            self.sums = np.append(self.sums, 0.0)
+
+        if previous_rating is None:
+            self.counts[code] += 1
+            self.sums[code] += rating
+        else:
+            self.sums[code] += rating - previous_rating
+        self._ranking = None
+
+    def top(self, k: int, exclude=None) -> list:
+        """Retorna os IDs dos K itens mais populares, ignorando os IDs em `exclude`."""
+        if k <= 0:
+            return []
+        exclude = exclude or set()
+        result = []
+        for code in self._ranked_codes():
+            item_id = self.item_ids[code]
+            if item_id in exclude:
+                continue
+            result.append(item_id)
+            if len(result) >= k:
+                break
+        return result
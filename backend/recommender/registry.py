@@ -0,0 +1,190 @@
+"""
+registry.py
+-----------
+Registro do modelo ativo da API e re-treino em segundo plano.
+O modelo em uso é trocado de forma atômica: requisições em andamento
+terminam no modelo antigo e as novas já usam o modelo re-treinado.
+"""
+
+import os
+import copy
+import time
+import threading
+from datetime import datetime
+from backend.dataset import loader
+from backend.recommender.online import ratings_diff
+from backend.utils.monitoring import stage_timer
+
+
+class ModelRegistry:
+    """
+    Guarda a referência ao recomendador ativo e os metadados do último treino.
+    Leitores obtêm a referência uma única vez (`registry.current`) e a usam até o fim da requisição.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = None
+        self._status = {"status": "unavailable", "model_version": None}
+
+    @property
+    def current(self):
+        return self._current
+
+    def swap(self, recommender, **metadata):
+        """Substitui o modelo ativo atomicamente e registra seus metadados."""
+        scorer = recommender.scorer
+        status = {
+            "status": "ready",
+            "model_version": recommender.data_version,
+            "engine": type(recommender).__name__,
+            "n_ratings": len(recommender.ratings_df),
+            "n_users": scorer.n_users if scorer is not None else 0,
+            "n_items": scorer.n_items if scorer is not None else 0,
+            "loaded_at": datetime.now().isoformat(timespec="seconds"),
+            **metadata,
+        }
+        with self._lock:
+            self._current = recommender
+            self._status = status
+
+    def update_status(self, **fields):
+        with self._lock:
+            self._status = {**self._status, **fields}
+
+    def status(self) -> dict:
+        with self._lock:
+            return dict(self._status)
+
+
+class BackgroundRetrainer:
+    """
+    Observa `data/derived/ratings.csv` (mtime e tamanho) e, quando o conteúdo muda
+    (impressão digital diferente da versão ativa), treina um novo recomendador
+    fora da thread das requisições e o publica no `ModelRegistry`.
+
+    Mudanças pequenas (até `max_incremental_fraction` das avaliações, sem remoções) são
+    aplicadas com `update()` em uma cópia do modelo ativo; um re-treino completo ocorre
+    quando a mudança é grande ou quando o último passou de `full_retrain_interval` segundos.
+
+    `factory(ratings_df)` deve retornar um recomendador configurado e ainda não treinado.
+    Cada função de `pollers` é chamada a cada verificação periódica (ex.: recarregar outros
+    índices derivados dos dados), depois do modelo; erros nela não interrompem as demais.
+    """
+
+    def __init__(self, registry: ModelRegistry, factory, ratings_path: str = loader.RATINGS, interval: float = 30.0,
+                 full_retrain_interval: float = 3600.0, max_incremental_fraction: float = 0.1, pollers=None):
+        self.registry = registry
+        self.factory = factory
+        self.ratings_path = ratings_path
+        self.interval = interval
+        self.full_retrain_interval = full_retrain_interval
+        self.max_incremental_fraction = max_incremental_fraction
+        self.pollers = list(pollers or [])
+        self._last_full_retrain = None
+        self._last_signature = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.ratings_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Verifica o arquivo de avaliações e re-treina se os dados mudaram.
+        Retorna True se um novo modelo foi publicado.
+        """
+        with self._refresh_lock:
+            signature = self._file_signature()
+            if not force and signature == self._last_signature:
+                return False
+            self._last_signature = signature
+            self.registry.update_status(last_check=datetime.now().isoformat(timespec="seconds"))
+
+            ratings_df = loader.load_ratings()
+            if ratings_df.empty:
+                return False
+
+            candidate = self.factory(ratings_df)
+            candidate.prepare_ratings()
+            current = self.registry.current
+            if not force and current is not None and candidate.data_version == current.data_version:
+                return False
+            if not force and current is not None and self._apply_incremental(current, candidate):
+                return True
+
+            self.registry.update_status(retraining=True)
+            try:
+                start = time.perf_counter()
+                with stage_timer("training"):
+                    source = candidate.load_or_train()
+                duration = time.perf_counter() - start
+            except Exception as e:
+                self.registry.update_status(retraining=False, last_error=str(e))
+                raise
+
+            self._last_full_retrain = time.monotonic()
+            self.registry.swap(candidate, source=source, training_duration_s=round(duration, 3),
+                               retraining=False, last_error=None, incremental_updates=0)
+            print(f"🔄 Modelo atualizado (versão {candidate.data_version}, {duration:.2f}s).")
+            return True
+
+    def _apply_incremental(self, current, candidate) -> bool:
+        """
+        Tenta publicar o modelo ativo atualizado incrementalmente com as avaliações que mudaram.
+        Retorna False quando um re-treino completo é necessário.
+        """
+        if current.scorer is None or self._last_full_retrain is None or not current.SUPPORTS_INCREMENTAL:
+            return False
+        if time.monotonic() - self._last_full_retrain >= self.full_retrain_interval:
+            return False
+
+        changed, n_removed = ratings_diff(current.ratings_df, candidate.ratings_df)
+        if n_removed > 0 or len(changed) > self.max_incremental_fraction * len(current.ratings_df):
+            return False
+
+        start = time.perf_counter()
+        updated = copy.copy(current)
+        info = updated.update(changed)
+        # A versão passa a ser a do arquivo, para que a próxima verificação o reconheça
+        updated.data_version = candidate.data_version
+        duration = time.perf_counter() - start
+
+        previous = self.registry.status()
+        self.registry.swap(updated, source="incremental", update_duration_s=round(duration, 4),
+                           training_duration_s=previous.get("training_duration_s"),
+                           incremental_updates=previous.get("incremental_updates", 0) + 1,
+                           retraining=False, last_error=None)
+        print(f"⚡ Modelo atualizado incrementalmente ({info['added']} novas, {info['updated']} alteradas, {duration * 1000:.1f}ms).")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Erro no re-treino em segundo plano: {e}")
+            for poll in self.pollers:
+                try:
+                    poll()
+                except Exception as e:
+                    print(f"❌ Erro na verificação periódica ({getattr(poll, '__name__', poll)}): {e}")
+
+    def start(self):
+        """Inicia a verificação periódica em uma thread daemon."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-retrainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
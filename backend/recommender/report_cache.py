@@ -0,0 +1,105 @@
+"""
+report_cache.py
+---------------
+Cache persistente e limitado (LRU) dos relatórios de acurácia por cliente.
+A avaliação re-treina (ou ajusta) o modelo sobre todas as avaliações, então o
+relatório vale para uma versão dos dados (`data_version`, que muda a cada re-treino
+completo ou atualização incremental), do modelo (motor + hiperparâmetros) e do
+histórico do cliente; qualquer mudança nelas gera uma chave nova e as entradas
+antigas saem do cache pelo LRU.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from backend.dataset import loader
+from backend.recommender.tuning import params_key
+
+CACHE_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models', 'accuracy_cache.json'))
+
+# Formato das chaves/entradas (incrementar se o relatório de acurácia mudar)
+CACHE_FORMAT_VERSION = 2
+
+
+def report_key(recommender, user_cpf: str, method: str) -> str:
+    """
+    Chave do relatório: CPF, método, versão do modelo (motor + hash dos hiperparâmetros),
+    versão dos dados do modelo ativo e impressão digital das avaliações deste cliente.
+    """
+    history = recommender.user_history(user_cpf)
+    user_version = loader.ratings_fingerprint(history) if len(history) else "sem-avaliacoes"
+    model_version = f"{recommender.ARTIFACT_NAME}-{params_key(recommender.best_params or {})}"
+    return f"v{CACHE_FORMAT_VERSION}|{user_cpf}|{method}|{model_version}|{recommender.data_version}|{user_version}"
+
+
+class AccuracyReportCache:
+    """
+    Mapa chave → relatório com despejo do menos usado recentemente ao passar de
+    `max_entries`. É gravado em JSON (escrita atômica) a cada novo relatório e
+    recarregado na inicialização, sobrevivendo a reinícios da API.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_entries: int = 1000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Gravado do menos para o mais recente; descarta entradas de formatos antigos
+        for key, report in entries:
+            if key.startswith(f"v{CACHE_FORMAT_VERSION}|"):
+                self._entries[key] = report
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(list(self._entries.items()), f, default=str)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str):
+        """Retorna o relatório (marcando-o como recém-usado) ou None."""
+        with self._lock:
+            report = self._entries.get(key)
+            if report is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return report
+
+    def put(self, key: str, report: dict):
+        """Guarda o relatório, substituindo o de histórico anterior do mesmo cliente, método e modelo."""
+        prefix = key.rsplit("|", 1)[0] + "|"
+        with self._lock:
+            for old in [k for k in self._entries if k.startswith(prefix) and k != key]:
+                del self._entries[old]
+            self._entries[key] = report
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,229 @@
+"""
+scoring.py
+----------
+Motor de pontuação vetorizado para modelos de fatores latentes (SVD++).
+Extrai os parâmetros treinados para arrays NumPy contíguos uma única vez e
+pontua todo o catálogo de um usuário com um único produto matriz-vetor.
+"""
+
+import numpy as np
+
+
+class LatentFactorScorer:
+    """
+    Guarda os parâmetros de um modelo SVD++ treinado em arrays contíguos:
+    média global, vieses (bu, bi), fatores (pu, qi) e fatores implícitos (yj).
+
+    A estimativa segue a mesma fórmula do Surprise:
+        r̂_ui = μ + b_u + b_i + q_i · (p_u + |N(u)|^-½ Σ_{j ∈ N(u)} y_j)
+    com o vetor efetivo de cada usuário (p_u + termo implícito) pré-calculado.
+    """
+
+    def __init__(self, global_mean: float, bu, bi, pu, qi, yj,
+                 user_ids, item_ids, user_indptr, user_indices,
+                 rating_scale: tuple = (1, 5), user_vecs=None):
+        self.global_mean = float(global_mean)
+        self.bu = np.ascontiguousarray(bu, dtype=np.float64)
+        self.bi = np.ascontiguousarray(bi, dtype=np.float64)
+        self.pu = np.ascontiguousarray(pu, dtype=np.float64)
+        self.qi = np.ascontiguousarray(qi, dtype=np.float64)
+        self.yj = np.ascontiguousarray(yj, dtype=np.float64)
+        self.rating_scale = rating_scale
+
+        # Códigos internos <-> IDs originais (CPF e ID_PRODUTO)
+        self.user_ids = np.asarray(user_ids, dtype=object)
+        self.item_ids = np.asarray(item_ids, dtype=object)
+        self.user_index = {uid: u for u, uid in enumerate(self.user_ids)}
+        self.item_index = {iid: i for i, iid in enumerate(self.item_ids)}
+
+        # N(u): itens avaliados por cada usuário (formato CSR)
+        self.user_indptr = np.ascontiguousarray(user_indptr, dtype=np.int64)
+        self.user_indices = np.ascontiguousarray(user_indices, dtype=np.int32)
+
+        # Vetores efetivos podem ser reaproveitados (atualização incremental recalcula só parte deles)
+        if user_vecs is None:
+            user_vecs = self._compute_user_vectors()
+        self.user_vecs = np.ascontiguousarray(user_vecs, dtype=np.float64)
+
+    @classmethod
+    def from_svdpp(cls, algo, index):
+        """
+        Extrai os parâmetros de um modelo `surprise.SVDpp` já treinado, reordenando-os
+        para os códigos do `RatingsIndex` (o CSR do índice é reaproveitado como N(u)).
+        """
+        trainset = algo.trainset
+        user_perm = np.fromiter((trainset.to_inner_uid(uid) for uid in index.user_ids), dtype=np.int64, count=index.n_users)
+        item_perm = np.fromiter((trainset.to_inner_iid(iid) for iid in index.item_ids), dtype=np.int64, count=index.n_items)
+
+        return cls(
+            global_mean=trainset.global_mean,
+            bu=algo.bu[user_perm], bi=algo.bi[item_perm],
+            pu=algo.pu[user_perm], qi=algo.qi[item_perm], yj=algo.yj[item_perm],
+            user_ids=index.user_ids, item_ids=index.item_ids,
+            user_indptr=index.indptr, user_indices=index.indices,
+            rating_scale=trainset.rating_scale,
+        )
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.item_ids)
+
+    def _gather_blocks(self, user_codes: np.ndarray) -> tuple:
+        """Concatena os blocos N(u) dos usuários informados, sem laço por usuário. Retorna (itens, tamanhos)."""
+        starts = self.user_indptr[user_codes]
+        lengths = self.user_indptr[user_codes + 1] - starts
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return self.user_indices[np.arange(lengths.sum()) + offsets], lengths
+
+    def _compute_user_vectors(self, user_codes=None) -> np.ndarray:
+        """Calcula p_u + |N(u)|^-½ Σ y_j para todos os usuários de uma vez (ou apenas para `user_codes`)."""
+        if user_codes is None:
+            cols, lengths = self.user_indices, np.diff(self.user_indptr)
+            user_vecs = self.pu.copy()
+        else:
+            user_codes = np.asarray(user_codes, dtype=np.int64)
+            cols, lengths = self._gather_blocks(user_codes)
+            user_vecs = self.pu[user_codes].copy()
+
+        has_items = lengths > 0
+        if has_items.any():
+            # reduceat soma os blocos de y_j de cada usuário sem laço em Python
+            starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            implicit = np.add.reduceat(self.yj[cols], starts[has_items], axis=0)
+            user_vecs[has_items] += implicit / np.sqrt(lengths[has_items])[:, None]
+        return user_vecs
+
+    def refresh_user_vectors(self, user_codes):
+        """Recalcula os vetores efetivos apenas dos usuários informados (após mudar p_u ou y_j)."""
+        user_codes = np.asarray(user_codes, dtype=np.int64)
+        if len(user_codes):
+            self.user_vecs[user_codes] = self._compute_user_vectors(user_codes)
+
+    def score(self, user_id) -> np.ndarray:
+        """
+        Retorna a nota estimada de todos os itens do catálogo para um usuário.
+        Usuários desconhecidos recebem apenas μ + b_i (mesmo comportamento do Surprise).
+        """
+        u = self.user_index.get(user_id)
+        if u is None:
+            return self._clip(self.global_mean + self.bi)
+        return self.score_vector(self.bu[u], self.user_vecs[u])
+
+    def score_vector(self, bu: float, user_vec: np.ndarray) -> np.ndarray:
+        """Pontua todo o catálogo para um viés e vetor efetivo de usuário arbitrários."""
+        scores = self.qi @ user_vec
+        scores += self.global_mean + bu
+        scores += self.bi
+        return self._clip(scores)
+
+    def score_users(self, user_codes) -> np.ndarray:
+        """
+        Pontua todo o catálogo para vários usuários de uma vez: uma única
+        multiplicação (usuários × fatores) @ (fatores × itens).
+        Códigos negativos representam usuários desconhecidos (apenas μ + b_i).
+        """
+        user_codes = np.asarray(user_codes, dtype=np.int64)
+        known = user_codes >= 0
+        scores = np.empty((len(user_codes), self.n_items), dtype=np.float64)
+
+        scores[known] = self.user_vecs[user_codes[known]] @ self.qi.T
+        scores[known] += self.bu[user_codes[known], None]
+        scores[~known] = 0.0
+        scores += self.global_mean
+        scores += self.bi[None, :]
+        return self._clip(scores)
+
+    def predict_pairs(self, user_codes, item_codes) -> np.ndarray:
+        """
+        Nota estimada de pares (usuário, item) arbitrários, sem pontuar o catálogo inteiro.
+        Códigos de usuário negativos recebem apenas μ + b_i; os itens devem ser conhecidos.
+        """
+        user_codes = np.asarray(user_codes, dtype=np.int64)
+        item_codes = np.asarray(item_codes, dtype=np.int64)
+        known = user_codes >= 0
+        estimates = self.global_mean + self.bi[item_codes]
+        u, i = user_codes[known], item_codes[known]
+        estimates[known] += self.bu[u] + np.einsum('ij,ij->i', self.user_vecs[u], self.qi[i])
+        return self._clip(estimates)
+
+    def mask_seen(self, scores: np.ndarray, user_codes) -> np.ndarray:
+        """Marca com -inf, em cada linha, os itens já avaliados pelo usuário correspondente."""
+        user_codes = np.asarray(user_codes, dtype=np.int64)
+        rows = np.flatnonzero(user_codes >= 0)
+        if len(rows) == 0:
+            return scores
+        cols, lengths = self._gather_blocks(user_codes[rows])
+        scores[np.repeat(rows, lengths), cols] = -np.inf
+        return scores
+
+    def _clip(self, scores: np.ndarray) -> np.ndarray:
+        if self.rating_scale is not None:
+            np.clip(scores, self.rating_scale[0], self.rating_scale[1], out=scores)
+        return scores
+
+    def fold_in(self, item_codes, ratings, reg: float = 0.02) -> tuple:
+        """
+        Estima um usuário a partir de suas avaliações mantendo os itens congelados
+        (b_i, q_i e y_j não mudam). O termo implícito vem direto de y_j e o par
+        (b_u, p_u) é resolvido em forma fechada por regressão ridge, com a mesma
+        regularização por avaliação usada no SGD do SVD++.
+        Retorna (b_u, vetor efetivo p_u + termo implícito).
+        """
+        item_codes = np.asarray(item_codes, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        n_factors = self.qi.shape[1]
+        if len(item_codes) == 0:
+            return 0.0, np.zeros(n_factors)
+
+        implicit = self.yj[item_codes].sum(axis=0) / np.sqrt(len(item_codes))
+        q = self.qi[item_codes]
+
+        # Resíduo que (b_u, p_u) precisam explicar: r - μ - b_i - q_i · termo implícito
+        target = ratings - self.global_mean - self.bi[item_codes] - q @ implicit
+
+        # [1 | q_i] · [b_u, p_u] ≈ resíduo, com penalidade reg * |avaliações|
+        design = np.hstack([np.ones((len(item_codes), 1)), q])
+        gram = design.T @ design + reg * len(item_codes) * np.eye(n_factors + 1)
+        solution = np.linalg.solve(gram, design.T @ target)
+
+        return float(solution[0]), solution[1:] + implicit
+
+    @staticmethod
+    def top_n(scores: np.ndarray, n: int, exclude=None) -> tuple:
+        """
+        Seleciona os N maiores scores com `argpartition` (O(n_itens)) e ordena
+        apenas os escolhidos. `exclude` são códigos de itens a ignorar.
+        Retorna (códigos, scores) em ordem decrescente.
+        """
+        if exclude is not None and len(exclude) > 0:
+            scores = scores.copy()
+            scores[np.asarray(exclude, dtype=np.int64)] = -np.inf
+
+        n_valid = int(np.isfinite(scores).sum())
+        n = min(n, n_valid)
+        if n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top, scores[top]
+
+    @staticmethod
+    def top_n_rows(scores: np.ndarray, n: int) -> tuple:
+        """
+        Versão por linhas de `top_n` para uma matriz (usuários × itens).
+        Retorna (códigos, scores), ambos (usuários × N), em ordem decrescente;
+        posições sem item válido ficam com score -inf.
+        """
+        n = min(n, scores.shape[1])
+        if n <= 0:
+            empty = np.empty((scores.shape[0], 0))
+            return empty.astype(np.int64), empty
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
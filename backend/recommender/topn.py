@@ -0,0 +1,115 @@
+"""
+topn.py
+-------
+Tabela de recomendações top-N pré-calculada para todos os usuários conhecidos.
+Os resultados ficam em arrays compactos (códigos de itens + scores) e são
+servidos em O(1) pelo endpoint de recomendação.
+"""
+
+import numpy as np
+
+
+class TopNTable:
+    """
+    Tabela em memória com as N melhores recomendações de cada usuário.
+
+    - item_codes: matriz (n_usuarios, N) int32 com os códigos dos itens
+    - scores: matriz (n_usuarios, N) float32 com as notas estimadas
+    - lengths: quantos itens válidos cada linha possui (usuários saturados têm menos; -1 = linha invalidada)
+    - dirty_items: itens cujos parâmetros mudaram (ou que surgiram) depois da construção; seus scores
+      guardados estão desatualizados e são recalculados na consulta com o `scorer` atual
+    """
+
+    def __init__(self, user_index: dict, item_ids, item_codes: np.ndarray, scores: np.ndarray, lengths: np.ndarray,
+                 dirty_items: np.ndarray = None, scorer=None):
+        self.user_index = user_index
+        self.item_ids = item_ids
+        self.item_codes = item_codes
+        self.scores = scores
+        self.lengths = lengths
+        self.dirty_items = dirty_items if dirty_items is not None else np.empty(0, dtype=np.int64)
+        self.scorer = scorer
+
+    @property
+    def size(self) -> int:
+        return self.item_codes.shape[1]
+
+    @classmethod
+    def build(cls, scorer, n: int, block_size: int = 1024):
+        """
+        Calcula o top-N de todos os usuários do `LatentFactorScorer`, em blocos
+        de usuários (uma multiplicação de matrizes por bloco), ignorando os itens já vistos.
+        """
+        n_users, n_items = scorer.n_users, scorer.n_items
+        n = min(n, n_items)
+        item_codes = np.zeros((n_users, n), dtype=np.int32)
+        scores = np.zeros((n_users, n), dtype=np.float32)
+        lengths = np.zeros(n_users, dtype=np.int32)
+
+        for start in range(0, n_users, block_size):
+            stop = min(start + block_size, n_users)
+            users = np.arange(start, stop)
+
+            # Pontua o bloco inteiro, remove os itens já vistos e seleciona o top-N de cada linha
+            block = scorer.mask_seen(scorer.score_users(users), users)
+            top, top_scores = scorer.top_n_rows(block, n)
+
+            item_codes[start:stop] = top
+            scores[start:stop] = top_scores
+            lengths[start:stop] = np.isfinite(top_scores).sum(axis=1)
+
+        return cls(scorer.user_index, scorer.item_ids, item_codes, scores, lengths, scorer=scorer)
+
+    def invalidate(self, user_codes, item_codes=None, scorer=None):
+        """
+        Retorna uma tabela para o `scorer` atualizado (ex.: após `update()`): as linhas dos
+        usuários informados são descartadas (esses usuários voltam a ser pontuados na hora) e
+        os itens informados passam a ser recalculados em toda consulta. Os demais arrays são compartilhados.
+        """
+        user_codes = np.asarray(user_codes, dtype=np.int64)
+        lengths = self.lengths.copy()
+        lengths[user_codes[user_codes < len(lengths)]] = -1
+        dirty = self.dirty_items
+        if item_codes is not None:
+            dirty = np.union1d(dirty, np.asarray(item_codes, dtype=np.int64))
+        if scorer is None:
+            return TopNTable(self.user_index, self.item_ids, self.item_codes, self.scores, lengths, dirty, self.scorer)
+        return TopNTable(scorer.user_index, scorer.item_ids, self.item_codes, self.scores, lengths, dirty, scorer)
+
+    def row(self, u: int, n: int):
+        """
+        (códigos, scores) dos até N melhores itens do usuário de código `u`, ou None quando
+        a linha foi invalidada ou não comporta uma resposta exata. Itens alterados depois da
+        construção são retirados da linha e re-pontuados: os demais itens não mudaram de
+        score, e os que ficaram fora da linha não superam o último item guardado nela.
+        """
+        if u is None or u >= len(self.lengths) or self.lengths[u] < 0:
+            return None
+        length = self.lengths[u]
+        codes, scores = self.item_codes[u, :length], self.scores[u, :length]
+        if len(self.dirty_items) == 0:
+            return codes[:n], scores[:n]
+
+        clean = ~np.isin(codes, self.dirty_items)
+        codes, scores = codes[clean], scores[clean]
+        if len(codes) < n and length == self.size:
+            return None # a linha não guarda itens limpos suficientes
+
+        scorer = self.scorer
+        seen = scorer.user_indices[scorer.user_indptr[u]:scorer.user_indptr[u + 1]]
+        dirty = self.dirty_items[~np.isin(self.dirty_items, seen)]
+        fresh = scorer.predict_pairs(np.full(len(dirty), u), dirty)
+
+        codes, scores = np.concatenate([codes, dirty]), np.concatenate([scores, fresh])
+        order = np.argsort(-scores, kind="stable")[:n]
+        return codes[order], scores[order]
+
+    def lookup(self, user_id, n: int):
+        """
+        Retorna as N recomendações pré-calculadas do usuário, ou None quando
+        o usuário é desconhecido ou a tabela não tem itens suficientes.
+        """
+        found = self.row(self.user_index.get(user_id), n)
+        if found is None or len(found[0]) < n:
+            return None
+        return [{'id': self.item_ids[code], 'score': float(score)} for code, score in zip(*found)]
@@ -0,0 +1,114 @@
+"""
+training.py
+-----------
+Utilitários para os laços de treino por época dos motores nativos (ALS e BPR):
+separação de uma fatia de validação, parada antecipada quando a métrica de
+validação estabiliza e checkpoints por época em disco para retomar treinos interrompidos.
+"""
+
+import os
+import json
+import numpy as np
+from backend.recommender.tuning import params_key
+
+CHECKPOINT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models', 'checkpoints'))
+
+
+def validation_mask(indptr: np.ndarray, fraction: float, random_state: int = 42) -> np.ndarray:
+    """
+    Sorteia uma fração das avaliações (posições do CSR) para validação.
+    Retorna a máscara de treino (True = treino); cada usuário mantém ao menos uma avaliação no treino.
+    """
+    n_ratings = int(indptr[-1])
+    if fraction <= 0 or n_ratings == 0:
+        return np.ones(n_ratings, dtype=bool)
+
+    rng = np.random.default_rng(random_state)
+    mask = rng.random(n_ratings) >= fraction
+    counts = np.diff(indptr)
+    nonempty = counts > 0
+    kept = np.add.reduceat(mask.astype(np.int64), indptr[:-1][nonempty])
+    mask[indptr[:-1][nonempty][kept == 0]] = True
+    return mask
+
+
+def subset_csr(indptr: np.ndarray, mask: np.ndarray, *columns) -> tuple:
+    """Aplica a máscara às posições do CSR. Retorna (novo indptr, colunas filtradas...)."""
+    owners = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    counts = np.bincount(owners[mask], minlength=len(indptr) - 1)
+    return (np.concatenate(([0], np.cumsum(counts))),) + tuple(col[mask] for col in columns)
+
+
+class EarlyStopping:
+    """
+    Acompanha a métrica de validação (menor é melhor) e indica a parada quando ela
+    não melhora por mais de `min_delta` durante `patience` épocas seguidas.
+    """
+
+    def __init__(self, patience: int = 3, min_delta: float = 1e-4):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = float("inf")
+        self.best_epoch = -1
+        self.bad_epochs = 0
+        self.history = []
+
+    def update(self, epoch: int, value: float) -> bool:
+        """Registra a métrica da época. Retorna True se ela é a melhor até agora."""
+        self.history.append(float(value))
+        if value < self.best - self.min_delta:
+            self.best, self.best_epoch, self.bad_epochs = float(value), epoch, 0
+            return True
+        self.bad_epochs += 1
+        return False
+
+    @property
+    def should_stop(self) -> bool:
+        return self.bad_epochs >= self.patience
+
+    def state(self) -> dict:
+        return {"best": self.best, "best_epoch": self.best_epoch, "bad_epochs": self.bad_epochs, "history": self.history}
+
+    def load_state(self, state: dict):
+        self.best = state["best"]
+        self.best_epoch = state["best_epoch"]
+        self.bad_epochs = state["bad_epochs"]
+        self.history = list(state["history"])
+
+
+class EpochCheckpoint:
+    """
+    Checkpoint de um treino por época em `checkpoints/<motor>_<versão>_<params>.npz`:
+    os parâmetros atuais (para retomar), os da melhor época e o estado da parada antecipada.
+    Só é reaproveitado pelo mesmo motor, com os mesmos dados e parâmetros.
+    """
+
+    def __init__(self, name: str, fingerprint: str, params: dict, checkpoint_dir: str = CHECKPOINT_DIR):
+        self.path = os.path.join(checkpoint_dir, f"{name}_{fingerprint}_{params_key(params)}.npz")
+
+    def save(self, epoch: int, current: dict, best: dict, stopper: EarlyStopping):
+        """Grava o estado após `epoch` épocas concluídas (escrita atômica)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        arrays = {f"current_{k}": v for k, v in current.items()}
+        arrays.update({f"best_{k}": v for k, v in best.items()})
+        meta = json.dumps({"epoch": epoch, "stopper": stopper.state()})
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(meta), **arrays)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Retorna (épocas concluídas, parâmetros atuais, melhores parâmetros, estado da parada) ou None."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                current = {k[len("current_"):]: data[k] for k in data.files if k.startswith("current_")}
+                best = {k[len("best_"):]: data[k] for k in data.files if k.startswith("best_")}
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta["epoch"], current, best, meta["stopper"]
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
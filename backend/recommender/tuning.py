@@ -0,0 +1,363 @@
+"""
+tuning.py
+---------
+Busca de hiperparâmetros do SVD++ em paralelo (todos os núcleos, via joblib),
+com estratégias grid, random e successive halving sob um orçamento de tempo.
+O resultado de cada fold é salvo em cache, indexado pela impressão digital
+dos dados e pelos parâmetros, para que uma busca interrompida possa ser retomada.
+Um histórico das buscas permite partir do melhor resultado anterior (busca na
+vizinhança) ou dispensar a busca quando os dados mudaram pouco.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import numpy as np
+from datetime import datetime
+from joblib import Parallel, delayed, cpu_count
+from sklearn.model_selection import ParameterGrid, ParameterSampler
+from surprise import Dataset, Reader, SVDpp, accuracy
+from surprise.model_selection import KFold
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models'))
+CACHE_DIR = os.path.join(MODELS_DIR, 'tuning_cache')
+HISTORY_FILE = os.path.join(MODELS_DIR, 'tuning_history.json')
+PARAMS_FILE = os.path.join(MODELS_DIR, 'best_svd_params.json')
+
+# Mesma grade usada originalmente com o GridSearchCV (36 combinações)
+DEFAULT_PARAM_GRID = {
+    'n_factors': [50, 80, 100],      # Testar mais fatores latentes
+    'n_epochs': [20, 30],           # Mais iterações para convergência
+    'lr_all': [0.005, 0.01],      # Taxas de aprendizado variadas
+    'reg_all': [0.02, 0.05, 0.1]  # Termos de regularização para evitar overfitting
+}
+
+# Usados se o orçamento acabar antes de qualquer combinação ser avaliada
+FALLBACK_PARAMS = {'n_factors': 50, 'n_epochs': 20, 'lr_all': 0.005, 'reg_all': 0.02}
+
+# Configuração padrão (sobrescrita por variáveis de ambiente)
+TUNING_STRATEGY = os.getenv("RECOMMENDER_TUNING_STRATEGY", "grid")
+TUNING_BUDGET_SECONDS = float(os.getenv("RECOMMENDER_TUNING_BUDGET", "0")) or None
+TUNING_N_JOBS = int(os.getenv("RECOMMENDER_TUNING_JOBS", "-1"))
+# Variação relativa no nº de avaliações abaixo da qual a busca é dispensada
+RETUNE_DRIFT_THRESHOLD = float(os.getenv("RECOMMENDER_RETUNE_DRIFT", "0.1"))
+HISTORY_MAX_ENTRIES = 50
+
+STRATEGIES = ("grid", "random", "halving")
+
+
+def params_key(params: dict) -> str:
+    """Hash estável de um conjunto de parâmetros (ordem das chaves não importa)."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class FoldCache:
+    """
+    Cache em disco dos resultados por (parâmetros, fold), em
+    `tuning_cache/<fingerprint>_cv<k>_rs<seed>/<params>_fold<i>.json`.
+    """
+
+    def __init__(self, fingerprint: str, cv: int, random_state: int, cache_dir: str = CACHE_DIR):
+        self.dir = os.path.join(cache_dir, f"{fingerprint}_cv{cv}_rs{random_state}")
+
+    def _path(self, params: dict, fold: int) -> str:
+        return os.path.join(self.dir, f"{params_key(params)}_fold{fold}.json")
+
+    def get(self, params: dict, fold: int):
+        path = self._path(params, fold)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, params: dict, fold: int, result: dict):
+        os.makedirs(self.dir, exist_ok=True)
+        path = self._path(params, fold)
+        with open(path + ".tmp", 'w') as f:
+            json.dump({"params": params, "fold": fold, **result}, f)
+        os.replace(path + ".tmp", path)
+
+
+def _evaluate_fold(params: dict, trainset, testset) -> dict:
+    """Treina o SVD++ em um fold e mede RMSE/MAE no conjunto de teste (executa nos workers)."""
+    start = time.perf_counter()
+    algo = SVDpp(**params, random_state=42)
+    algo.fit(trainset)
+    predictions = algo.test(testset)
+    return {
+        "rmse": accuracy.rmse(predictions, verbose=False),
+        "mae": accuracy.mae(predictions, verbose=False),
+        "fit_time": time.perf_counter() - start,
+    }
+
+
+class _Search:
+    """Executa avaliações (parâmetros × folds) em paralelo, respeitando cache e orçamento."""
+
+    def __init__(self, folds: list, cache: FoldCache, n_jobs: int, deadline):
+        self.folds = folds
+        self.cache = cache
+        self.n_jobs = n_jobs if n_jobs > 0 else cpu_count()
+        self.deadline = deadline
+        self.results = {}  # params_key -> {"params", "folds": {i: resultado}}
+        self.n_fits = 0
+        self.exhausted = False
+
+    def _record(self, params: dict, fold: int, result: dict):
+        entry = self.results.setdefault(params_key(params), {"params": params, "folds": {}})
+        entry["folds"][fold] = result
+
+    def run(self, candidates: list):
+        """Avalia todos os folds das combinações candidatas (usando o cache quando possível)."""
+        pending = []
+        for params in candidates:
+            for fold in range(len(self.folds)):
+                cached = self.cache.get(params, fold)
+                if cached is not None:
+                    self._record(params, fold, cached)
+                else:
+                    pending.append((params, fold))
+
+        # Processa em ondas para checar o orçamento de tempo entre elas
+        wave_size = self.n_jobs * 2
+        with Parallel(n_jobs=self.n_jobs) as parallel:
+            for start in range(0, len(pending), wave_size):
+                if self.deadline is not None and time.monotonic() >= self.deadline:
+                    self.exhausted = True
+                    break
+                wave = pending[start:start + wave_size]
+                outputs = parallel(
+                    delayed(_evaluate_fold)(params, *self.folds[fold]) for params, fold in wave
+                )
+                for (params, fold), result in zip(wave, outputs):
+                    self.cache.put(params, fold, result)
+                    self._record(params, fold, result)
+                    self.n_fits += 1
+
+    def scores(self, candidates: list, complete_only: bool = True) -> list:
+        """Retorna [(rmse médio, mae médio, params)] ordenado pelo RMSE."""
+        ranked = []
+        for params in candidates:
+            entry = self.results.get(params_key(params))
+            if entry is None or not entry["folds"]:
+                continue
+            if complete_only and len(entry["folds"]) < len(self.folds):
+                continue
+            folds = entry["folds"].values()
+            ranked.append((float(np.mean([f["rmse"] for f in folds])), float(np.mean([f["mae"] for f in folds])), params))
+        ranked.sort(key=lambda x: x[0])
+        return ranked
+
+
+def _halving_candidates(search: _Search, param_grid: dict, eta: int) -> list:
+    """
+    Successive halving usando o número de épocas como recurso: todas as combinações
+    começam com poucas épocas e apenas a melhor fração 1/eta avança para a próxima rodada.
+    """
+    max_epochs = max(param_grid.get('n_epochs', [FALLBACK_PARAMS['n_epochs']]))
+    base_grid = {k: v for k, v in param_grid.items() if k != 'n_epochs'}
+    candidates = list(ParameterGrid(base_grid))
+
+    n_rungs = max(1, int(np.floor(np.log(len(candidates)) / np.log(eta))) + 1)
+    rung_epochs = [max(1, int(round(max_epochs / eta ** (n_rungs - 1 - r)))) for r in range(n_rungs)]
+
+    survivors = candidates
+    evaluated = []
+    for r, epochs in enumerate(rung_epochs):
+        rung = [{**params, 'n_epochs': epochs} for params in survivors]
+        search.run(rung)
+        evaluated = rung
+        ranked = search.scores(rung)
+        if search.exhausted or r == n_rungs - 1 or not ranked:
+            break
+        keep = max(1, len(ranked) // eta)
+        survivors = [{k: v for k, v in params.items() if k != 'n_epochs'} for _, _, params in ranked[:keep]]
+    return evaluated
+
+
+def tune_svdpp(ratings_df, fingerprint: str, param_grid: dict = None, strategy: str = None,
+               budget_seconds: float = None, n_iter: int = 10, cv: int = 3, n_jobs: int = None,
+               eta: int = 3, random_state: int = 42, cache_dir: str = CACHE_DIR, candidates: list = None) -> dict:
+    """
+    Busca os melhores hiperparâmetros do SVD++ por validação cruzada.
+
+    Args:
+        ratings_df: avaliações (CPF_CLIENTE, ID_PRODUTO, RATING_DESCRICAO).
+        fingerprint: impressão digital dos dados (chave do cache de folds).
+        param_grid: espaço de busca (padrão: DEFAULT_PARAM_GRID).
+        strategy: "grid", "random" (n_iter combinações) ou "halving".
+        budget_seconds: orçamento de tempo; ao esgotar, retorna o melhor encontrado até então.
+        n_jobs: workers em paralelo (-1 = todos os núcleos).
+        candidates: lista explícita de combinações (substitui a grade na estratégia "grid").
+
+    Returns:
+        Dicionário com best_params, best_score (rmse/mae), nº de treinos e se a busca foi completa.
+    """
+    param_grid = param_grid or DEFAULT_PARAM_GRID
+    strategy = strategy or TUNING_STRATEGY
+    budget_seconds = budget_seconds if budget_seconds is not None else TUNING_BUDGET_SECONDS
+    n_jobs = n_jobs if n_jobs is not None else TUNING_N_JOBS
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Estratégia de busca inválida: {strategy}. Use uma de {STRATEGIES}.")
+
+    start = time.monotonic()
+    deadline = start + budget_seconds if budget_seconds else None
+
+    reader = Reader(rating_scale=(1, 5))
+    data = Dataset.load_from_df(ratings_df[['CPF_CLIENTE', 'ID_PRODUTO', 'RATING_DESCRICAO']], reader)
+    folds = list(KFold(n_splits=cv, random_state=random_state, shuffle=True).split(data))
+
+    search = _Search(folds, FoldCache(fingerprint, cv, random_state, cache_dir), n_jobs, deadline)
+
+    if strategy == "grid":
+        candidates = candidates or list(ParameterGrid(param_grid))
+        search.run(candidates)
+    elif strategy == "random":
+        grid_size = len(ParameterGrid(param_grid))
+        candidates = list(ParameterSampler(param_grid, n_iter=min(n_iter, grid_size), random_state=random_state))
+        search.run(candidates)
+    else:
+        candidates = _halving_candidates(search, param_grid, eta)
+
+    ranked = search.scores(candidates) or search.scores(candidates, complete_only=False)
+    if ranked:
+        best_rmse, best_mae, best_params = ranked[0]
+    else:
+        best_rmse, best_mae, best_params = None, None, dict(FALLBACK_PARAMS)
+
+    return {
+        "best_params": best_params,
+        "best_score": {"rmse": best_rmse, "mae": best_mae},
+        "strategy": strategy,
+        "n_candidates": len(candidates),
+        "n_fits": search.n_fits,
+        "completed": not search.exhausted,
+        "elapsed_seconds": round(time.monotonic() - start, 3),
+    }
+
+
+def load_history(path: str = HISTORY_FILE) -> list:
+    """Lê o histórico de buscas (lista de entradas, da mais antiga para a mais recente)."""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def record_tuning(result: dict, fingerprint: str, n_ratings: int, path: str = HISTORY_FILE) -> dict:
+    """Acrescenta uma busca ao histórico e atualiza `best_svd_params.json`."""
+    entry = {
+        "fingerprint": fingerprint,
+        "n_ratings": int(n_ratings),
+        "params": result["best_params"],
+        "score": result.get("best_score"),
+        "strategy": result.get("strategy"),
+        "completed": result.get("completed", True),
+        "tuned_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    history = (load_history(path) + [entry])[-HISTORY_MAX_ENTRIES:]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(history, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+    params_file = os.path.join(os.path.dirname(path), os.path.basename(PARAMS_FILE))
+    with open(params_file, 'w') as f:
+        json.dump(entry["params"], f)
+    return entry
+
+
+def neighborhood_grid(params: dict) -> list:
+    """
+    Vizinhança estreita de um conjunto de parâmetros: o próprio ponto e a variação
+    de um parâmetro por vez, um passo para cima e um para baixo.
+    """
+    steps = {
+        'n_factors': lambda v: [max(5, int(round(v * 0.8))), int(round(v * 1.25))],
+        'n_epochs': lambda v: [max(5, v - 10), v + 10],
+        'lr_all': lambda v: [v / 2, v * 2],
+        'reg_all': lambda v: [v / 2, v * 2],
+    }
+    candidates = [dict(params)]
+    for name, step in steps.items():
+        if name not in params:
+            continue
+        for value in step(params[name]):
+            if value != params[name]:
+                candidates.append({**params, name: value})
+
+    unique = {params_key(c): c for c in candidates}
+    return list(unique.values())
+
+
+def _drift(n_ratings: int, previous: dict) -> float:
+    """Variação relativa do nº de avaliações desde a última busca."""
+    return abs(n_ratings - previous["n_ratings"]) / max(previous["n_ratings"], 1)
+
+
+def select_params(ratings_df, fingerprint: str, drift_threshold: float = None,
+                  history_path: str = HISTORY_FILE, **search_kwargs):
+    """
+    Escolhe os hiperparâmetros para os dados atuais usando o histórico de buscas:
+    - mesma impressão digital ou variação abaixo de `drift_threshold`: reutiliza o melhor anterior;
+    - variação maior: busca apenas na vizinhança do melhor anterior (warm start);
+    - sem histórico: busca completa.
+
+    Returns:
+        (params, origem) onde origem é "history", "warm_start" ou "full_search".
+    """
+    drift_threshold = RETUNE_DRIFT_THRESHOLD if drift_threshold is None else drift_threshold
+    n_ratings = len(ratings_df)
+    history = load_history(history_path)
+
+    # Migração: parâmetros salvos antes do histórico existir viram a primeira entrada
+    params_file = os.path.join(os.path.dirname(history_path), os.path.basename(PARAMS_FILE))
+    if not history and os.path.exists(params_file):
+        with open(params_file, 'r') as f:
+            legacy = {"best_params": json.load(f), "strategy": "legacy"}
+        history = [record_tuning(legacy, fingerprint, n_ratings, history_path)]
+
+    previous = history[-1] if history else None
+    if previous is not None:
+        if previous["fingerprint"] == fingerprint or _drift(n_ratings, previous) < drift_threshold:
+            return dict(previous["params"]), "history"
+        result = tune_svdpp(ratings_df, fingerprint, strategy="grid",
+                            candidates=neighborhood_grid(previous["params"]), **search_kwargs)
+        source = "warm_start"
+    else:
+        result = tune_svdpp(ratings_df, fingerprint, **search_kwargs)
+        source = "full_search"
+
+    record_tuning(result, fingerprint, n_ratings, history_path)
+    return result["best_params"], source
+
+
+def main():
+    """
+    Executa uma busca completa pela linha de comando e registra o resultado no histórico.
+    Uso: python -m backend.recommender.tuning [grid|random|halving] [orcamento_em_segundos]
+    """
+    from backend.dataset import loader
+
+    strategy = sys.argv[1] if len(sys.argv) > 1 else TUNING_STRATEGY
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else TUNING_BUDGET_SECONDS
+
+    ratings_df = loader.load_ratings()
+    ratings_df['RATING_DESCRICAO'] = ratings_df['RATING_DESCRICAO'].astype(float)
+    fingerprint = loader.ratings_fingerprint(ratings_df)
+    result = tune_svdpp(ratings_df, fingerprint, strategy=strategy, budget_seconds=budget)
+    record_tuning(result, fingerprint, len(ratings_df))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
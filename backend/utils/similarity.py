@@ -1 +1,104 @@
-# Helper functions for cosine, Pearson, etc.
\ No newline at end of file
+"""
+similarity.py
+-------------
+Kernel de vizinhos mais próximos por similaridade de cosseno para matrizes de
+linhas densas (NumPy) ou esparsas (SciPy). As similaridades são calculadas em
+float32, um bloco de linhas por vez contra todas as linhas, e de cada bloco só
+sobram os K maiores valores: a memória fica em O(bloco × n), nunca O(n²).
+"""
+
+import os
+import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import ThreadPoolExecutor
+
+# Limite de memória (bytes) de um bloco denso de similaridades quando o tamanho do bloco não é informado
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def normalize_rows(matrix):
+    """Cópia em float32 com linhas de norma 1 (linhas nulas continuam nulas)."""
+    if sp.issparse(matrix):
+        matrix = sp.csr_matrix(matrix, dtype=np.float32)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sp.csr_matrix(sp.diags(1.0 / norms, dtype=np.float32) @ matrix)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def default_block_size(n_rows: int, block_bytes: int = None, n_jobs: int = 1) -> int:
+    """
+    Linhas por bloco para que os blocos de similaridades (linhas × n_rows, float32)
+    processados ao mesmo tempo por `n_jobs` threads caibam juntos no limite de memória.
+    """
+    block_bytes = block_bytes or BLOCK_BYTES
+    return max(1, block_bytes // (4 * max(n_rows, 1) * max(n_jobs, 1)))
+
+
+def top_k_cosine(matrix, k: int, block_size: int = None, n_jobs: int = 1, exclude_self: bool = True,
+                 min_score: float = None, normalized: bool = False) -> tuple:
+    """
+    Top-K vizinhos de cada linha de `matrix` por cosseno.
+
+    Args:
+        matrix: matriz (n × d) densa ou esparsa.
+        k: vizinhos por linha.
+        block_size: linhas comparadas por vez (padrão: o que cabe em BLOCK_BYTES somando as threads).
+        n_jobs: blocos processados em paralelo por threads (None ou ≤ 0 = nº de CPUs);
+            com block_size explícito, a memória é n_jobs × bloco × n.
+        exclude_self: ignora a própria linha.
+        min_score: descarta vizinhos com similaridade ≤ min_score (ex.: 0 para manter só os parecidos).
+        normalized: indica que as linhas já têm norma 1 (evita a cópia normalizada).
+
+    Returns:
+        (indptr, indices, scores) em formato CSR: os vizinhos da linha r estão em
+        indices[indptr[r]:indptr[r + 1]], em ordem decrescente de similaridade.
+    """
+    if k < 0:
+        raise ValueError("k deve ser maior ou igual a zero.")
+    vectors = matrix if normalized else normalize_rows(matrix)
+    if sp.issparse(vectors):
+        vectors = sp.csr_matrix(vectors, dtype=np.float32)
+    else:
+        vectors = np.asarray(vectors, dtype=np.float32)
+    n = vectors.shape[0]
+    k = min(k, n - 1 if exclude_self else n)
+    if k <= 0:
+        return np.zeros(n + 1, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+    # Na entrada esparsa o produto é esparsa × esparsa: nenhum bloco é densificado nas d colunas
+    # de features (d ≫ n em n-gramas de caracteres); só o resultado (bloco × n) vira denso
+    transposed = vectors.T.tocsr() if sp.issparse(vectors) else np.ascontiguousarray(vectors.T)
+    n_jobs = n_jobs if n_jobs and n_jobs > 0 else (os.cpu_count() or 1)
+    block_size = block_size or default_block_size(n, n_jobs=n_jobs)
+    indices = np.empty((n, k), dtype=np.int32)
+    scores = np.empty((n, k), dtype=np.float32)
+
+    def solve(start: int):
+        stop = min(start + block_size, n)
+        if sp.issparse(transposed):
+            sims = (vectors[start:stop] @ transposed).toarray().astype(np.float32, copy=False)
+        else:
+            sims = vectors[start:stop] @ transposed
+        if exclude_self:
+            sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+
+    starts = range(0, n, block_size)
+    if n_jobs > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            list(pool.map(solve, starts))
+    else:
+        for start in starts:
+            solve(start)
+
+    keep = np.isfinite(scores) if min_score is None else scores > min_score
+    indptr = np.concatenate(([0], np.cumsum(keep.sum(axis=1)))).astype(np.int64)
+    return indptr, indices[keep], scores[keep]
@@ -0,0 +1,3 @@
+"""
+Benchmarks de escala do serviço de recomendação (ver `python -m benchmarks.run --help`).
+"""
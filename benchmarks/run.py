@@ -0,0 +1,202 @@
+"""
+run.py
+------
+Suíte de benchmarks de escala. Para cada escala sintética (1k/10k/100k clientes)
+mede o custo de `loader.load_ratings`, o tempo e o pico de memória de `train()`,
+a latência p50/p99 de `recommend_items` por motor e, opcionalmente, a vazão de
+`/recommend` através de um uvicorn local. O resultado é gravado em JSON para
+comparar execuções.
+
+Uso:
+    python -m benchmarks.run --scales 1k,10k --engines als,svdpp [--api]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import subprocess
+import threading
+import http.client
+from urllib.parse import urlencode
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import SCALES, ensure_dataset
+from benchmarks.steps import latency_summary
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def run_step(step: str, dataset: dict, timeout: float, **options) -> dict:
+    """Executa uma etapa em um processo separado. Estouro de tempo ou falha (ex.: falta de memória) viram status."""
+    command = [sys.executable, "-m", "benchmarks.steps", step, "--ratings", dataset["ratings_path"]]
+    for name, value in options.items():
+        command += [f"--{name}", str(value)]
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout", "timeout_seconds": timeout}
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        return {"status": "error", "returncode": proc.returncode, "wall_seconds": wall,
+                "stderr": proc.stderr.strip().splitlines()[-5:]}
+    return {"status": "ok", "wall_seconds": wall, **json.loads(proc.stdout.strip().splitlines()[-1])}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _peak_rss_of(pid: int):
+    """Pico de RSS (VmHWM, MB) de outro processo; None fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _get(conn: http.client.HTTPConnection, path: str) -> tuple:
+    conn.request("GET", path)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def measure_api(dataset: dict, engine: str, duration: float, concurrency: int, timeout: float) -> dict:
+    """Sobe a API sobre a base e dispara `/recommend/{cpf}` com `concurrency` clientes por `duration` segundos."""
+    port = _free_port()
+    command = [sys.executable, "-m", "benchmarks.serve", "--ratings", dataset["ratings_path"],
+               "--engine", engine, "--port", str(port)]
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        # Espera o modelo ficar pronto (inclui o treino dentro do servidor)
+        start = time.perf_counter()
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                return {"status": "error", "returncode": server.returncode,
+                        "stderr": server.stderr.read().strip().splitlines()[-5:]}
+            try:
+                status, body = _get(http.client.HTTPConnection("127.0.0.1", port, timeout=1), "/model/status")
+                if status == 200 and json.loads(body).get("status") == "ready":
+                    break
+            except (OSError, http.client.HTTPException, ValueError):
+                pass
+            time.sleep(0.5)
+        else:
+            return {"status": "timeout", "timeout_seconds": timeout}
+        startup_seconds = time.perf_counter() - start
+
+        cpfs = pd.read_csv(dataset["ratings_path"], usecols=["CPF_CLIENTE"], dtype=str)["CPF_CLIENTE"].unique()
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def client(seed: int):
+            rng = np.random.default_rng(seed)
+            local, failed = [], 0
+            query = urlencode({"n_items": 10, "include_accuracy": "false"})
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30) # conexão persistente por cliente
+            while time.perf_counter() < deadline:
+                cpf = cpfs[rng.integers(len(cpfs))]
+                t0 = time.perf_counter()
+                try:
+                    ok = _get(conn, f"/recommend/{cpf}?{query}")[0] == 200
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                    ok = False
+                local.append(time.perf_counter() - t0)
+                failed += not ok
+            conn.close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        threads = [threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            "status": "ok",
+            "startup_seconds": startup_seconds,
+            "concurrency": concurrency,
+            "requests": len(latencies),
+            "errors": errors[0],
+            "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "latency": latency_summary(latencies),
+            "server_peak_rss_mb": _peak_rss_of(server.pid),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de escala do serviço de recomendação.")
+    parser.add_argument("--scales", default="1k,10k", help=f"Escalas separadas por vírgula ({', '.join(SCALES)}).")
+    parser.add_argument("--engines", default="als,svdpp", help="Motores separados por vírgula.")
+    parser.add_argument("--queries", type=int, default=1000, help="Consultas de recommend_items por motor.")
+    parser.add_argument("--timeout", type=float, default=1800, help="Limite (s) de cada etapa; estourar vira 'timeout'.")
+    parser.add_argument("--api", action="store_true", help="Mede também a vazão de /recommend num uvicorn local.")
+    parser.add_argument("--api-duration", type=float, default=10.0, help="Duração (s) da carga na API.")
+    parser.add_argument("--api-concurrency", type=int, default=8, help="Clientes simultâneos na API.")
+    parser.add_argument("--output", default=None, help="Arquivo JSON do resultado (padrão: benchmarks/results/).")
+    args = parser.parse_args()
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "scales": {},
+    }
+
+    for scale in scales:
+        print(f"📦 Escala {scale}: preparando a base sintética...")
+        dataset = ensure_dataset(scale)
+        result = {"dataset": dataset, "load_ratings": run_step("load", dataset, args.timeout), "engines": {}}
+        print(f"   load_ratings: {result['load_ratings'].get('seconds', result['load_ratings']['status'])}")
+
+        for engine in engines:
+            print(f"   ⏱️  {engine}: treino e latência...")
+            engine_result = {"train": run_step("train", dataset, args.timeout, engine=engine, queries=args.queries)}
+            if args.api and engine_result["train"]["status"] == "ok":
+                print(f"   🌐 {engine}: vazão de /recommend...")
+                engine_result["api"] = measure_api(dataset, engine, args.api_duration, args.api_concurrency, args.timeout)
+            result["engines"][engine] = engine_result
+            train = engine_result["train"]
+            if train["status"] == "ok":
+                print(f"      train {train['train_seconds']:.2f}s, pico {train['train_peak_rss_mb']:.0f} MB, "
+                      f"p50 {train['recommend_items']['p50_ms']:.2f} ms, p99 {train['recommend_items']['p99_ms']:.2f} ms")
+            else:
+                print(f"      ⚠️  {train['status']}")
+        report["scales"][scale] = result
+
+    path = args.output or os.path.join(RESULTS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Resultado salvo em {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+serve.py
+--------
+Sobe a API real (`backend.main:app`) num uvicorn local servindo um modelo treinado
+sobre a base sintética, para medir a vazão de `/recommend`. O modelo é treinado
+com parâmetros fixos e publicado diretamente no registro: nada é lido de
+`data/derived` nem gravado em `data/models`.
+"""
+
+import os
+import argparse
+
+# Sem cache persistente de acurácia: o benchmark não deve tocar nos arquivos do serviço real
+os.environ.setdefault("RECOMMENDER_ACCURACY_CACHE_SIZE", "0")
+
+import uvicorn
+from backend import main as api
+from backend.dataset import loader
+from benchmarks.steps import build_model, use_dataset
+
+
+class StaticRetrainer:
+    """Substitui o `BackgroundRetrainer` da API: publica um modelo já treinado e não observa arquivos."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def refresh(self, force: bool = False) -> bool:
+        api.registry.swap(self.model, source="benchmark")
+        return True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API de recomendação sobre uma base sintética (benchmark).")
+    parser.add_argument("--ratings", required=True, help="Caminho do ratings.csv da base sintética.")
+    parser.add_argument("--engine", default="svdpp")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--top-n-table", type=int, default=api.TOP_N_TABLE_SIZE)
+    args = parser.parse_args()
+
+    use_dataset(args.ratings)
+    model = build_model(args.engine, loader.load_ratings())
+    model.top_n_size = args.top_n_table
+    model.train() # também monta a tabela top-N, se ativada
+
+    api.retrainer = StaticRetrainer(model)
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
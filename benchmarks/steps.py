@@ -0,0 +1,125 @@
+"""
+steps.py
+--------
+Etapas medidas pelos benchmarks. Cada etapa roda em um processo próprio
+(`python -m benchmarks.steps <etapa> ...`) para que o pico de memória (RSS) e os
+tempos não se misturem entre etapas, e imprime o resultado como uma linha JSON.
+"""
+
+import sys
+import json
+import time
+import argparse
+import resource
+import numpy as np
+from backend.dataset import loader
+from backend.recommender import tuning
+from backend.recommender.engines import get_engine
+
+
+def peak_rss_mb() -> float:
+    """Pico de memória residente do processo atual (MB); no Linux `ru_maxrss` vem em KB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def use_dataset(ratings_path: str):
+    """Aponta o loader para o `ratings.csv` da base sintética (apenas neste processo)."""
+    loader.RATINGS = ratings_path
+
+
+def benchmark_params(engine: str) -> dict:
+    """Hiperparâmetros fixos por motor: o benchmark mede o treino, não a busca de parâmetros."""
+    return dict(getattr(get_engine(engine), "DEFAULT_PARAMS", tuning.FALLBACK_PARAMS))
+
+
+def build_model(engine: str, ratings_df, receipts_path: str = None):
+    """Cria o recomendador do motor com os parâmetros fixos do benchmark (ainda não treinado)."""
+    model = get_engine(engine)(ratings_df)
+    model.best_params = benchmark_params(engine)
+    if hasattr(model, "receipts_path"):
+        model.receipts_path = receipts_path or "" # a base sintética não tem notas fiscais
+    return model
+
+
+def latency_summary(seconds: list) -> dict:
+    """Percentis de latência em milissegundos."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if len(ms) == 0:
+        return {"n": 0}
+    return {
+        "n": int(len(ms)),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def step_load(args) -> dict:
+    """Custo de `loader.load_ratings` (leitura e validação do CSV)."""
+    use_dataset(args.ratings)
+    start = time.perf_counter()
+    df = loader.load_ratings()
+    return {"seconds": time.perf_counter() - start, "rows": int(len(df)), "peak_rss_mb": peak_rss_mb()}
+
+
+def step_train(args) -> dict:
+    """Tempo e memória de `train()` seguidos da latência de `recommend_items` por cliente."""
+    use_dataset(args.ratings)
+    start = time.perf_counter()
+    ratings_df = loader.load_ratings()
+    load_seconds = time.perf_counter() - start
+
+    model = build_model(args.engine, ratings_df)
+    start = time.perf_counter()
+    model.train()
+    train_seconds = time.perf_counter() - start
+    train_rss = peak_rss_mb()
+
+    # Consultas: clientes conhecidos e uma fração de CPFs desconhecidos (cold-start)
+    rng = np.random.default_rng(42)
+    known = rng.choice(model.index.user_ids, args.queries)
+    cpfs = np.where(rng.random(args.queries) < 0.1, "00000000000", known)
+    for cpf in cpfs[:10]:
+        model.recommend_items(cpf, args.n)  # aquecimento
+    latencies = []
+    for cpf in cpfs:
+        start = time.perf_counter()
+        model.recommend_items(cpf, args.n)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model.recommend_batch(list(known[:1000]), args.n)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "engine": args.engine,
+        "params": model.best_params,
+        "top_n_table": model.top_n_size,
+        "load_seconds": load_seconds,
+        "train_seconds": train_seconds,
+        "train_peak_rss_mb": train_rss,
+        "recommend_items": latency_summary(latencies),
+        "recommend_batch_1000_seconds": batch_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+STEPS = {"load": step_load, "train": step_train}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Executa uma etapa de benchmark e imprime o resultado em JSON.")
+    parser.add_argument("step", choices=tuple(STEPS))
+    parser.add_argument("--ratings", required=True, help="Caminho do ratings.csv da base sintética.")
+    parser.add_argument("--engine", default="svdpp")
+    parser.add_argument("--queries", type=int, default=1000, help="Consultas de recommend_items medidas.")
+    parser.add_argument("--n", type=int, default=10, help="Itens por recomendação.")
+    args = parser.parse_args()
+    print(json.dumps(STEPS[args.step](args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+synthetic.py
+------------
+Geração de bases sintéticas nos mesmos esquemas de `data/derived/products.csv` e
+`data/derived/ratings.csv`, em várias escalas. A atividade dos clientes e a
+popularidade dos produtos seguem caudas longas e as notas vêm de um modelo de
+fatores latentes, para que treino e ranking se comportem como nos dados reais.
+"""
+
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Escalas disponíveis: clientes, produtos e avaliações
+SCALES = {
+    "1k": {"n_users": 1_000, "n_products": 1_000, "n_ratings": 20_000},
+    "10k": {"n_users": 10_000, "n_products": 50_000, "n_ratings": 500_000},
+    "100k": {"n_users": 100_000, "n_products": 50_000, "n_ratings": 5_000_000},
+}
+
+CATEGORIAS = ["HIGIENE", "CAFES E INFUSOES", "LATICINIOS", "BEBIDAS", "LIMPEZA", "MERCEARIA",
+              "HORTIFRUTI", "CARNES", "PADARIA", "CONGELADOS", "BISCOITOS", "MATINAIS"]
+MARCAS = ["GENERICA", "DOVE", "PILAO", "NESTLE", "YPE", "OMO", "SADIA", "PERDIGAO", "ITAMBE",
+          "PIRACANJUBA", "COCA COLA", "GUARANA BAIANO", "TIO JOAO", "CAMIL", "QUALY", "BAUDUCCO"]
+TIPOS = ["SABONETE", "CAFE", "LEITE", "REFRIGERANTE", "DETERGENTE", "ARROZ", "FEIJAO", "BANANA",
+         "FRANGO", "PAO", "PIZZA", "BISCOITO", "CEREAL", "IOGURTE", "SHAMPOO", "SUCO"]
+MEDIDAS = ["90G", "200G", "500G", "1KG", "2KG", "350ML", "1L", "2L", "UN"]
+
+
+def generate_products(n_products: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Catálogo com ID, CATEGORIA, MARCA e DESCRICAO (tipo + marca + variação + medida)."""
+    tipo = rng.integers(0, len(TIPOS), n_products)
+    marca = rng.integers(0, len(MARCAS), n_products)
+    medida = rng.integers(0, len(MEDIDAS), n_products)
+    variacao = rng.integers(0, max(n_products // 50, 1), n_products)
+    descricao = (pd.Series(np.array(TIPOS)[tipo]) + " " + pd.Series(np.array(MARCAS)[marca])
+                 + " V" + pd.Series(variacao).astype(str) + " " + pd.Series(np.array(MEDIDAS)[medida]))
+    return pd.DataFrame({
+        "ID": np.arange(1, n_products + 1).astype(str),
+        "CATEGORIA": np.array(CATEGORIAS)[tipo % len(CATEGORIAS)],
+        "MARCA": np.array(MARCAS)[marca],
+        "DESCRICAO": descricao,
+    })
+
+
+def generate_ratings(n_users: int, n_products: int, n_ratings: int, rng: np.random.Generator,
+                     n_factors: int = 8) -> pd.DataFrame:
+    """Avaliações únicas (CPF, produto) com notas de 1 a 5 geradas por fatores latentes."""
+    n_ratings = min(n_ratings, n_users * n_products)
+    cpfs = (10_000_000_000 + rng.choice(89_999_999_999, n_users, replace=False)).astype(str)
+
+    # Atividade dos clientes (log-normal) e popularidade dos produtos (Zipf)
+    user_weights = rng.lognormal(0.0, 1.0, n_users)
+    item_weights = 1.0 / np.arange(1, n_products + 1) ** 0.8
+    item_order = rng.permutation(n_products)
+
+    keys = np.empty(0, dtype=np.int64)
+    while len(keys) < n_ratings:
+        n_draw = int((n_ratings - len(keys)) * 1.2) + 1000
+        users = rng.choice(n_users, n_draw, p=user_weights / user_weights.sum())
+        items = item_order[rng.choice(n_products, n_draw, p=item_weights / item_weights.sum())]
+        keys = np.unique(np.concatenate([keys, users.astype(np.int64) * n_products + items]))
+    keys = rng.permutation(keys)[:n_ratings]
+    users, items = keys // n_products, keys % n_products
+
+    # Nota = média + vieses + afinidade latente + ruído, arredondada para a escala 1-5
+    pu = rng.normal(0, 0.5, (n_users, n_factors))
+    qi = rng.normal(0, 0.5, (n_products, n_factors))
+    bu, bi = rng.normal(0, 0.4, n_users), rng.normal(0, 0.4, n_products)
+    base = 3.4 + bu[users] + bi[items] + np.einsum('ij,ij->i', pu[users], qi[items])
+
+    def scale(values):
+        return np.clip(np.rint(values + rng.normal(0, 0.5, len(values))), 1, 5).astype(np.int64)
+
+    secondary = rng.random(n_ratings) < 0.5  # notas de categoria/marca são opcionais
+
+    def optional(values):
+        column = pd.Series(values, dtype="Int64")
+        column[~secondary] = pd.NA
+        return column
+
+    return pd.DataFrame({
+        "CPF_CLIENTE": cpfs[users],
+        "ID_PRODUTO": (items + 1).astype(str),
+        "RATING_DESCRICAO": scale(base),
+        "RATING_CATEGORIA": optional(scale(base)),
+        "RATING_MARCA": optional(scale(base)),
+    })
+
+
+def ensure_dataset(scale: str, data_dir: str = DATA_DIR, random_state: int = 42) -> dict:
+    """
+    Gera (uma vez) `products.csv` e `ratings.csv` da escala em `<data_dir>/<escala>/`.
+    Retorna a descrição da base (caminhos, tamanhos e tempo de geração).
+    """
+    if scale not in SCALES:
+        raise ValueError(f"Escala inválida: {scale}. Use uma de {tuple(SCALES)}.")
+    spec = SCALES[scale]
+    directory = os.path.join(data_dir, scale)
+    info_path = os.path.join(directory, "dataset.json")
+    if os.path.exists(info_path):
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        if info.get("spec") == spec and info.get("random_state") == random_state:
+            return info
+
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    rng = np.random.default_rng(random_state)
+    products = generate_products(spec["n_products"], rng)
+    ratings = generate_ratings(spec["n_users"], spec["n_products"], spec["n_ratings"], rng)
+    products.to_csv(os.path.join(directory, "products.csv"), index=False)
+    ratings.to_csv(os.path.join(directory, "ratings.csv"), index=False)
+
+    info = {
+        "scale": scale,
+        "spec": spec,
+        "random_state": random_state,
+        "directory": directory,
+        "ratings_path": os.path.join(directory, "ratings.csv"),
+        "products_path": os.path.join(directory, "products.csv"),
+        "n_users": int(ratings["CPF_CLIENTE"].nunique()),
+        "n_products": int(len(products)),
+        "n_ratings": int(len(ratings)),
+        "ratings_file_mb": os.path.getsize(os.path.join(directory, "ratings.csv")) / 2**20,
+        "generation_seconds": time.perf_counter() - start,
+    }
+    with open(info_path, 'w') as f:
+        json.dump(info, f, indent=2)
+    return info
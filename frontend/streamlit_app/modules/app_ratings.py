@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import time
 import requests
 import altair as alt
 from datetime import datetime
@@ -22,6 +23,21 @@ def calculate_age(birthdate_str):
     except (ValueError, TypeError):
         return "N/A"
 
+def fetch_accuracy_report(api_url: str, cpf: str, timeout: float = 120.0, interval: float = 0.5) -> dict:
+    """
+    Enfileira a avaliação de acurácia do cliente e consulta o resultado até concluir.
+    """
+    requests.post(f"{api_url}/evaluate/{cpf}")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = requests.get(f"{api_url}/evaluate/{cpf}").json()
+        if job.get("status") == "done":
+            return job.get("accuracy_report", {})
+        if job.get("status") == "failed":
+            return {"message": f"Falha ao calcular a acurácia: {job.get('error')}"}
+        time.sleep(interval)
+    return {"message": "A avaliação de acurácia ainda está em processamento. Tente novamente em instantes."}
+
 def run():
     st.title("⭐ Avaliação e Recomendação")
     st.markdown("---")
@@ -236,17 +252,17 @@ def run():
                 n_recs = st.slider("Número de recomendações a gerar:", min_value=1, max_value=10, value=5, key="n_recs_slider")
 
                 if st.button("Gerar Recomendações"):
-                    API_URL = "http://127.0.0.1:8000/recommend"
+                    API_URL = "http://127.0.0.1:8000"
                     cpf = selected_client["CPF"]
 
                     with st.spinner("Buscando recomendações personalizadas..."):
                         try:
-                            response = requests.get(f"{API_URL}/{cpf}?n_items={n_recs}")
+                            response = requests.get(f"{API_URL}/recommend/{cpf}?n_items={n_recs}&include_accuracy=false")
 
                             if response.status_code == 200:
                                 data = response.json()
                                 recommended_items_data = data.get("recommendations", [])
-                                accuracy_report = data.get("accuracy_report", {})
+                                accuracy_report = fetch_accuracy_report(API_URL, cpf)
 
                                 # Extrai IDs e scores
                                 recommended_ids = [item['id'] for item in recommended_items_data]
@@ -0,0 +1,41 @@
+import json
+import argparse
+from backend.dataset import loader
+from backend.recommender.engines import ENGINES
+from backend.recommender.evaluation import SCHEMES, run_evaluation, save_report
+
+def main():
+    """
+    Ponto de entrada da avaliação offline de toda a população.
+    Uso: python run_evaluation.py [--engine svdpp] [--scheme holdout|kfold] [--k 10] [--folds 5] [--workers N]
+    """
+    parser = argparse.ArgumentParser(description="Avaliação offline (Precision, Recall, NDCG, RMSE/MAE) de todos os usuários.")
+    parser.add_argument("--engine", default="svdpp", choices=tuple(ENGINES), help="Motor de recomendação avaliado.")
+    parser.add_argument("--scheme", default="holdout", choices=SCHEMES, help="Divisão treino/teste: hold-out por usuário ou k-fold.")
+    parser.add_argument("--k", type=int, default=10, help="Tamanho da lista de recomendações avaliada.")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Fração das avaliações de cada usuário no teste (hold-out).")
+    parser.add_argument("--folds", type=int, default=5, help="Número de folds (k-fold).")
+    parser.add_argument("--workers", type=int, default=None, help="Processos em paralelo (padrão: nº de CPUs).")
+    parser.add_argument("--params", default=None, help="Hiperparâmetros em JSON (padrão: último ajuste ou padrões do motor).")
+    parser.add_argument("--output", default=None, help="Caminho do relatório JSON (padrão: data/reports/).")
+    args = parser.parse_args()
+
+    ratings_df = loader.load_ratings()
+    if ratings_df.empty:
+        print("Nenhuma avaliação encontrada. Execute o simulador antes de avaliar.")
+        return
+
+    report = run_evaluation(
+        ratings_df, engine=args.engine, scheme=args.scheme, k=args.k,
+        test_fraction=args.test_fraction, n_folds=args.folds,
+        params=json.loads(args.params) if args.params else None, n_workers=args.workers,
+    )
+    path = save_report(report, args.output)
+
+    print(f"\n📊 Resultados ({report['n_folds']} fold(s), {report['timings']['total_seconds']:.1f}s):")
+    for name, stats in report["metrics"].items():
+        print(f"  {name:>14}: {stats['mean']:.4f} ± {stats['std']:.4f}")
+    print(f"\nRelatório salvo em {path}")
+
+if __name__ == "__main__":
+    main()
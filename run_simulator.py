@@ -1,5 +1,4 @@
 import sys
-import os
 from backend.dataset.simulator import RatingSimulator
 
 def main():
@@ -20,12 +19,10 @@ def main():
     simulator = RatingSimulator()
     added_count = simulator.generate_new_ratings(num_ratings_to_generate)
 
-    # Se novos dados foram gerados, remove o arquivo de parâmetros para forçar a re-otimização
+    # Não é preciso apagar os parâmetros: o histórico de buscas (data/models/tuning_history.json)
+    # decide no próximo treino se os dados mudaram o suficiente para uma nova busca
     if added_count > 0:
-        params_file = 'data/models/best_svd_params.json'
-        if os.path.exists(params_file):
-            os.remove(params_file)
-            print(f"\nArquivo de parâmetros '{params_file}' removido para forçar a re-otimização do modelo.")
+        print("\nNovas avaliações salvas; os hiperparâmetros serão revisados no próximo treino, se necessário.")
 
     if added_count < num_ratings_to_generate:
         print("\n⚠️  Aviso: O número de avaliações geradas foi menor que o solicitado.")